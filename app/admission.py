@@ -0,0 +1,136 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from app.database import DB_MAX_OVERFLOW, DB_POOL_SIZE
+from app.metrics import (
+    admission_in_flight,
+    admission_queue_depth,
+    admission_queue_wait_seconds,
+    admission_rejected_total,
+)
+
+# Default to one slot per pooled connection: admitted requests then never
+# wait on the pool itself.
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "20"))
+ADMISSION_QUEUE_TIMEOUT_MS = int(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "250"))
+
+VOTE_RATE_LIMIT_PER_SECOND = float(os.getenv("VOTE_RATE_LIMIT_PER_SECOND", "20"))
+VOTE_RATE_LIMIT_BURST = int(os.getenv("VOTE_RATE_LIMIT_BURST", "40"))
+VOTE_RATE_LIMIT_MAX_CLIENTS = int(os.getenv("VOTE_RATE_LIMIT_MAX_CLIENTS", "10000"))
+
+
+class Overloaded(Exception):
+    """Raised when a request can't be admitted; ``retry_after`` is in seconds."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounds how many requests work against the database pool at once.
+
+    Up to ``limit`` requests hold a slot; up to ``max_queue`` more wait
+    at most ``queue_timeout`` seconds for one. Anything beyond that is
+    refused straight away with Overloaded, so a burst is shed in
+    microseconds instead of each request stalling for the pool timeout.
+    """
+
+    def __init__(self, limit: int = ADMISSION_MAX_CONCURRENCY, max_queue: int = ADMISSION_QUEUE_SIZE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_MS / 1000):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(limit)
+        self._in_flight = 0
+        self._waiting = 0
+
+    def _reject(self, reason: str):
+        admission_rejected_total.labels(reason=reason).inc()
+        return Overloaded(reason, retry_after=max(self.queue_timeout, 1))
+
+    async def _wait_for_slot(self) -> None:
+        if self._waiting >= self.max_queue:
+            raise self._reject("queue_full")
+
+        self._waiting += 1
+        admission_queue_depth.set(self._waiting)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except TimeoutError:
+            raise self._reject("queue_timeout")
+        finally:
+            self._waiting -= 1
+            admission_queue_depth.set(self._waiting)
+            admission_queue_wait_seconds.observe(time.perf_counter() - start)
+
+    @asynccontextmanager
+    async def admit(self):
+        if self._slots.locked():
+            await self._wait_for_slot()
+        else:
+            await self._slots.acquire()
+
+        self._in_flight += 1
+        admission_in_flight.set(self._in_flight)
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            admission_in_flight.set(self._in_flight)
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "in_flight": self._in_flight, "waiting": self._waiting, "max_queue": self.max_queue}
+
+
+class RateLimiter:
+    """Token bucket per client: ``rate`` requests a second, bursts up to ``burst``.
+
+    /vote keys it on ``request.client.host``: the voter's address as the
+    ingress saw it, which uvicorn reads from X-Forwarded-For only when the
+    peer is a trusted proxy (FORWARDED_ALLOW_IPS, see app/server.py).
+    Buckets live in an LRU capped at ``max_clients``; dropping the least
+    recently seen client only hands it a fresh (full) bucket. A ``rate``
+    of 0 disables limiting.
+    """
+
+    def __init__(self, rate: float = VOTE_RATE_LIMIT_PER_SECOND, burst: int = VOTE_RATE_LIMIT_BURST,
+                 max_clients: int = VOTE_RATE_LIMIT_MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def acquire(self, client: str) -> float:
+        """Take one token for ``client``; returns 0, or the seconds until a token is due."""
+        if self.rate <= 0:
+            return 0.0
+
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / self.rate
+            admission_rejected_total.labels(reason="rate_limited").inc()
+
+        self._buckets[client] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self) -> None:
+        self._buckets.clear()
+
+
+admission = AdmissionController()
+vote_rate_limiter = RateLimiter()
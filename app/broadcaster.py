@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from typing import Awaitable, Callable
+
+import redis
+
+from app.metrics import sse_broadcasts_total, sse_clients, sse_updates_dropped_total
+from app.redis_client import subscribe_vote_updates
+from app.tally import TallySnapshot, delta_event
+
+logger = logging.getLogger(__name__)
+
+SSE_TICK_SECONDS = float(os.getenv("SSE_TICK_SECONDS", "0.25"))
+SSE_RESYNC_SECONDS = float(os.getenv("SSE_RESYNC_SECONDS", "5"))
+SSE_CLIENT_QUEUE_SIZE = int(os.getenv("SSE_CLIENT_QUEUE_SIZE", "2"))
+SSE_HEARTBEAT_SECONDS = int(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_HISTORY_SIZE = int(os.getenv("SSE_HISTORY_SIZE", "256"))
+
+# Encoded deltas kept for reuse; clients that keep up all need the same one.
+DELTA_CACHE_SIZE = 64
+
+
+class VoteBroadcaster:
+    """Fans tally snapshots out to every connected /stream client.
+
+    A single background task listens on the vote_updates channel and
+    re-renders the tally at most once per tick, however many votes arrived
+    in between. A client is sent the full tally (with labels) once, then
+    only ``delta`` events naming the choices whose count changed since its
+    last event, each tagged with the tally version as event id. Nothing is
+    sent while nothing changes; the response's heartbeat comments keep the
+    connection alive instead.
+
+    Clients each get a small bounded queue of snapshots; one that falls
+    behind has its stale snapshot replaced by the latest, and its next
+    delta covers everything it skipped. Recent snapshots are kept by event
+    id so a reconnecting client's Last-Event-ID resumes with a delta.
+    """
+
+    def __init__(
+        self,
+        render: Callable[[], Awaitable[TallySnapshot]],
+        tick: float = SSE_TICK_SECONDS,
+        resync: float = SSE_RESYNC_SECONDS,
+        client_queue_size: int = SSE_CLIENT_QUEUE_SIZE,
+        history_size: int = SSE_HISTORY_SIZE,
+    ):
+        self._render = render
+        self.tick = tick
+        self.resync = resync
+        self.client_queue_size = client_queue_size
+        self.history_size = history_size
+        self._clients: set[asyncio.Queue] = set()
+        self._latest: TallySnapshot | None = None
+        self._history: OrderedDict[str, TallySnapshot] = OrderedDict()
+        self._deltas: OrderedDict[tuple[str, str], bytes] = OrderedDict()
+
+    def _remember(self, snapshot: TallySnapshot) -> None:
+        if self._latest is not None and snapshot.version < self._latest.version:
+            # Redis restarted and its version counter with it: the ids we
+            # remember now name different counts.
+            self._history.clear()
+        self._latest = snapshot
+        self._history[snapshot.event_id] = snapshot
+        self._history.move_to_end(snapshot.event_id)
+        while len(self._history) > self.history_size:
+            self._history.popitem(last=False)
+
+    async def subscribe(self) -> asyncio.Queue:
+        if self._latest is None:
+            self._remember(await self._render())
+
+        queue = asyncio.Queue(maxsize=self.client_queue_size)
+        queue.put_nowait(self._latest)
+        self._clients.add(queue)
+        sse_clients.set(len(self._clients))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._clients.discard(queue)
+        sse_clients.set(len(self._clients))
+
+    def publish(self, snapshot: TallySnapshot) -> None:
+        if self._latest is not None and snapshot.version == self._latest.version:
+            return
+
+        self._remember(snapshot)
+        sse_broadcasts_total.inc()
+        for queue in self._clients:
+            if queue.full():
+                queue.get_nowait()
+                sse_updates_dropped_total.inc()
+            queue.put_nowait(snapshot)
+
+    def resume_point(self, last_event_id: str | None) -> TallySnapshot | None:
+        """The snapshot a reconnecting client last saw, if it is still remembered."""
+        if not last_event_id:
+            return None
+        return self._history.get(last_event_id)
+
+    def encode(self, sent: TallySnapshot | None, snapshot: TallySnapshot) -> bytes | None:
+        """The event that takes a client from ``sent`` to ``snapshot``.
+
+        The full tally if there is nothing to diff against, None if nothing
+        changed, otherwise a delta.
+        """
+        if sent is None:
+            return snapshot.event
+        if sent.version == snapshot.version:
+            return None
+
+        # ETags name the counts themselves, so the key stays right even if
+        # versions repeat after a Redis restart.
+        key = (sent.etag, snapshot.etag)
+        event = self._deltas.get(key)
+        if event is None:
+            event = self._deltas[key] = delta_event(sent, snapshot)
+            if len(self._deltas) > DELTA_CACHE_SIZE:
+                self._deltas.popitem(last=False)
+        return event
+
+    async def events(self, last_event_id: str | None = None) -> AsyncIterator[bytes]:
+        """One client's stream of encoded events."""
+        queue = await self.subscribe()
+        sent = self.resume_point(last_event_id)
+        try:
+            while True:
+                snapshot = await queue.get()
+                event = self.encode(sent, snapshot)
+                if event is not None:
+                    yield event
+                sent = snapshot
+        finally:
+            self.unsubscribe(queue)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        pubsub = None
+        last_render = 0.0
+
+        try:
+            while True:
+                try:
+                    if pubsub is None:
+                        pubsub = await subscribe_vote_updates()
+
+                    changed = False
+                    while await pubsub.get_message(ignore_subscribe_messages=True, timeout=0) is not None:
+                        changed = True
+
+                    now = loop.time()
+                    if changed or now - last_render >= self.resync:
+                        self.publish(await self._render())
+                        last_render = now
+                except redis.RedisError:
+                    logger.exception("SSE broadcaster lost Redis, resubscribing")
+                    if pubsub is not None:
+                        await pubsub.aclose()
+                    pubsub = None
+
+                await asyncio.sleep(self.tick)
+        finally:
+            if pubsub is not None:
+                await pubsub.aclose()
@@ -0,0 +1,69 @@
+import logging
+import time
+
+from app.metrics import circuit_breaker_opened_total, circuit_breaker_state
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+# Exported as the circuit_breaker_state gauge.
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """Stops calling a dependency after ``failure_threshold`` failures in a row.
+
+    While open, ``allow()`` is False so callers take their fallback at once
+    instead of each waiting out a timeout. After ``reset_timeout`` seconds
+    one trial call is let through (half-open): success closes the breaker,
+    failure opens it for another ``reset_timeout``.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_started = 0.0
+        self._set_state(CLOSED)
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        circuit_breaker_state.labels(name=self.name).set(STATE_VALUES[state])
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+
+        now = time.monotonic()
+        if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+            self._set_state(HALF_OPEN)
+            self._trial_started = now
+            return True
+        # A trial that never reported back (e.g. its task was cancelled)
+        # must not keep the breaker half-open forever.
+        if self.state == HALF_OPEN and now - self._trial_started >= self.reset_timeout:
+            self._trial_started = now
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self.state != CLOSED:
+            logger.info("Circuit breaker %s closed", self.name)
+            self._set_state(CLOSED)
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            logger.warning("Circuit breaker %s opened after %d failures", self.name, self.failures)
+            self._set_state(OPEN)
+            self.opened_at = time.monotonic()
+            circuit_breaker_opened_total.labels(name=self.name).inc()
+
+    def snapshot(self) -> dict:
+        return {"name": self.name, "state": self.state, "failures": self.failures}
@@ -0,0 +1,133 @@
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime, timezone
+from typing import AsyncIterator
+
+from sqlalchemy import select
+from starlette.responses import StreamingResponse
+
+from app.database import EXPORT_POOL_SIZE, export_engine
+from app.metrics import vote_export_rows_total
+from app.models import Vote
+
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "1000"))
+
+EXPORT_COLUMNS = (Vote.id, Vote.session_id, Vote.choice, Vote.referral_code, Vote.created_at)
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def export_query(since: datetime | None = None, session: int | None = None):
+    query = select(*EXPORT_COLUMNS).order_by(Vote.id)
+    if since is not None:
+        if since.tzinfo is not None:
+            # created_at is a naive UTC timestamp.
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        query = query.where(Vote.created_at >= since)
+    if session is not None:
+        query = query.where(Vote.session_id == session)
+    return query
+
+
+def _timestamp(value: datetime | None) -> str | None:
+    return value.isoformat() if value is not None else None
+
+
+def encode_csv(rows) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerows(
+        (row.id, row.session_id, row.choice, row.referral_code or "", _timestamp(row.created_at) or "")
+        for row in rows
+    )
+    return buffer.getvalue()
+
+
+def encode_ndjson(rows) -> str:
+    return "".join(
+        json.dumps(
+            {
+                "id": row.id,
+                "session_id": row.session_id,
+                "choice": row.choice,
+                "referral_code": row.referral_code,
+                "created_at": _timestamp(row.created_at),
+            },
+            separators=(",", ":"),
+        ) + "\n"
+        for row in rows
+    )
+
+
+ENCODERS = {"csv": encode_csv, "ndjson": encode_ndjson}
+
+
+async def stream_votes(fmt: str, since: datetime | None = None, session: int | None = None,
+                       compress: bool = False, batch_rows: int = EXPORT_BATCH_ROWS) -> AsyncIterator[bytes]:
+    """Yield the ``votes`` table as CSV or NDJSON, ``batch_rows`` rows at a time.
+
+    Rows come from a server-side cursor, so memory stays flat however many
+    there are. The connection comes from the export pool, is only checked
+    out once the first chunk is requested and goes back as soon as the last
+    row is read or the iterator is closed.
+    """
+    encode = ENCODERS[fmt]
+    # wbits=31 writes a gzip header and trailer around the deflate stream.
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def chunk(text: str) -> bytes:
+        data = text.encode()
+        return compressor.compress(data) if compressor else data
+
+    if fmt == "csv":
+        yield chunk("id,session_id,choice,referral_code,created_at\n")
+
+    rows = 0
+    try:
+        async with export_engine.connect() as conn:
+            result = await conn.stream(export_query(since, session).execution_options(yield_per=batch_rows))
+            async for partition in result.partitions(batch_rows):
+                rows += len(partition)
+                data = chunk(encode(partition))
+                if data:
+                    yield data
+    finally:
+        vote_export_rows_total.labels(format=fmt).inc(rows)
+
+    if compressor:
+        yield compressor.flush()
+
+
+def export_slot_free() -> bool:
+    """Whether an export can start now rather than queue for a connection."""
+    return export_engine.pool.checkedout() < EXPORT_POOL_SIZE
+
+
+class ExportResponse(StreamingResponse):
+    """StreamingResponse that closes its iterator however the transfer ends.
+
+    When a client disconnects mid-download Starlette stops iterating but
+    leaves the generator to the garbage collector; closing it here returns
+    the export's database connection straight away.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+
+
+def export_response(fmt: str, since: datetime | None = None, session: int | None = None,
+                    compress: bool = False) -> ExportResponse:
+    filename = f"votes.{fmt}" + (".gz" if compress else "")
+    return ExportResponse(
+        stream_votes(fmt, since, session, compress),
+        media_type="application/gzip" if compress else EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"},
+    )
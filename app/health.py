@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import os
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from sqlalchemy import select
+
+from app.database import health_engine
+from app.metrics import dependency_check_failures_total, dependency_check_seconds, dependency_up
+from app.models import Vote
+from app.redis_client import ping
+
+logger = logging.getLogger(__name__)
+
+HEALTH_CHECK_INTERVAL_SECONDS = float(os.getenv("HEALTH_CHECK_INTERVAL_SECONDS", "2"))
+HEALTH_CHECK_TIMEOUT_SECONDS = float(os.getenv("HEALTH_CHECK_TIMEOUT_SECONDS", "1"))
+HEALTH_FAILURE_THRESHOLD = int(os.getenv("HEALTH_FAILURE_THRESHOLD", "3"))
+HEALTH_RECOVERY_THRESHOLD = int(os.getenv("HEALTH_RECOVERY_THRESHOLD", "2"))
+
+
+@dataclass
+class Dependency:
+    name: str
+    check: Callable[[], Awaitable[object]]
+    # Whether /ready fails while this dependency is down.
+    critical: bool = True
+    healthy: bool | None = None
+    failures: int = 0
+    successes: int = 0
+    latency: float | None = None
+    error: str | None = None
+    checked_at: float = 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "healthy": self.healthy,
+            "critical": self.critical,
+            "latency_ms": None if self.latency is None else round(self.latency * 1000, 3),
+            "error": self.error,
+        }
+
+
+class HealthMonitor:
+    """Checks dependencies in the background so probes answer from memory.
+
+    Every ``interval`` seconds each dependency gets one check of at most
+    ``timeout`` seconds. The first result is taken as is; after that a
+    dependency is marked down only after ``failure_threshold`` failed checks
+    in a row, and up again after ``recovery_threshold`` good ones, so a
+    single slow PING doesn't take the pod out of the Service. Results older
+    than ``stale_after`` count as down, in case the loop itself is stuck.
+    """
+
+    def __init__(self, interval: float = HEALTH_CHECK_INTERVAL_SECONDS,
+                 timeout: float = HEALTH_CHECK_TIMEOUT_SECONDS,
+                 failure_threshold: int = HEALTH_FAILURE_THRESHOLD,
+                 recovery_threshold: int = HEALTH_RECOVERY_THRESHOLD):
+        self.interval = interval
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.recovery_threshold = recovery_threshold
+        self.stale_after = 3 * interval + timeout
+        self.dependencies: dict[str, Dependency] = {}
+        # Set once startup has run its migrations and filled the pools.
+        self.warm = False
+
+    def add(self, name: str, check: Callable[[], Awaitable[object]], critical: bool = True) -> None:
+        self.dependencies[name] = Dependency(name, check, critical)
+
+    async def _check(self, dependency: Dependency) -> None:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(dependency.check(), self.timeout)
+        except Exception as exc:
+            ok = False
+            dependency.error = f"{type(exc).__name__}: {exc}" if str(exc) else type(exc).__name__
+            dependency.failures += 1
+            dependency.successes = 0
+            dependency_check_failures_total.labels(dependency=dependency.name).inc()
+        else:
+            ok = True
+            dependency.error = None
+            dependency.successes += 1
+            dependency.failures = 0
+
+        dependency.latency = time.perf_counter() - start
+        dependency.checked_at = time.monotonic()
+        dependency_check_seconds.labels(dependency=dependency.name).observe(dependency.latency)
+        self._settle(dependency, ok)
+
+    def _settle(self, dependency: Dependency, ok: bool) -> None:
+        if dependency.healthy is None:
+            healthy = ok
+        elif dependency.healthy and dependency.failures >= self.failure_threshold:
+            healthy = False
+        elif not dependency.healthy and dependency.successes >= self.recovery_threshold:
+            healthy = True
+        else:
+            return
+
+        if dependency.healthy is not None and healthy != dependency.healthy:
+            if healthy:
+                logger.info("%s is healthy again", dependency.name)
+            else:
+                logger.warning("%s is down after %d failed checks: %s",
+                               dependency.name, dependency.failures, dependency.error)
+        dependency.healthy = healthy
+        dependency_up.labels(dependency=dependency.name).set(int(healthy))
+
+    async def check_all(self) -> None:
+        await asyncio.gather(*(self._check(dependency) for dependency in self.dependencies.values()))
+
+    async def check_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check_all()
+            except Exception:
+                logger.exception("Dependency health check failed")
+
+    def is_up(self, dependency: Dependency) -> bool:
+        return bool(dependency.healthy) and time.monotonic() - dependency.checked_at <= self.stale_after
+
+    def ready(self) -> bool:
+        return self.warm and all(self.is_up(dependency) for dependency in self.dependencies.values() if dependency.critical)
+
+    def snapshot(self) -> dict:
+        if not self.warm:
+            status = "starting"
+        elif not self.ready():
+            status = "not ready"
+        elif all(self.is_up(dependency) for dependency in self.dependencies.values()):
+            status = "ready"
+        else:
+            status = "degraded"
+        return {
+            "status": status,
+            "dependencies": {name: dependency.snapshot() for name, dependency in self.dependencies.items()},
+        }
+
+
+async def check_redis() -> None:
+    await ping()
+
+
+async def check_postgres() -> None:
+    async with health_engine.connect() as conn:
+        await conn.execute(select(Vote.id).limit(1))
+
+
+health_monitor = HealthMonitor()
+health_monitor.add("redis", check_redis)
+# Votes spill to the Redis fallback stream while Postgres is down, so the
+# pod keeps taking traffic (reported as "degraded").
+health_monitor.add("postgres", check_postgres, critical=False)
@@ -1,26 +1,78 @@
 import asyncio
-import json
+import logging
+import math
 import os
 from contextlib import asynccontextmanager
+from datetime import datetime
 from typing import Optional
 
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
+from redis.exceptions import RedisError
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sse_starlette.sse import EventSourceResponse
-from sqlalchemy import text
-from sqlalchemy.exc import TimeoutError as PoolTimeoutError, OperationalError
 
-from app.database import Base, engine
-from app.metrics import MetricsMiddleware, db_pool_checked_out, db_pool_size, db_pool_timeout_total, get_metrics_response, referral_cache_exhausted_total
-from app.models import Vote
-from app.redis_client import get_vote_counts, increment_vote, redis_client
+from app.admission import Overloaded, admission, vote_rate_limiter
+from app.broadcaster import SSE_HEARTBEAT_SECONDS, VoteBroadcaster
+from app.database import async_engine, engine, health_engine
+from app.database import warm_pool as warm_db_pool
+from app.export import EXPORT_FORMATS, export_response, export_slot_free
+from app.health import health_monitor
+from app.metrics import (
+    MetricsMiddleware,
+    db_pool_checked_out,
+    db_pool_size,
+    db_pool_timeout_total,
+    get_metrics_response,
+    mark_worker_exited,
+    redis_pool_available,
+    redis_pool_in_use,
+    redis_pool_max_connections,
+    schema_migration_blocked,
+)
+from app.migrations import MigrationBlocked, migrate
+from app.pages import PageCache
+from app.pool_monitor import pool_monitor
+from app.profiling import (
+    PROFILE_MAX_SECONDS,
+    PROFILE_TOKEN,
+    Busy,
+    ProfileMiddleware,
+    render_collapsed,
+    report_store,
+    request_token,
+    stack_sampler,
+    token_matches,
+)
+from app.reconcile import TallyReconciler
+from app.redis_client import (
+    SessionChanged,
+    close_redis,
+    ensure_fallback_group,
+    increment_vote,
+    init_redis,
+    migrate_legacy_vote_keys,
+    pool_stats,
+)
+from app.redis_client import warm_pool as warm_redis_pool
 from app.referral import validate_referral
+from app.referral_index import REFERRAL_INDEX_ENABLED, referral_index
+from app.sessions import VoteSessions
+from app.startup import StartupTimer
+from app.tally import TallyCache
+from app.timeline import VoteTimeline
+from app.vote_fallback import new_vote, vote_fallback
+from app.vote_writer import VOTE_WRITE_BEHIND_ENABLED, VoteQueueFull, vote_writer
+
+logger = logging.getLogger(__name__)
 
 # Version and conference from environment
 VERSION = os.getenv("APP_VERSION", "dev")
 CONFERENCE = os.getenv("CONFERENCE", "")
+POOL_METRICS_INTERVAL_SECONDS = float(os.getenv("POOL_METRICS_INTERVAL_SECONDS", "5"))
 
 VALID_CHOICES = [
     "print",
@@ -46,9 +98,82 @@ class VoteRequest(BaseModel):
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    Base.metadata.create_all(bind=engine)
+    timer = StartupTimer()
+    with timer.phase("pages"):
+        pages.preload()
+
+    with timer.phase("redis"):
+        await init_redis()
+        await ensure_fallback_group()
+
+    with timer.phase("schema"):
+        try:
+            await migrate()
+            schema_migration_blocked.set(0)
+        except MigrationBlocked as exc:
+            # Duplicate rows stop a unique index build. Restarting won't fix
+            # the data, so serve on the schema as it is instead of crashlooping.
+            schema_migration_blocked.set(exc.migration.version)
+            logger.error("%s; starting without it", exc)
+
+    with timer.phase("pool_warmup"):
+        await asyncio.gather(warm_db_pool(), warm_redis_pool())
+
+    with timer.phase("session"):
+        session = await sessions.refresh()
+        await migrate_legacy_vote_keys(session, VALID_CHOICES)
+
+    # Redis has no persistence; if it restarted, refill the tally from Postgres
+    # before serving.
+    with timer.phase("reconcile"):
+        await reconciler.reconcile()
+    reconcile_task = asyncio.create_task(reconciler.reconcile_forever())
+    purge_task = asyncio.create_task(sessions.purge_forever())
+    replay_task = asyncio.create_task(vote_fallback.replay_forever())
+
+    refresh_task = None
+    if REFERRAL_INDEX_ENABLED:
+        with timer.phase("referral_index"):
+            await asyncio.to_thread(referral_index.build)
+        refresh_task = asyncio.create_task(referral_index.refresh_forever())
+
+    if VOTE_WRITE_BEHIND_ENABLED:
+        vote_writer.start()
+
+    broadcast_task = asyncio.create_task(broadcaster.run())
+    leak_task = asyncio.create_task(pool_monitor.watch_forever())
+    pool_metrics_task = asyncio.create_task(update_pool_metrics_forever())
+
+    # /ready answers from these results, so have one before serving, and
+    # only once the pools are warm.
+    with timer.phase("health_check"):
+        await health_monitor.check_all()
+    health_task = asyncio.create_task(health_monitor.check_forever())
+    health_monitor.warm = True
+    timer.finish()
+
     yield
 
+    health_task.cancel()
+    pool_metrics_task.cancel()
+    leak_task.cancel()
+    broadcast_task.cancel()
+    reconcile_task.cancel()
+    purge_task.cancel()
+    replay_task.cancel()
+
+    if refresh_task:
+        refresh_task.cancel()
+
+    health_monitor.warm = False
+    if VOTE_WRITE_BEHIND_ENABLED:
+        await vote_writer.stop()
+
+    await async_engine.dispose()
+    await health_engine.dispose()
+    await close_redis()
+    mark_worker_exited()
+
 
 app = FastAPI(
     title="Conference Polling App",
@@ -56,33 +181,63 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Without a token there is nothing to check on each request.
+if PROFILE_TOKEN:
+    app.add_middleware(ProfileMiddleware)
 app.add_middleware(MetricsMiddleware)
 
 static_dir = os.path.join(os.path.dirname(__file__), "static")
 if os.path.exists(static_dir):
     app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
+pages = PageCache(static_dir, context={"APP_VERSION": VERSION, "CONFERENCE": CONFERENCE})
+
 
 def update_pool_metrics():
-    pool = engine.pool
+    pool = async_engine.pool
     db_pool_size.set(pool.size())
     db_pool_checked_out.set(pool.checkedout())
 
+    redis_pool = pool_stats()
+    redis_pool_in_use.set(redis_pool["in_use"])
+    redis_pool_available.set(redis_pool["available"])
+    redis_pool_max_connections.set(redis_pool["max"])
+
+
+async def update_pool_metrics_forever(interval: float = POOL_METRICS_INTERVAL_SECONDS):
+    # Under several workers /metrics is answered by just one of them, so
+    # each worker refreshes its own pool gauges for the merged view.
+    while True:
+        try:
+            update_pool_metrics()
+        except Exception:
+            logger.exception("Updating pool metrics failed")
+        await asyncio.sleep(interval)
+
 
 @app.get("/", response_class=HTMLResponse)
 async def voting_page(request: Request):
-    with open(os.path.join(static_dir, "vote.html"), "r") as f:
-        return HTMLResponse(content=f.read())
+    return pages.response("vote.html", request)
 
 
 @app.get("/results", response_class=HTMLResponse)
-async def results_page():
-    with open(os.path.join(static_dir, "results.html"), "r") as f:
-        return HTMLResponse(content=f.read())
+async def results_page(request: Request):
+    return pages.response("results.html", request)
+
+
+sessions = VoteSessions(VALID_CHOICES)
 
 
 @app.post("/vote")
-async def submit_vote(vote: VoteRequest):
+async def submit_vote(vote: VoteRequest, request: Request):
+    wait = vote_rate_limiter.acquire(request.client.host if request.client else "unknown")
+    if wait:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many votes from this address. Please slow down.",
+            headers={"Retry-After": str(math.ceil(wait))}
+        )
+
     if vote.choice not in VALID_CHOICES:
         raise HTTPException(
             status_code=400,
@@ -90,26 +245,62 @@ async def submit_vote(vote: VoteRequest):
         )
 
     try:
+        # Admission slots guard every step that may check out a pooled
+        # connection; write-behind votes otherwise only touch Redis.
         if vote.referral:
-            partner = validate_referral(vote.referral)
+            async with admission.admit():
+                partner = await validate_referral(vote.referral)
             if not partner:
                 raise HTTPException(status_code=400, detail="Invalid referral code")
 
-        increment_vote(vote.choice)
-
-        with engine.connect() as conn:
-            conn.execute(
-                Vote.__table__.insert().values(
-                    choice=vote.choice,
-                    referral_code=vote.referral
-                )
-            )
-            conn.commit()
+        # The row is built only once the vote is counted, with the session
+        # it was counted in: a reset landing in between (on any replica)
+        # moves both to the new session instead of splitting them.
+        if VOTE_WRITE_BEHIND_ENABLED:
+            await vote_writer.reserve()
+            try:
+                session, _ = await sessions.call(increment_vote, vote.choice)
+            except BaseException:
+                vote_writer.release()
+                raise
+            vote_writer.put(new_vote(vote.choice, vote.referral, session))
+            return {"status": "ok", "choice": vote.choice}
+
+        async with admission.admit():
+            session, _ = await sessions.call(increment_vote, vote.choice)
+            # Spills to a Redis stream, replayed later, if Postgres is down.
+            await vote_fallback.write([new_vote(vote.choice, vote.referral, session)])
 
         update_pool_metrics()
 
         return {"status": "ok", "choice": vote.choice}
 
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy. Please try again in a moment.",
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+    except SessionChanged:
+        # Sessions were switched twice while this vote was in flight.
+        raise HTTPException(
+            status_code=503,
+            detail="The voting session just changed. Please vote again.",
+            headers={"Retry-After": "1"}
+        )
+    except VoteQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many votes in flight. Please try again in a moment.",
+            headers={"Retry-After": "1"}
+        )
+    except RedisError:
+        # Redis is down, or Postgres is and the fallback stream failed too.
+        raise HTTPException(
+            status_code=503,
+            detail="Vote storage is unavailable. Please try again in a moment.",
+            headers={"Retry-After": "1"}
+        )
     except PoolTimeoutError:
         db_pool_timeout_total.inc()
         update_pool_metrics()
@@ -117,7 +308,7 @@ async def submit_vote(vote: VoteRequest):
             status_code=503,
             detail="Database connection pool exhausted. All connections are in use - this is caused by a connection leak bug."
         )
-    except OperationalError as e:
+    except (DBAPIError, OSError):
         # Query was cancelled (e.g., statement_timeout) - connection may have leaked
         db_pool_timeout_total.inc()
         update_pool_metrics()
@@ -125,61 +316,50 @@ async def submit_vote(vote: VoteRequest):
             status_code=503,
             detail="Database query failed. This often precedes connection pool exhaustion due to a connection leak bug."
         )
-    except RuntimeError as e:
-        # Referral cache exhausted - unbounded cache bug
-        referral_cache_exhausted_total.inc()
-        raise HTTPException(
-            status_code=503,
-            detail=str(e)
-        )
+
+
+tally = TallyCache(VALID_CHOICES, CHOICE_LABELS, sessions)
+reconciler = TallyReconciler(VALID_CHOICES, sessions)
+
+
+broadcaster = VoteBroadcaster(render=tally.refresh)
 
 
 @app.get("/votes")
-async def get_votes():
-    counts = get_vote_counts()
-    result = {}
-    for choice in VALID_CHOICES:
-        result[choice] = {
-            "count": counts.get(choice, 0),
-            "label": CHOICE_LABELS[choice]
-        }
-    return result
+async def get_votes(request: Request):
+    snapshot = await tally.get()
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
 
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and snapshot.matches(if_none_match):
+        return Response(status_code=304, headers=headers)
 
-@app.get("/stream")
-async def vote_stream(request: Request):
-    async def event_generator():
-        pubsub = redis_client.pubsub()
-        pubsub.subscribe("vote_updates")
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
 
-        counts = get_vote_counts()
-        result = {}
-        for choice in VALID_CHOICES:
-            result[choice] = {
-                "count": counts.get(choice, 0),
-                "label": CHOICE_LABELS[choice]
-            }
-        yield {"event": "votes", "data": json.dumps(result)}
 
-        while True:
-            if await request.is_disconnected():
-                break
+timeline = VoteTimeline(VALID_CHOICES, sessions)
 
-            counts = get_vote_counts()
-            result = {}
-            for choice in VALID_CHOICES:
-                result[choice] = {
-                    "count": counts.get(choice, 0),
-                    "label": CHOICE_LABELS[choice]
-                }
-            yield {"event": "votes", "data": json.dumps(result)}
 
-            await asyncio.sleep(1)
+@app.get("/votes/timeline")
+async def get_vote_timeline(
+    start: Optional[int] = Query(None, alias="from", description="Unix seconds; default to minus 10 minutes"),
+    end: Optional[int] = Query(None, alias="to", description="Unix seconds; default now"),
+    step: int = Query(10, description="Bucket width in seconds"),
+):
+    """Votes per choice over time, from Redis rollups (never Postgres)."""
+    try:
+        body = await timeline.get(start, end, step)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=body, media_type="application/json", headers={"Cache-Control": "no-cache"})
 
-        pubsub.unsubscribe("vote_updates")
-        pubsub.close()
 
-    return EventSourceResponse(event_generator())
+@app.get("/stream")
+async def vote_stream(request: Request, last_event_id: Optional[str] = Query(None)):
+    # Browsers send Last-Event-ID when an EventSource reconnects by itself;
+    # results.js opens a new one after errors and passes ?last_event_id=.
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    return EventSourceResponse(broadcaster.events(resume_from), ping=SSE_HEARTBEAT_SECONDS)
 
 
 @app.get("/metrics")
@@ -199,17 +379,64 @@ async def version():
 
 
 @app.get("/admin", response_class=HTMLResponse)
-async def admin_page():
-    with open(os.path.join(static_dir, "admin.html"), "r") as f:
-        return HTMLResponse(content=f.read())
+async def admin_page(request: Request):
+    return pages.response("admin.html", request)
+
+
+@app.get("/admin/pool")
+async def pool_status():
+    """Database pool occupancy and every connection currently checked out."""
+    pools = {}
+    for label, pool in (("async", async_engine.pool), ("sync", engine.pool)):
+        pools[label] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "idle": pool.checkedin(),
+        }
+    return {
+        "pools": pools,
+        "admission": admission.stats(),
+        "fallback": vote_fallback.snapshot(),
+        "leak_threshold_seconds": pool_monitor.leak_threshold,
+        "held": pool_monitor.snapshot(),
+    }
+
+
+@app.post("/admin/reconcile")
+async def reconcile_tally():
+    """Restore any votes missing from the Redis tally (e.g. after a Redis restart)."""
+    try:
+        return await reconciler.reconcile()
+    except (PoolTimeoutError, DBAPIError, OSError):
+        raise HTTPException(status_code=503, detail="PostgreSQL not available")
+
+
+@app.get("/admin/export")
+async def export_votes(
+    format: str = Query("csv", description="csv or ndjson"),
+    since: Optional[datetime] = Query(None, description="Only votes created at or after this time"),
+    session: Optional[int] = Query(None, description="Only votes from this session"),
+    gzip: bool = Query(False, description="Compress the download"),
+):
+    """Stream raw vote rows as a download, oldest first."""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if not export_slot_free():
+        # The response has started by the time the stream asks for a
+        # connection, so refuse here rather than break off mid-download.
+        raise HTTPException(status_code=503, detail="Another export is running; try again shortly",
+                            headers={"Retry-After": "5"})
+    return export_response(format, since, session, gzip)
 
 
 @app.post("/admin/reset")
-async def reset_session(confirm: str = None):
-    """Reset the database for a new demo session.
+async def reset_session(confirm: str = None, name: Optional[str] = None):
+    """Start a new voting session for the next demo.
 
-    Clears all votes and Redis cache. Keeps referral_partners table intact.
-    Requires ?confirm=yes to execute.
+    Votes from earlier sessions are kept (and purged in the background once
+    they are older than the newest VOTE_SESSION_KEEP). Keeps referral_partners
+    table intact. Requires ?confirm=yes to execute.
     """
     if confirm != "yes":
         raise HTTPException(
@@ -218,37 +445,75 @@ async def reset_session(confirm: str = None):
         )
 
     try:
-        # Clear all votes from database
-        with engine.connect() as conn:
-            conn.execute(text("DELETE FROM votes"))
-            conn.commit()
-
-        # Clear Redis cache
-        redis_client.flushdb()
-
-        # Re-initialize vote counts in Redis
-        for choice in VALID_CHOICES:
-            redis_client.hset("vote_counts", choice, 0)
+        session = await sessions.start_new(name)
+        reconciler.invalidate()
+        tally.clear()
+        timeline.clear()
 
         return {
             "status": "success",
-            "message": "Session reset complete. All votes cleared."
+            "session": session,
+            "message": f"Session reset complete. Now counting votes in session {session}."
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Reset failed: {str(e)}")
 
 
-@app.get("/ready")
-async def ready():
+@app.get("/admin/sessions")
+async def list_sessions():
+    """Every voting session, newest first."""
     try:
-        redis_client.ping()
-    except Exception:
-        raise HTTPException(status_code=503, detail="Redis not available")
+        return {"sessions": await sessions.list()}
+    except (PoolTimeoutError, DBAPIError, OSError):
+        raise HTTPException(status_code=503, detail="PostgreSQL not available")
 
+
+def require_profile_token(request: Request) -> None:
+    if not PROFILE_TOKEN:
+        raise HTTPException(status_code=404, detail="Profiling is disabled; set PROFILE_TOKEN")
+    if not token_matches(request_token(request.scope)):
+        raise HTTPException(status_code=403, detail="Send the X-Profile-Token header")
+
+
+@app.get("/admin/profile")
+async def sample_profile(
+    request: Request,
+    seconds: float = Query(10, gt=0, description=f"How long to sample, at most {PROFILE_MAX_SECONDS:g}"),
+):
+    """Sample the event loop's stacks for a while, as collapsed stacks for flamegraph.pl or speedscope."""
+    require_profile_token(request)
     try:
-        with engine.connect() as conn:
-            conn.execute(Vote.__table__.select().limit(1))
-    except Exception:
-        raise HTTPException(status_code=503, detail="PostgreSQL not available")
+        stacks = await stack_sampler.profile_loop(min(seconds, PROFILE_MAX_SECONDS))
+    except Busy:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    filename = f"vote-api-{datetime.utcnow():%Y%m%dT%H%M%S}.collapsed"
+    return PlainTextResponse(
+        render_collapsed(stacks), headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@app.get("/admin/profile/requests/{report_id}")
+async def request_profile(
+    report_id: str,
+    request: Request,
+    format: str = Query("text", description="text, or pstats for snakeviz and pstats.Stats"),
+):
+    """A profiled request's report; the request's X-Profile-Report header links here."""
+    require_profile_token(request)
+    if format not in ("text", "pstats"):
+        raise HTTPException(status_code=400, detail="format must be one of: text, pstats")
+    path = report_store.path(report_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="No such report (only the most recent are kept)")
+    if format == "pstats":
+        return FileResponse(path, media_type="application/octet-stream", filename=path.name)
+    return PlainTextResponse(report_store.render(report_id))
 
-    return {"status": "ready"}
+
+@app.get("/ready")
+async def ready():
+    """Served from the health monitor's last checks; never calls Redis or Postgres itself."""
+    status = health_monitor.snapshot()
+    if not health_monitor.ready():
+        return JSONResponse(status_code=503, content=status)
+    return status
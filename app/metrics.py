@@ -1,9 +1,25 @@
+import os
+import re
 import time
+from contextvars import ContextVar
 
-from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
-from starlette.requests import Request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
 from starlette.responses import Response
 
+# Set when several uvicorn workers serve the app (see app/server.py). Each
+# worker then writes its samples to files in this directory and /metrics
+# merges them; every Gauge declares how its per-worker values combine.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
 http_requests_total = Counter(
     "http_requests_total",
     "Total HTTP requests",
@@ -17,14 +33,30 @@ http_request_duration_seconds = Histogram(
     buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
 )
 
+http_response_size_bytes = Histogram(
+    "http_response_size_bytes",
+    "HTTP response body size in bytes",
+    ["method", "endpoint"],
+    buckets=[100, 500, 1000, 5000, 10000, 50000, 100000, 500000, 1000000]
+)
+
+http_requests_in_progress = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently being served (including open /stream connections)",
+    ["method"],
+    multiprocess_mode="livesum"
+)
+
 db_pool_checked_out = Gauge(
     "db_pool_checked_out",
-    "Number of database connections currently checked out"
+    "Number of database connections currently checked out",
+    multiprocess_mode="livesum"
 )
 
 db_pool_size = Gauge(
     "db_pool_size",
-    "Total database connection pool size"
+    "Total database connection pool size",
+    multiprocess_mode="livesum"
 )
 
 db_pool_timeout_total = Counter(
@@ -32,71 +64,399 @@ db_pool_timeout_total = Counter(
     "Total database connection pool timeout errors"
 )
 
-referral_cache_exhausted_total = Counter(
-    "referral_cache_exhausted_total",
-    "Total referral cache exhaustion errors"
+db_pool_wait_seconds = Histogram(
+    "db_pool_wait_seconds",
+    "Time spent waiting to check a connection out of the database pool",
+    ["engine"],
+    buckets=[0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0]
+)
+
+db_pool_hold_seconds = Histogram(
+    "db_pool_hold_seconds",
+    "Time a database connection stays checked out before it is returned",
+    ["engine", "endpoint"],
+    buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+)
+
+db_pool_leaks_total = Counter(
+    "db_pool_leaks_total",
+    "Database connections held past the leak threshold",
+    ["engine", "endpoint"]
+)
+
+redis_pool_in_use = Gauge(
+    "redis_pool_in_use",
+    "Number of Redis connections currently checked out",
+    multiprocess_mode="livesum"
+)
+
+redis_pool_available = Gauge(
+    "redis_pool_available",
+    "Number of idle Redis connections ready in the pool",
+    multiprocess_mode="livesum"
+)
+
+redis_pool_max_connections = Gauge(
+    "redis_pool_max_connections",
+    "Maximum number of connections in the Redis pool",
+    multiprocess_mode="livesum"
+)
+
+redis_pool_wait_seconds = Histogram(
+    "redis_pool_wait_seconds",
+    "Time spent waiting for a Redis connection from the pool",
+    buckets=[0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.0]
+)
+
+referral_cache_hits_total = Counter(
+    "referral_cache_hits_total",
+    "Referral validations answered from the cache",
+    ["result"]
+)
+
+referral_cache_misses_total = Counter(
+    "referral_cache_misses_total",
+    "Referral validations that had to query the database"
+)
+
+referral_cache_evictions_total = Counter(
+    "referral_cache_evictions_total",
+    "Referral cache entries evicted",
+    ["reason"]
+)
+
+referral_cache_size = Gauge(
+    "referral_cache_size",
+    "Number of entries currently in the referral cache",
+    multiprocess_mode="livesum"
+)
+
+referral_index_lookups_total = Counter(
+    "referral_index_lookups_total",
+    "Referral index prefilter lookups",
+    ["result"]
+)
+
+referral_index_entries = Gauge(
+    "referral_index_entries",
+    "Number of referral codes loaded into the in-memory index",
+    multiprocess_mode="livemax"
+)
+
+referral_index_bytes = Gauge(
+    "referral_index_bytes",
+    "Memory used by the referral index bit array in bytes",
+    multiprocess_mode="livesum"
+)
+
+referral_index_build_seconds = Gauge(
+    "referral_index_build_seconds",
+    "Duration of the last full referral index build in seconds",
+    multiprocess_mode="livemax"
+)
+
+vote_write_queue_depth = Gauge(
+    "vote_write_queue_depth",
+    "Votes waiting in the write-behind queue",
+    multiprocess_mode="livesum"
+)
+
+vote_write_batch_size = Histogram(
+    "vote_write_batch_size",
+    "Number of votes persisted per write-behind flush",
+    buckets=[1, 5, 10, 25, 50, 100, 250, 500, 1000]
+)
+
+vote_write_flush_seconds = Histogram(
+    "vote_write_flush_seconds",
+    "Duration of a write-behind batch INSERT in seconds",
+    buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+)
+
+vote_write_flush_errors_total = Counter(
+    "vote_write_flush_errors_total",
+    "Write-behind flushes that failed and were retried"
+)
+
+vote_write_rejected_total = Counter(
+    "vote_write_rejected_total",
+    "Votes rejected because the write-behind queue was full"
+)
+
+sse_clients = Gauge(
+    "sse_clients",
+    "Number of connected /stream clients",
+    multiprocess_mode="livesum"
+)
+
+sse_broadcasts_total = Counter(
+    "sse_broadcasts_total",
+    "Vote payloads fanned out to /stream clients"
 )
 
+sse_updates_dropped_total = Counter(
+    "sse_updates_dropped_total",
+    "Stale payloads skipped because a /stream client was not keeping up"
+)
+
+vote_tally_drift = Gauge(
+    "vote_tally_drift",
+    "Redis tally minus Postgres vote count at the last reconciliation (positive: not yet persisted)",
+    ["choice"],
+    multiprocess_mode="livemostrecent"
+)
+
+vote_reconcile_corrections_total = Counter(
+    "vote_reconcile_corrections_total",
+    "Votes restored to the Redis tally from Postgres",
+    ["choice"]
+)
+
+vote_reconcile_seconds = Histogram(
+    "vote_reconcile_seconds",
+    "Duration of a tally reconciliation against Postgres",
+    ["mode"],
+    buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+)
+
+vote_export_rows_total = Counter(
+    "vote_export_rows_total",
+    "Vote rows streamed by /admin/export",
+    ["format"]
+)
+
+admission_in_flight = Gauge(
+    "admission_in_flight",
+    "Vote requests currently holding an admission slot",
+    multiprocess_mode="livesum"
+)
+
+admission_queue_depth = Gauge(
+    "admission_queue_depth",
+    "Vote requests waiting for an admission slot",
+    multiprocess_mode="livesum"
+)
+
+admission_queue_wait_seconds = Histogram(
+    "admission_queue_wait_seconds",
+    "Time queued requests waited for an admission slot",
+    buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+)
+
+admission_rejected_total = Counter(
+    "admission_rejected_total",
+    "Vote requests shed by admission control",
+    ["reason"]
+)
+
+circuit_breaker_state = Gauge(
+    "circuit_breaker_state",
+    "Circuit breaker state: 0 closed, 1 half-open, 2 open",
+    ["name"],
+    multiprocess_mode="livemax"
+)
+
+circuit_breaker_opened_total = Counter(
+    "circuit_breaker_opened_total",
+    "Times a circuit breaker opened",
+    ["name"]
+)
+
+vote_fallback_writes_total = Counter(
+    "vote_fallback_writes_total",
+    "Votes appended to the Redis fallback stream instead of Postgres"
+)
+
+vote_fallback_replayed_total = Counter(
+    "vote_fallback_replayed_total",
+    "Votes replayed from the fallback stream into Postgres"
+)
+
+vote_fallback_backlog = Gauge(
+    "vote_fallback_backlog",
+    "Votes in the fallback stream waiting to be replayed into Postgres",
+    multiprocess_mode="livemostrecent"
+)
+
+startup_phase_seconds = Gauge(
+    "startup_phase_seconds",
+    "Duration of each phase of the last startup (phase=\"total\" for all of it)",
+    ["phase"],
+    multiprocess_mode="livemax"
+)
+
+schema_migration_blocked = Gauge(
+    "schema_migration_blocked",
+    "Version of the migration startup could not apply because of the existing data (0 if none)",
+    multiprocess_mode="livemax"
+)
+
+dependency_check_seconds = Histogram(
+    "dependency_check_seconds",
+    "Duration of background health checks against Redis and Postgres",
+    ["dependency"],
+    buckets=[0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+)
+
+dependency_check_failures_total = Counter(
+    "dependency_check_failures_total",
+    "Background health checks that failed or timed out",
+    ["dependency"]
+)
+
+dependency_up = Gauge(
+    "dependency_up",
+    "Whether a dependency is considered up after flap damping (1 up, 0 down)",
+    ["dependency"],
+    multiprocess_mode="livemin"
+)
+
+profiles_total = Counter(
+    "profiles_total",
+    "Profiles taken: kind=request for one profiled request, sampling for /admin/profile",
+    ["kind"]
+)
+
+
+# prometheus_client names its files <type>_<pid>.db.
+_WORKER_FILE = re.compile(r"_(\d+)\.db$")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def cleanup_dead_workers(path: str | None = None) -> list[int]:
+    """Drop the live gauge files of workers that have exited.
+
+    uvicorn replaces a worker that crashes, and the old one never gets to
+    clean up after itself, so its pool and in-progress gauges would be
+    summed in forever. Counter and histogram files are kept so totals
+    don't go backwards. Returns the pids that were cleaned up.
+    """
+    path = path or PROMETHEUS_MULTIPROC_DIR
+    pids = set()
+    for name in os.listdir(path):
+        match = _WORKER_FILE.search(name)
+        if match and name.startswith("gauge_live"):
+            pids.add(int(match.group(1)))
+
+    dead = sorted(pid for pid in pids if not _pid_alive(pid))
+    for pid in dead:
+        multiprocess.mark_process_dead(pid, path)
+    return dead
+
+
+def mark_worker_exited() -> None:
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid(), PROMETHEUS_MULTIPROC_DIR)
+
 
 def get_metrics_response() -> Response:
+    if PROMETHEUS_MULTIPROC_DIR:
+        cleanup_dead_workers()
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, PROMETHEUS_MULTIPROC_DIR)
+    else:
+        registry = REGISTRY
     return Response(
-        content=generate_latest(),
+        content=generate_latest(registry),
         media_type=CONTENT_TYPE_LATEST
     )
 
 
+KNOWN_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+
+# ASGI scope of the request being served, for code that needs to know which
+# route it is running under (e.g. the database pool monitor).
+current_scope: ContextVar[dict | None] = ContextVar("current_scope", default=None)
+
+# Label for requests that matched no route, so random scanner URLs can't
+# create new time series.
+UNMATCHED_ENDPOINT = "other"
+
+
 class MetricsMiddleware:
-    def __init__(self, app):
+    """Pure ASGI middleware recording request count, latency and size.
+
+    The ``endpoint`` label is the matched route template (``/vote``,
+    ``/static``, ...) read back from the scope after routing, never the raw
+    request path.
+    """
+
+    def __init__(self, app, skip_paths: tuple[str, ...] = ("/metrics",)):
         self.app = app
+        self.skip_paths = frozenset(skip_paths)
+        # labels() takes a lock and hashes the label values on every call;
+        # cache the children since the label space is small and bounded.
+        self._in_progress = {}
+        self._timing = {}
+        self._counts = {}
 
     async def __call__(self, scope, receive, send):
-        if scope["type"] != "http":
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
             await self.app(scope, receive, send)
             return
 
-        request = Request(scope, receive)
-        method = request.method
-        path = request.url.path
+        method = scope["method"]
+        if method not in KNOWN_METHODS:
+            method = "OTHER"
+        root_path = scope.get("root_path", "")
 
-        if path == "/metrics":
-            await self.app(scope, receive, send)
-            return
+        in_progress = self._in_progress.get(method)
+        if in_progress is None:
+            in_progress = self._in_progress[method] = http_requests_in_progress.labels(method=method)
 
-        start_time = time.time()
         status_code = 500
+        response_size = 0
 
         async def send_wrapper(message):
-            nonlocal status_code
+            nonlocal status_code, response_size
             if message["type"] == "http.response.start":
                 status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
             await send(message)
 
+        in_progress.inc()
+        scope_token = current_scope.set(scope)
+        start_time = time.perf_counter()
         try:
             await self.app(scope, receive, send_wrapper)
         finally:
-            duration = time.time() - start_time
-            endpoint = self._normalize_path(path)
-            http_requests_total.labels(
-                method=method,
-                endpoint=endpoint,
-                status=str(status_code)
-            ).inc()
-            http_request_duration_seconds.labels(
-                method=method,
-                endpoint=endpoint
-            ).observe(duration)
-
-    def _normalize_path(self, path: str) -> str:
-        if path == "/":
-            return "/"
-        if path == "/vote":
-            return "/vote"
-        if path == "/results":
-            return "/results"
-        if path == "/health":
-            return "/health"
-        if path == "/ready":
-            return "/ready"
-        if path.startswith("/static"):
-            return "/static"
-        return path
+            duration = time.perf_counter() - start_time
+            current_scope.reset(scope_token)
+            in_progress.dec()
+
+            endpoint = self._endpoint(scope, root_path)
+            timing = self._timing.get((method, endpoint))
+            if timing is None:
+                timing = self._timing[(method, endpoint)] = (
+                    http_request_duration_seconds.labels(method=method, endpoint=endpoint),
+                    http_response_size_bytes.labels(method=method, endpoint=endpoint),
+                )
+            timing[0].observe(duration)
+            timing[1].observe(response_size)
+
+            count = self._counts.get((method, endpoint, status_code))
+            if count is None:
+                count = self._counts[(method, endpoint, status_code)] = http_requests_total.labels(
+                    method=method, endpoint=endpoint, status=str(status_code)
+                )
+            count.inc()
+
+    @staticmethod
+    def _endpoint(scope, root_path: str) -> str:
+        route = scope.get("route")
+        if route is not None:
+            return route.path
+        if "endpoint" in scope:
+            # Matched a Mount (e.g. /static); the router extended root_path.
+            return scope.get("root_path", "")[len(root_path):] or UNMATCHED_ENDPOINT
+        return UNMATCHED_ENDPOINT
@@ -0,0 +1,11 @@
+-- Votes are counted per session; existing votes become session 1.
+CREATE TABLE IF NOT EXISTS vote_sessions (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(255),
+    started_at TIMESTAMP DEFAULT NOW(),
+    purged_at TIMESTAMP
+);
+
+ALTER TABLE votes ADD COLUMN IF NOT EXISTS session_id INTEGER NOT NULL DEFAULT 1;
+
+INSERT INTO vote_sessions (name) SELECT 'default' WHERE NOT EXISTS (SELECT 1 FROM vote_sessions);
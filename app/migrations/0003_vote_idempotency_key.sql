@@ -0,0 +1,3 @@
+-- Set by the app on every vote so a replayed write can't insert it twice.
+-- Votes written before this have none.
+ALTER TABLE votes ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(32);
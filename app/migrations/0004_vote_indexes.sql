@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_votes_session_id_id ON votes (session_id, id);
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_votes_idempotency_key ON votes (idempotency_key);
@@ -0,0 +1,5 @@
+-- migrate: no-transaction
+-- validate_referral looks partners up by code. Without this every lookup
+-- is a sequential scan. The name matches the one Postgres gives a column
+-- UNIQUE constraint, so databases that already have one skip the build.
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS referral_partners_code_key ON referral_partners (code);
@@ -0,0 +1,3 @@
+-- migrate: no-transaction
+-- Per-choice counts over a time window.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_votes_choice_created_at ON votes (choice, created_at);
@@ -0,0 +1,280 @@
+"""Versioned schema migrations: the single source of truth for the schema.
+
+Each ``NNNN_name.sql`` file here is applied once, in order, and recorded in
+``schema_migrations``. The app applies pending ones at startup; the
+Postgres init scripts (scripts/init_db.sql and the Helm postgresql-init
+ConfigMap) are rendered from the same files with
+``python -m app.migrations render``, and app/models.py is checked against
+them by the tests.
+
+A file whose first line is ``-- migrate: no-transaction`` runs outside a
+transaction, statement by statement. That is required for
+``CREATE INDEX CONCURRENTLY``, which builds an index on a live table
+without blocking writes to it.
+"""
+
+import asyncio
+import logging
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from app.database import async_engine
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).parent
+NO_TRANSACTION = "-- migrate: no-transaction"
+
+# Held while one process migrates, so pods and workers starting together
+# don't race each other through the DDL.
+MIGRATION_LOCK_KEY = 7_201_604
+MIGRATION_LOCK_POLL_SECONDS = 0.5
+
+CREATE_MIGRATIONS_TABLE = """\
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)"""
+
+_FILENAME = re.compile(r"^(\d{4})_(\w+)\.sql$")
+_CONCURRENT_INDEX = re.compile(r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.I)
+_UNIQUE_INDEX = re.compile(
+    r"CREATE\s+UNIQUE\s+INDEX\s+(?:CONCURRENTLY\s+)?IF\s+NOT\s+EXISTS\s+(\w+)\s+ON\s+(\w+)\s*\(([^)]*)\)", re.I
+)
+# How many offending values a blocked unique index build reports.
+DUPLICATES_REPORTED = 10
+
+
+class MigrationBlocked(Exception):
+    """A unique index can't be built because the table holds duplicates.
+
+    Raised before the build starts, so nothing is left half done. Fix the
+    data and the next start (or ``python -m app.migrations apply``) picks
+    up where this one stopped.
+    """
+
+    def __init__(self, migration: "Migration", index: str, table: str, columns: str, duplicates: list):
+        self.migration = migration
+        self.index = index
+        self.duplicates = duplicates
+        shown = ", ".join(repr(value) for value in duplicates)
+        more = ", ..." if len(duplicates) == DUPLICATES_REPORTED else ""
+        super().__init__(
+            f"Migration {migration.version:04d}_{migration.name} can't build unique index {index}: "
+            f"{table} has duplicate ({columns}) values {shown}{more}. "
+            f"Remove the duplicates and apply the migrations again"
+        )
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    sql: str
+
+    @property
+    def transactional(self) -> bool:
+        return not self.sql.startswith(NO_TRANSACTION)
+
+    @property
+    def statements(self) -> list[str]:
+        body = "\n".join(line for line in self.sql.splitlines() if not line.lstrip().startswith("--"))
+        return [statement.strip() for statement in re.split(r";\s*$", body, flags=re.M) if statement.strip()]
+
+    @property
+    def concurrent_indexes(self) -> list[str]:
+        return _CONCURRENT_INDEX.findall(self.sql)
+
+
+def load_migrations(directory: Path = MIGRATIONS_DIR) -> list[Migration]:
+    migrations = []
+    for path in sorted(directory.glob("*.sql")):
+        match = _FILENAME.match(path.name)
+        if not match:
+            raise ValueError(f"Migration file {path.name} is not named NNNN_name.sql")
+        migrations.append(Migration(int(match.group(1)), match.group(2), path.read_text()))
+
+    versions = [migration.version for migration in migrations]
+    if versions != list(range(1, len(versions) + 1)):
+        raise ValueError(f"Migration versions must run 1..N without gaps, got {versions}")
+    return migrations
+
+
+MIGRATIONS = load_migrations()
+
+
+async def _applied(conn) -> set[int]:
+    return set((await conn.execute(text("SELECT version FROM schema_migrations"))).scalars())
+
+
+async def _drop_invalid_indexes(conn, names: list[str]) -> None:
+    # A CONCURRENTLY build that failed halfway leaves an INVALID index
+    # behind, which IF NOT EXISTS would then happily skip.
+    invalid = (await conn.execute(text(
+        "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE NOT i.indisvalid AND c.relname = ANY(:names)"
+    ), {"names": names})).scalars().all()
+    for name in invalid:
+        logger.warning("Dropping invalid index %s left by an interrupted build", name)
+        await conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+
+
+async def _check_unique(conn, migration: Migration, statement: str) -> None:
+    """Refuse a unique index build the table's current rows would fail."""
+    match = _UNIQUE_INDEX.search(statement)
+    if not match:
+        return
+    index, table, columns = match.groups()
+    duplicates = (await conn.execute(text(
+        f"SELECT {columns} FROM {table} GROUP BY {columns} HAVING count(*) > 1 "
+        f"ORDER BY {columns} LIMIT {DUPLICATES_REPORTED}"
+    ))).all()
+    if duplicates:
+        values = [row[0] if len(row) == 1 else tuple(row) for row in duplicates]
+        raise MigrationBlocked(migration, index, table, columns, values)
+
+
+async def _apply(conn, migration: Migration, postgres: bool) -> None:
+    record = text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)")
+    params = {"version": migration.version, "name": migration.name}
+
+    if migration.transactional:
+        for statement in migration.statements:
+            await _check_unique(conn, migration, statement)
+            await conn.execute(text(statement))
+        await conn.execute(record, params)
+        await conn.commit()
+        return
+
+    isolation_level = await conn.get_isolation_level()
+    await conn.execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        if postgres and migration.concurrent_indexes:
+            await _drop_invalid_indexes(conn, migration.concurrent_indexes)
+        for statement in migration.statements:
+            await _check_unique(conn, migration, statement)
+            await conn.execute(text(statement))
+        await conn.execute(record, params)
+    finally:
+        # Each statement has already committed on its own; this only ends
+        # SQLAlchemy's transaction so the isolation level can be put back.
+        await conn.rollback()
+        await conn.execution_options(isolation_level=isolation_level)
+
+
+async def _lock(conn) -> None:
+    """Take the migration lock and lift the server's timeouts for this session.
+
+    Waiting in a blocking pg_advisory_lock would hold a transaction open,
+    and CREATE INDEX CONCURRENTLY in the process holding the lock waits for
+    every older transaction to finish: the two would wait on each other.
+    So waiters poll pg_try_advisory_lock in autocommit instead. Duplicate
+    scans and index builds on a big table run far past the server-wide
+    statement_timeout, so that and lock_timeout are off until _unlock().
+    """
+    isolation_level = await conn.get_isolation_level()
+    await conn.execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        lock = text("SELECT pg_try_advisory_lock(:key)")
+        while not (await conn.execute(lock, {"key": MIGRATION_LOCK_KEY})).scalar():
+            await asyncio.sleep(MIGRATION_LOCK_POLL_SECONDS)
+        await conn.execute(text("SET statement_timeout = 0"))
+        await conn.execute(text("SET lock_timeout = 0"))
+    finally:
+        await conn.rollback()
+        await conn.execution_options(isolation_level=isolation_level)
+
+
+async def _unlock(conn) -> None:
+    await conn.execute(text("RESET statement_timeout"))
+    await conn.execute(text("RESET lock_timeout"))
+    await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+    await conn.commit()
+
+
+async def migrate(migrations: list[Migration] = MIGRATIONS) -> list[int]:
+    """Apply pending migrations in order; returns the versions applied.
+
+    When the database is already current this costs a single SELECT. Raises
+    MigrationBlocked, after applying the migrations before it, when a unique
+    index can't be built over the existing rows.
+    """
+    latest = migrations[-1].version
+    try:
+        async with async_engine.connect() as conn:
+            if (await conn.execute(text("SELECT max(version) FROM schema_migrations"))).scalar() == latest:
+                return []
+    except DBAPIError:
+        pass  # schema_migrations doesn't exist yet
+
+    applied_now = []
+    async with async_engine.connect() as conn:
+        postgres = conn.dialect.name == "postgresql"
+        if postgres:
+            await _lock(conn)
+        try:
+            await conn.execute(text(CREATE_MIGRATIONS_TABLE))
+            # Someone else may have migrated while we waited for the lock.
+            applied = await _applied(conn)
+            await conn.commit()
+            for migration in migrations:
+                if migration.version in applied:
+                    continue
+                logger.info("Applying migration %04d_%s", migration.version, migration.name)
+                await _apply(conn, migration, postgres)
+                applied_now.append(migration.version)
+        finally:
+            # Don't commit half of a migration that failed part way.
+            await conn.rollback()
+            if postgres:
+                await _unlock(conn)
+    return applied_now
+
+
+def render_init_sql(migrations: list[Migration] = MIGRATIONS) -> str:
+    """Every migration as one script for docker-entrypoint-initdb.d.
+
+    psql runs each statement on its own, so CONCURRENTLY builds are fine
+    there. The versions are recorded so the app skips them on first start.
+    """
+    parts = [
+        "-- Generated from app/migrations by `python -m app.migrations render`; do not edit.",
+        CREATE_MIGRATIONS_TABLE + ";",
+    ]
+    for migration in migrations:
+        parts.append(f"-- {migration.version:04d}_{migration.name}")
+        parts.extend(statement + ";" for statement in migration.statements)
+        parts.append(
+            f"INSERT INTO schema_migrations (version, name) VALUES ({migration.version}, '{migration.name}') "
+            "ON CONFLICT DO NOTHING;"
+        )
+    return "\n\n".join(parts) + "\n"
+
+
+INIT_SQL_PATH = MIGRATIONS_DIR.parent.parent / "scripts" / "init_db.sql"
+CONFIGMAP_PATH = MIGRATIONS_DIR.parent.parent / "helm" / "conference-app" / "templates" / "postgres-configmap.yaml"
+_CONFIGMAP_INIT_SQL = re.compile(r"(  init\.sql: \|\n)(.*?)(\n---\n)", re.S)
+
+
+def render_configmap(configmap: str, init_sql: str) -> str:
+    """``configmap`` with the postgresql-init ``init.sql`` block replaced by ``init_sql``."""
+    block = "".join(f"    {line}\n" if line else "\n" for line in init_sql.splitlines())
+    rendered, count = _CONFIGMAP_INIT_SQL.subn(lambda m: m.group(1) + block.rstrip("\n") + m.group(3), configmap)
+    if count != 1:
+        raise ValueError("postgres-configmap.yaml has no init.sql block followed by ---")
+    return rendered
+
+
+def rendered_files() -> dict[str, str]:
+    """Path -> content for every file generated from the migrations."""
+    init_sql = render_init_sql()
+    return {
+        os.fspath(INIT_SQL_PATH): init_sql,
+        os.fspath(CONFIGMAP_PATH): render_configmap(CONFIGMAP_PATH.read_text(), init_sql),
+    }
@@ -0,0 +1,52 @@
+"""python -m app.migrations {apply,render,check}
+
+apply   apply pending migrations to DATABASE_URL
+render  regenerate scripts/init_db.sql and the Helm postgresql-init ConfigMap
+check   exit 1 if those files are out of date with the migrations
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+from pathlib import Path
+
+from app.migrations import MigrationBlocked, migrate, rendered_files
+
+
+def apply() -> int:
+    try:
+        applied = asyncio.run(migrate())
+    except MigrationBlocked as exc:
+        print(exc, file=sys.stderr)
+        return 1
+    print(f"Applied {applied}" if applied else "Already up to date")
+    return 0
+
+
+def render() -> int:
+    for path, content in rendered_files().items():
+        if Path(path).read_text() != content:
+            Path(path).write_text(content)
+            print(f"Wrote {path}")
+    return 0
+
+
+def check() -> int:
+    stale = [path for path, content in rendered_files().items() if Path(path).read_text() != content]
+    for path in stale:
+        print(f"{path} is out of date; run python -m app.migrations render", file=sys.stderr)
+    return 1 if stale else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.migrations", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["apply", "render", "check"])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    return {"apply": apply, "render": render, "check": check}[args.command]()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,23 +1,50 @@
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, Integer, String
+from sqlalchemy import Column, DateTime, Index, Integer, String
 
 from app.database import Base
 
+# The schema itself is defined by app/migrations; these mirror it and
+# tests/test_migrations.py keeps the two in step.
+
+
+class VoteSession(Base):
+    """One poll run (a talk). The newest row is the session being voted in."""
+
+    __tablename__ = "vote_sessions"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(255), nullable=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    purged_at = Column(DateTime, nullable=True)
+
 
 class Vote(Base):
     __tablename__ = "votes"
-
-    id = Column(Integer, primary_key=True, index=True)
+    __table_args__ = (
+        Index("idx_votes_created_at", "created_at"),
+        Index("idx_votes_session_id_id", "session_id", "id"),
+        Index("idx_votes_idempotency_key", "idempotency_key", unique=True),
+        Index("idx_votes_choice_created_at", "choice", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(Integer, nullable=False, default=1, server_default="1")
     choice = Column(String(100), nullable=False)
     referral_code = Column(String(100), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Set by the app on every vote so a replayed write can't insert it twice.
+    idempotency_key = Column(String(32), nullable=True)
 
 
 class ReferralPartner(Base):
     __tablename__ = "referral_partners"
+    __table_args__ = (
+        Index("referral_partners_code_key", "code", unique=True),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     code = Column(String(100), nullable=False)
     name = Column(String(255), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+
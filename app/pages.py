@@ -0,0 +1,120 @@
+import gzip
+import hashlib
+import os
+from dataclasses import dataclass
+
+import brotli
+from starlette.requests import Request
+from starlette.responses import Response
+
+PAGES_HOT_RELOAD = os.getenv("PAGES_HOT_RELOAD", "false").lower() == "true"
+
+
+@dataclass(frozen=True)
+class RenderedPage:
+    mtime: float
+    digest: str
+    identity: bytes
+    gzip: bytes
+    br: bytes
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """True if any tag in If-None-Match names this exact representation.
+
+    Weak comparison, as If-None-Match calls for: a ``W/`` prefix is
+    ignored, but the encoding suffix is not, so a cached gzip body never
+    validates an identity response.
+    """
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def _accepted_encodings(accept_encoding: str) -> set[str]:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        try:
+            if params.startswith("q=") and float(params[2:]) == 0:
+                continue
+        except ValueError:
+            pass
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class PageCache:
+    """HTML pages rendered once and kept in memory, precompressed.
+
+    Pages may contain ``{{ NAME }}`` placeholders that are filled from the
+    context at render time. Each page gets a strong ETag derived from its
+    rendered content, so clients revalidating with If-None-Match get a 304.
+    With ``hot_reload`` the file's mtime is checked on every request and the
+    page is re-rendered when it changes on disk.
+    """
+
+    def __init__(self, directory: str, context: dict[str, str], hot_reload: bool = PAGES_HOT_RELOAD):
+        self.directory = directory
+        self.context = context
+        self.hot_reload = hot_reload
+        self._pages: dict[str, RenderedPage] = {}
+
+    def _render(self, name: str) -> RenderedPage:
+        path = os.path.join(self.directory, name)
+        mtime = os.stat(path).st_mtime
+        with open(path, "r") as f:
+            html = f.read()
+
+        for key, value in self.context.items():
+            html = html.replace("{{ " + key + " }}", value)
+
+        body = html.encode()
+        return RenderedPage(
+            mtime=mtime,
+            digest=hashlib.sha256(body).hexdigest()[:32],
+            identity=body,
+            gzip=gzip.compress(body, compresslevel=9, mtime=0),
+            br=brotli.compress(body, quality=11),
+        )
+
+    def preload(self) -> None:
+        for name in os.listdir(self.directory):
+            if name.endswith(".html"):
+                self._pages[name] = self._render(name)
+
+    def get(self, name: str) -> RenderedPage:
+        page = self._pages.get(name)
+        if page is None or (self.hot_reload and os.stat(os.path.join(self.directory, name)).st_mtime != page.mtime):
+            page = self._render(name)
+            self._pages[name] = page
+        return page
+
+    def response(self, name: str, request: Request) -> Response:
+        page = self.get(name)
+
+        accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+        if "br" in accepted:
+            encoding, body = "br", page.br
+        elif "gzip" in accepted:
+            encoding, body = "gzip", page.gzip
+        else:
+            encoding, body = None, page.identity
+
+        # Each encoding is a distinct representation, so it gets its own strong ETag.
+        headers = {
+            "ETag": f'"{page.digest}-{encoding}"' if encoding else f'"{page.digest}"',
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type="text/html", headers=headers)
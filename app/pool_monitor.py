@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+
+import greenlet
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.metrics import (
+    current_scope,
+    db_pool_hold_seconds,
+    db_pool_leaks_total,
+    db_pool_wait_seconds,
+)
+
+DB_POOL_LEAK_THRESHOLD_SECONDS = float(os.getenv("DB_POOL_LEAK_THRESHOLD_SECONDS", "10"))
+DB_POOL_LEAK_CHECK_INTERVAL_SECONDS = float(os.getenv("DB_POOL_LEAK_CHECK_INTERVAL_SECONDS", "5"))
+DB_POOL_STACK_DEPTH = int(os.getenv("DB_POOL_STACK_DEPTH", "40"))
+
+logger = logging.getLogger(__name__)
+
+
+class _TimedCheckout:
+    """Pool mixin that records how long callers wait for a connection.
+
+    SQLAlchemy has no event for the start of a checkout, so the wait is timed
+    around the pool's own ``_do_get``, the same way the Redis pool is.
+    """
+
+    engine_label = "unknown"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_wait_seconds.labels(engine=self.engine_label).observe(time.perf_counter() - start)
+
+
+class InstrumentedQueuePool(_TimedCheckout, QueuePool):
+    engine_label = "sync"
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    engine_label = "async"
+
+
+class InstrumentedExportPool(InstrumentedAsyncQueuePool):
+    engine_label = "export"
+
+
+# Pool and engine internals are the same for every checkout; leave them out.
+_SQLALCHEMY_DIR = os.path.dirname(sqlalchemy.__file__)
+
+
+def _capture_stack(limit: int) -> traceback.StackSummary:
+    """The caller's stack, without reading source lines until it is formatted.
+
+    Async engines check connections out inside a greenlet whose own stack
+    stops at SQLAlchemy's bridge; the awaiting coroutines live in the parent
+    greenlet, so its frames are appended. SQLAlchemy's own frames are dropped.
+    """
+    frames = list(traceback.walk_stack(sys._getframe(2)))
+    parent = greenlet.getcurrent().parent
+    if parent is not None and parent.gr_frame is not None:
+        frames.extend(traceback.walk_stack(parent.gr_frame))
+    frames = [(frame, lineno) for frame, lineno in frames if _SQLALCHEMY_DIR not in frame.f_code.co_filename]
+    summary = traceback.StackSummary.extract(iter(frames[:limit]), lookup_lines=False)
+    summary.reverse()
+    return summary
+
+
+def _route(scope: dict | None) -> str:
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    return route.path if route is not None else "other"
+
+
+@dataclass
+class HeldConnection:
+    engine: str
+    scope: dict | None
+    stack: traceback.StackSummary
+    leak_threshold: float | None = None
+    checked_out_at: float = field(default_factory=time.time)
+    started: float = field(default_factory=time.perf_counter)
+    reported: bool = False
+
+    @property
+    def held_seconds(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def endpoint(self) -> str:
+        # Resolved on demand: at checkout time the router may not have
+        # matched the request yet.
+        return _route(self.scope)
+
+    @property
+    def request(self) -> str | None:
+        if self.scope is None:
+            return None
+        return f"{self.scope['method']} {self.scope['path']}"
+
+
+class PoolMonitor:
+    """Tracks every checked-out connection of the engines it is attached to.
+
+    Hold times are recorded on checkin. ``check_leaks`` logs, once per
+    checkout, any connection held longer than ``leak_threshold`` together
+    with the stack and request that acquired it.
+    """
+
+    def __init__(self, leak_threshold: float = DB_POOL_LEAK_THRESHOLD_SECONDS, stack_depth: int = DB_POOL_STACK_DEPTH):
+        self.leak_threshold = leak_threshold
+        self.stack_depth = stack_depth
+        self._held: dict[object, HeldConnection] = {}
+        self._lock = threading.Lock()
+
+    def attach(self, engine, leak_threshold: float | None = None) -> None:
+        """Listen to checkouts/checkins on ``engine`` (a sync Engine).
+
+        ``leak_threshold`` overrides the monitor's own for this engine, for
+        connections that are meant to be held for long.
+        """
+        label = getattr(engine.pool, "engine_label", "unknown")
+
+        @event.listens_for(engine, "checkout")
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            held = HeldConnection(engine=label, scope=current_scope.get(), stack=_capture_stack(self.stack_depth),
+                                  leak_threshold=leak_threshold)
+            with self._lock:
+                self._held[connection_record] = held
+
+        @event.listens_for(engine, "checkin")
+        def on_checkin(dbapi_connection, connection_record):
+            with self._lock:
+                held = self._held.pop(connection_record, None)
+            if held is not None:
+                db_pool_hold_seconds.labels(engine=held.engine, endpoint=held.endpoint).observe(held.held_seconds)
+
+    def held(self) -> list[HeldConnection]:
+        with self._lock:
+            return sorted(self._held.values(), key=lambda h: h.started)
+
+    def check_leaks(self) -> list[HeldConnection]:
+        """Report connections newly past the leak threshold."""
+        leaks = []
+        for held in self.held():
+            threshold = self.leak_threshold if held.leak_threshold is None else held.leak_threshold
+            if held.reported or held.held_seconds < threshold:
+                continue
+            held.reported = True
+            leaks.append(held)
+            db_pool_leaks_total.labels(engine=held.engine, endpoint=held.endpoint).inc()
+            logger.warning(
+                "Database connection (%s engine) held for %.1fs by %s, acquired at:\n%s",
+                held.engine, held.held_seconds, held.request or "background task",
+                "".join(held.stack.format()),
+            )
+        return leaks
+
+    async def watch_forever(self, interval: float = DB_POOL_LEAK_CHECK_INTERVAL_SECONDS) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.check_leaks()
+            except Exception:
+                logger.exception("Database pool leak check failed")
+
+    def snapshot(self) -> list[dict]:
+        """Currently held connections, longest-held first, for /admin/pool."""
+        return [
+            {
+                "engine": held.engine,
+                "endpoint": held.endpoint,
+                "request": held.request,
+                "held_seconds": round(held.held_seconds, 3),
+                "checked_out_at": held.checked_out_at,
+                "leaked": held.held_seconds >= self.leak_threshold,
+                "stack": [f"{frame.filename}:{frame.lineno} in {frame.name}" for frame in held.stack],
+            }
+            for held in self.held()
+        ]
+
+
+pool_monitor = PoolMonitor()
@@ -0,0 +1,220 @@
+"""On-demand profiling, off unless PROFILE_TOKEN is set.
+
+Two tools, both gated on the token in the ``X-Profile-Token`` header. It
+is never taken from the query string, since URLs end up in access logs and
+Referer headers:
+
+* ProfileMiddleware runs one request under cProfile when it carries the
+  token. The report is written to PROFILE_REPORT_DIR before the response
+  finishes, and the response gets an ``X-Profile-Report`` header with the
+  path it can be fetched from. cProfile sees everything the event loop
+  runs meanwhile, so other requests in flight show up in the report too.
+* StackSampler records the event loop thread's stack every
+  PROFILE_SAMPLE_INTERVAL_SECONDS from another thread, for /admin/profile.
+  That costs nothing per call, so it can run during a live talk, and the
+  output is collapsed stacks for flamegraph.pl or speedscope. Samples
+  spent waiting in the selector are the loop being idle.
+
+Without a token the middleware is not installed and the endpoints 404.
+Under several uvicorn workers each profile covers the one worker that
+served it.
+"""
+
+import asyncio
+import cProfile
+import hmac
+import io
+import logging
+import os
+import pstats
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from app.metrics import profiles_total
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_REPORT_DIR = os.getenv("PROFILE_REPORT_DIR", os.path.join(tempfile.gettempdir(), "vote-api-profiles"))
+PROFILE_REPORT_KEEP = int(os.getenv("PROFILE_REPORT_KEEP", "20"))
+PROFILE_REPORT_LINES = int(os.getenv("PROFILE_REPORT_LINES", "60"))
+PROFILE_SAMPLE_INTERVAL_SECONDS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_SECONDS", "0.005"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+TOKEN_HEADER = b"x-profile-token"
+REPORT_HEADER = b"x-profile-report"
+_REPORT_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+def token_matches(token: str | None) -> bool:
+    return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+def request_token(scope) -> str | None:
+    """The profiling token an ASGI request carries in its header, if any."""
+    for name, value in scope["headers"]:
+        if name == TOKEN_HEADER:
+            return value.decode("latin-1")
+    return None
+
+
+class ReportStore:
+    """The last ``keep`` request profiles, as .prof files any worker can read."""
+
+    def __init__(self, directory: str = PROFILE_REPORT_DIR, keep: int = PROFILE_REPORT_KEEP):
+        self.directory = Path(directory)
+        self.keep = keep
+
+    def path(self, report_id: str) -> Path | None:
+        if not _REPORT_ID.match(report_id):
+            return None
+        path = self.directory / f"{report_id}.prof"
+        return path if path.exists() else None
+
+    def save(self, report_id: str, profile: cProfile.Profile) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profile.dump_stats(self.directory / f"{report_id}.prof")
+
+        reports = sorted(self.directory.glob("*.prof"), key=lambda path: path.stat().st_mtime)
+        for path in reports[:-self.keep]:
+            path.unlink(missing_ok=True)
+
+    def render(self, report_id: str, lines: int = PROFILE_REPORT_LINES) -> str | None:
+        """The report sorted by cumulative time, with what each hot function called."""
+        path = self.path(report_id)
+        if path is None:
+            return None
+        out = io.StringIO()
+        stats = pstats.Stats(str(path), stream=out).strip_dirs().sort_stats("cumulative")
+        stats.print_stats(lines)
+        stats.print_callees(lines // 3)
+        return out.getvalue()
+
+
+class ProfileMiddleware:
+    """Pure ASGI middleware profiling single requests that carry the token.
+
+    Only installed when PROFILE_TOKEN is set; other requests then cost one
+    scan of the headers. cProfile can't run twice at once, so a request
+    arriving while another is being profiled is served unprofiled. The
+    /admin/profile endpoints carry the token too and are never profiled.
+    """
+
+    def __init__(self, app, store: ReportStore | None = None):
+        self.app = app
+        self.store = store or report_store
+        self._active = False
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or self._active or scope["path"].startswith("/admin/profile")
+                or not token_matches(request_token(scope))):
+            await self.app(scope, receive, send)
+            return
+
+        report_id = uuid.uuid4().hex
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger or coverage) owns the hooks.
+            await self.app(scope, receive, send)
+            return
+        self._active = True
+        running = True
+
+        def finish():
+            nonlocal running
+            if running:
+                running = False
+                profile.disable()
+                self._active = False
+                try:
+                    self.store.save(report_id, profile)
+                except OSError:
+                    logger.exception("Saving request profile %s failed", report_id)
+                    return
+                profiles_total.labels(kind="request").inc()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                location = f"{scope.get('root_path', '')}/admin/profile/requests/{report_id}"
+                message = {**message, "headers": [*message.get("headers", []), (REPORT_HEADER, location.encode())]}
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                # Save before the last bytes go out, so the report is there
+                # as soon as the client has the response.
+                finish()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finish()
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)})".replace(";", ":")
+
+
+def collapse(frame) -> str:
+    """``frame``'s stack, outermost first, as one collapsed-stack line."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Busy(Exception):
+    pass
+
+
+class StackSampler:
+    """Samples one thread's stack from a background thread.
+
+    Reading another thread's frames only needs the GIL for a moment, so
+    the profiled code runs at full speed between samples.
+    """
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    def sample(self, thread_id: int, seconds: float) -> Counter:
+        if not self._lock.acquire(blocking=False):
+            raise Busy("a profile is already running")
+        try:
+            stacks = Counter()
+            deadline = time.monotonic() + seconds
+            next_sample = time.monotonic()
+            while next_sample < deadline:
+                frame = sys._current_frames().get(thread_id)
+                if frame is not None:
+                    stacks[collapse(frame)] += 1
+                del frame
+                next_sample += self.interval
+                time.sleep(max(0.0, next_sample - time.monotonic()))
+            return stacks
+        finally:
+            self._lock.release()
+
+    async def profile_loop(self, seconds: float) -> Counter:
+        """Sample the calling event loop's thread for ``seconds``."""
+        loop_thread = threading.get_ident()
+        stacks = await asyncio.to_thread(self.sample, loop_thread, seconds)
+        profiles_total.labels(kind="sampling").inc()
+        return stacks
+
+
+def render_collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+report_store = ReportStore()
+stack_sampler = StackSampler()
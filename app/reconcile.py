@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+import time
+
+from sqlalchemy import func, select
+
+from app.database import async_engine
+from app.metrics import vote_reconcile_corrections_total, vote_reconcile_seconds, vote_tally_drift
+from app.models import Vote
+from app.redis_client import raise_vote_counts
+from app.sessions import VoteSessions
+
+logger = logging.getLogger(__name__)
+
+VOTE_RECONCILE_INTERVAL_SECONDS = float(os.getenv("VOTE_RECONCILE_INTERVAL_SECONDS", "30"))
+
+
+class TallyReconciler:
+    """Keeps the current session's Redis tally from falling behind Postgres.
+
+    The session is counted once with a full ``GROUP BY choice``; after that
+    each pass only aggregates rows above an id watermark. Rows are folded
+    into the settled counts one pass after they are first seen, so a row
+    whose id was allocated before a later-committed neighbour is still
+    picked up. A new session starts over with a full count.
+
+    Redis is only ever raised to the Postgres count, never lowered: votes
+    reach Redis first, so a Redis count that is ahead is expected while
+    they are being persisted.
+    """
+
+    def __init__(self, choices: list[str], sessions: VoteSessions):
+        self.choices = choices
+        self.sessions = sessions
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """Forget everything; the next pass recounts the whole session."""
+        self._session: int | None = None
+        self._settled: dict[str, int] = {}
+        self._settled_id = 0
+        self._seen_id = 0
+
+    async def _full_count(self, conn, session: int) -> dict[str, int]:
+        result = await conn.execute(
+            select(Vote.choice, func.count(), func.max(Vote.id))
+            .where(Vote.session_id == session)
+            .group_by(Vote.choice)
+        )
+        counts = dict.fromkeys(self.choices, 0)
+        max_id = 0
+        for choice, count, high in result.all():
+            counts[choice] = count
+            max_id = max(max_id, high)
+
+        self._session = session
+        self._settled = counts
+        self._settled_id = self._seen_id = max_id
+        return dict(counts)
+
+    async def _incremental_count(self, conn, session: int) -> dict[str, int]:
+        result = await conn.execute(
+            select(
+                Vote.choice,
+                func.count(),
+                func.count().filter(Vote.id <= self._seen_id),
+                func.max(Vote.id),
+            )
+            .where(Vote.session_id == session, Vote.id > self._settled_id)
+            .group_by(Vote.choice)
+        )
+        counts = dict(self._settled)
+        seen_id = self._seen_id
+        for choice, count, settled, high in result.all():
+            counts[choice] = counts.get(choice, 0) + count
+            self._settled[choice] = self._settled.get(choice, 0) + settled
+            seen_id = max(seen_id, high)
+
+        self._settled_id = self._seen_id
+        self._seen_id = seen_id
+        return counts
+
+    async def count_postgres(self, session: int) -> tuple[str, dict[str, int]]:
+        async with async_engine.connect() as conn:
+            if self._session == session:
+                return "incremental", await self._incremental_count(conn, session)
+            return "full", await self._full_count(conn, session)
+
+    async def reconcile(self) -> dict:
+        """Bring the Redis tally up to the Postgres count and record drift."""
+        start = time.perf_counter()
+
+        # Also puts the session pointer back if Redis restarted.
+        session = await self.sessions.refresh()
+        mode, postgres = await self.count_postgres(session)
+        before = await raise_vote_counts(session, {choice: postgres.get(choice, 0) for choice in self.choices})
+
+        vote_reconcile_seconds.labels(mode=mode).observe(time.perf_counter() - start)
+        if before is None:
+            # A new session started while Postgres was being counted.
+            return {"status": "skipped", "reason": "session changed during reconciliation"}
+
+        restored = {}
+        for choice in self.choices:
+            vote_tally_drift.labels(choice=choice).set(before[choice] - postgres.get(choice, 0))
+            missing = postgres.get(choice, 0) - before[choice]
+            if missing > 0:
+                restored[choice] = missing
+                vote_reconcile_corrections_total.labels(choice=choice).inc(missing)
+
+        if restored:
+            logger.warning("Restored %d votes to the Redis tally from Postgres: %s", sum(restored.values()), restored)
+
+        return {
+            "status": "ok",
+            "session": session,
+            "mode": mode,
+            "watermark": self._seen_id,
+            "postgres": postgres,
+            "redis": before,
+            "restored": restored,
+        }
+
+    async def reconcile_forever(self, interval: float = VOTE_RECONCILE_INTERVAL_SECONDS) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reconcile()
+            except Exception:
+                logger.exception("Vote tally reconciliation failed")
@@ -1,29 +1,408 @@
+import asyncio
+import hashlib
+import logging
 import os
+import time
 
-import redis
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.exceptions import NoScriptError, ResponseError
+
+from app.metrics import redis_pool_wait_seconds
+
+logger = logging.getLogger(__name__)
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", "20"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "2"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "2"))
+REDIS_SOCKET_CONNECT_TIMEOUT = float(os.getenv("REDIS_SOCKET_CONNECT_TIMEOUT", "2"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+REDIS_POOL_PREWARM = int(os.getenv("REDIS_POOL_PREWARM", str(REDIS_POOL_SIZE)))
+VOTE_TIMELINE_SECOND_TTL = int(os.getenv("VOTE_TIMELINE_SECOND_TTL", "7200"))
+VOTE_TIMELINE_MINUTE_TTL = int(os.getenv("VOTE_TIMELINE_MINUTE_TTL", "604800"))
 
-redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+# Votes are counted per session; /admin/reset starts a new one by moving
+# VOTE_SESSION_KEY instead of deleting anything. Per-session keys look like
+# session:<id>:<name>.
+VOTE_SESSION_KEY = "vote_session"
+VOTE_COUNTS_NAME = "vote_counts"
+VOTE_VERSION_KEY = "vote_counts_version"
+VOTE_UPDATES_CHANNEL = "vote_updates"
 
+# Per-choice vote counts bucketed by time: session:<id>:vote_timeline:<resolution>:<bucket start>,
+# kept at 1s and 60s resolution.
+VOTE_TIMELINE_NAME = "vote_timeline"
+TIMELINE_RESOLUTIONS = (1, 60)
+
+# Pre-session tally hash and per-choice counters (vote:<choice>), folded into
+# the current session's tally on startup.
+LEGACY_VOTE_COUNTS_KEY = "vote_counts"
 VOTE_PREFIX = "vote:"
 
+# Votes that could not be written to Postgres, one stream entry per row,
+# waiting for the replay consumer group.
+VOTE_FALLBACK_STREAM = "vote_fallback"
+VOTE_FALLBACK_GROUP = "vote_replay"
+
+# Created in init_redis() from the app lifespan; tests patch it directly.
+redis_client: Redis | None = None
+health_client: Redis | None = None
+
+
+class InstrumentedConnectionPool(BlockingConnectionPool):
+    """Blocking pool that records how long callers wait for a connection."""
+
+    async def get_connection(self, command_name, *keys, **options):
+        start = time.perf_counter()
+        try:
+            return await super().get_connection(command_name, *keys, **options)
+        finally:
+            redis_pool_wait_seconds.observe(time.perf_counter() - start)
+
+
+class LuaScript:
+    """Runs a Lua script by SHA, loading it on first use or after SCRIPT FLUSH."""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.sha = hashlib.sha1(source.encode()).hexdigest()
+
+    async def __call__(self, keys: list[str], args: list):
+        try:
+            return await redis_client.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            return await redis_client.eval(self.source, len(keys), *keys, *args)
+
+
+# Count a vote in the session's tally and its per-second and per-minute
+# buckets, bump the version and notify subscribers in one atomic
+# round-trip. Refuses (returns nil) if the session is no longer current.
+_increment_script = LuaScript("""
+if redis.call('GET', KEYS[1]) ~= ARGV[5] then
+  return false
+end
+local count = redis.call('HINCRBY', KEYS[2], ARGV[1], 1)
+redis.call('INCR', KEYS[3])
+redis.call('HINCRBY', KEYS[4], ARGV[1], 1)
+redis.call('EXPIRE', KEYS[4], ARGV[3])
+redis.call('HINCRBY', KEYS[5], ARGV[1], 1)
+redis.call('EXPIRE', KEYS[5], ARGV[4])
+redis.call('PUBLISH', ARGV[2], ARGV[1])
+return count
+""")
+
+# KEYS[1] is the session tally, KEYS[2] its version, KEYS[3] the pre-session
+# tally hash and KEYS[4..n] the legacy keys matching ARGV[1..n-3].
+_migrate_script = LuaScript("""
+local moved = 0
+local old = redis.call('HGETALL', KEYS[3])
+for i = 1, #old, 2 do
+  redis.call('HINCRBY', KEYS[1], old[i], tonumber(old[i + 1]))
+end
+if #old > 0 then
+  redis.call('DEL', KEYS[3])
+  moved = moved + 1
+end
+for i, choice in ipairs(ARGV) do
+  local legacy = KEYS[i + 3]
+  local value = redis.call('GET', legacy)
+  if value then
+    redis.call('HINCRBY', KEYS[1], choice, tonumber(value))
+    redis.call('DEL', legacy)
+    moved = moved + 1
+  end
+end
+if moved > 0 then
+  redis.call('INCR', KEYS[2])
+end
+return moved
+""")
+
+# Point VOTE_SESSION_KEY at session ARGV[1] unless it already names that
+# session or a later one; zero the new tally (keeping any counts it has)
+# and tell /stream clients.
+_activate_script = LuaScript("""
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if current >= tonumber(ARGV[1]) then
+  return 0
+end
+redis.call('SET', KEYS[1], ARGV[1])
+redis.call('INCR', KEYS[2])
+for i = 3, #ARGV do
+  redis.call('HSETNX', KEYS[3], ARGV[i], 0)
+end
+redis.call('PUBLISH', ARGV[2], 'reset')
+return 1
+""")
+
+# Raise each choice in the session's tally to at least the given count
+# (ARGV pairs after the session and channel), unless the session changed.
+# Returns the counts as they were before, or nil if the session moved on.
+_raise_script = LuaScript("""
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+  return false
+end
+local before = {}
+local changed = 0
+for i = 3, #ARGV, 2 do
+  local current = tonumber(redis.call('HGET', KEYS[2], ARGV[i]) or '0')
+  local target = tonumber(ARGV[i + 1])
+  before[#before + 1] = current
+  if current < target then
+    redis.call('HINCRBY', KEYS[2], ARGV[i], target - current)
+    changed = changed + 1
+  end
+end
+if changed > 0 then
+  redis.call('INCR', KEYS[3])
+  redis.call('PUBLISH', ARGV[2], 'reconcile')
+end
+return before
+""")
+
+
+class SessionChanged(Exception):
+    """The session an operation was aimed at is no longer the current one."""
+
+    def __init__(self, current: int | None):
+        super().__init__(f"current vote session is {current}")
+        self.current = current
+
+
+async def init_redis() -> Redis:
+    global redis_client, health_client
+    pool = InstrumentedConnectionPool.from_url(
+        REDIS_URL,
+        max_connections=REDIS_POOL_SIZE,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_SOCKET_CONNECT_TIMEOUT,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        decode_responses=True,
+    )
+    redis_client = Redis.from_pool(pool)
+    # The health monitor pings over a connection of its own, so it never
+    # waits on (or takes from) the pool votes use.
+    health_client = Redis.from_url(
+        REDIS_URL,
+        single_connection_client=True,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_SOCKET_CONNECT_TIMEOUT,
+        decode_responses=True,
+    )
+    return redis_client
+
+
+async def close_redis() -> None:
+    global redis_client, health_client
+    if redis_client is not None:
+        await redis_client.aclose()
+        redis_client = None
+    if health_client is not None:
+        await health_client.aclose()
+        health_client = None
+
+
+async def warm_pool(count: int = REDIS_POOL_PREWARM) -> int:
+    """Open ``count`` pooled connections at once; returns how many opened."""
+    pool = redis_client.connection_pool
+    results = await asyncio.gather(*(pool.get_connection("PING") for _ in range(count)), return_exceptions=True)
+    connections = [result for result in results if not isinstance(result, Exception)]
+    for connection in connections:
+        await pool.release(connection)
+    if len(connections) < count:
+        failed = next(result for result in results if isinstance(result, Exception))
+        logger.warning("Pre-warming the Redis pool: %d of %d connections failed: %r",
+                       count - len(connections), count, failed)
+    return len(connections)
+
+
+def pool_stats() -> dict[str, int]:
+    """Connection counts for the Redis pool, for the metrics endpoint."""
+    pool = getattr(redis_client, "connection_pool", None)
+    if not isinstance(pool, BlockingConnectionPool):
+        return {"in_use": 0, "available": 0, "max": 0}
+    return {
+        "in_use": len(pool._in_use_connections),
+        "available": len(pool._available_connections),
+        "max": pool.max_connections,
+    }
+
+
+async def ping() -> bool:
+    return await (health_client or redis_client).ping()
+
+
+def session_key(session: int, name: str) -> str:
+    return f"session:{session}:{name}"
+
+
+def timeline_key(session: int, resolution: int, bucket: int) -> str:
+    return session_key(session, f"{VOTE_TIMELINE_NAME}:{resolution}:{bucket}")
+
+
+async def get_session() -> int | None:
+    """The session Redis is counting, or None if Redis lost it (e.g. restarted)."""
+    value = await redis_client.get(VOTE_SESSION_KEY)
+    return int(value) if value is not None else None
+
+
+async def activate_session(session: int, choices: list[str]) -> bool:
+    """Make ``session`` current unless a later one already is. Returns True if it moved."""
+    return bool(await _activate_script(
+        keys=[VOTE_SESSION_KEY, VOTE_VERSION_KEY, session_key(session, VOTE_COUNTS_NAME)],
+        args=[session, VOTE_UPDATES_CHANNEL, *choices],
+    ))
+
+
+async def increment_vote(session: int, choice: str) -> int:
+    """Count a vote in ``session``; raises SessionChanged if it is not current."""
+    now = int(time.time())
+    count = await _increment_script(
+        keys=[
+            VOTE_SESSION_KEY,
+            session_key(session, VOTE_COUNTS_NAME),
+            VOTE_VERSION_KEY,
+            timeline_key(session, 1, now),
+            timeline_key(session, 60, now - now % 60),
+        ],
+        args=[choice, VOTE_UPDATES_CHANNEL, VOTE_TIMELINE_SECOND_TTL, VOTE_TIMELINE_MINUTE_TTL, session],
+    )
+    if count is None:
+        raise SessionChanged(await get_session())
+    return count
+
+
+async def get_vote_counts(session: int) -> dict[str, int]:
+    return {
+        choice: int(count)
+        for choice, count in (await redis_client.hgetall(session_key(session, VOTE_COUNTS_NAME))).items()
+    }
+
+
+async def get_tally(session: int) -> tuple[int, dict[str, int]]:
+    """Read the tally version and counts atomically in one round-trip.
+
+    Raises SessionChanged if ``session`` is not the current session.
+    """
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.get(VOTE_SESSION_KEY)
+        pipe.get(VOTE_VERSION_KEY)
+        pipe.hgetall(session_key(session, VOTE_COUNTS_NAME))
+        current, version, counts = await pipe.execute()
+    if current != str(session):
+        raise SessionChanged(int(current) if current is not None else None)
+    return int(version or 0), {choice: int(count) for choice, count in counts.items()}
+
+
+async def get_timeline_buckets(session: int, resolution: int, buckets: range) -> list[dict[str, int]]:
+    """Per-choice counts for each bucket start, read in one pipelined round-trip."""
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for bucket in buckets:
+            pipe.hgetall(timeline_key(session, resolution, bucket))
+        results = await pipe.execute()
+    return [{choice: int(count) for choice, count in result.items()} for result in results]
+
+
+async def raise_vote_counts(session: int, counts: dict[str, int]) -> dict[str, int] | None:
+    """Raise the session's tally to at least ``counts``, atomically.
+
+    Counts already above the target are left alone: votes reach Redis before
+    Postgres, so a higher Redis count is normal. Returns the tally as it was
+    before, or None if ``session`` is no longer current.
+    """
+    args = [session, VOTE_UPDATES_CHANNEL]
+    for choice, count in counts.items():
+        args += [choice, count]
+    before = await _raise_script(
+        keys=[VOTE_SESSION_KEY, session_key(session, VOTE_COUNTS_NAME), VOTE_VERSION_KEY],
+        args=args,
+    )
+    if before is None:
+        return None
+    return dict(zip(counts, (int(count) for count in before)))
+
+
+async def drop_sessions(sessions: list[int]) -> None:
+    """Remove the tallies of purged sessions; their timeline buckets expire on their own."""
+    if sessions:
+        await redis_client.unlink(*(session_key(session, VOTE_COUNTS_NAME) for session in sessions))
+
+
+async def ensure_fallback_group() -> None:
+    try:
+        await redis_client.xgroup_create(VOTE_FALLBACK_STREAM, VOTE_FALLBACK_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+async def append_fallback_votes(entries: list[dict[str, str]]) -> None:
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for entry in entries:
+            pipe.xadd(VOTE_FALLBACK_STREAM, entry)
+        await pipe.execute()
+
+
+async def read_fallback_votes(consumer: str, count: int, min_idle_ms: int) -> list[tuple[str, dict[str, str]]]:
+    """Up to ``count`` entries for ``consumer`` to replay.
+
+    Its own unacknowledged entries come first (a replay that failed),
+    then entries another consumer left unacknowledged for ``min_idle_ms``
+    (it crashed mid-batch), then new ones.
+    """
+    pending = await redis_client.xpending_range(
+        VOTE_FALLBACK_STREAM, VOTE_FALLBACK_GROUP, min="-", max="+", count=count, consumername=consumer
+    )
+    if pending:
+        entries = await redis_client.xclaim(
+            VOTE_FALLBACK_STREAM, VOTE_FALLBACK_GROUP, consumer, 0, [entry["message_id"] for entry in pending]
+        )
+    else:
+        _, entries, _ = await redis_client.xautoclaim(
+            VOTE_FALLBACK_STREAM, VOTE_FALLBACK_GROUP, consumer, min_idle_ms, start_id="0-0", count=count
+        )
+
+    # Pending entries that were deleted come back without fields; settle them
+    # so they are not claimed forever.
+    deleted = [entry_id for entry_id, fields in entries if not fields]
+    if deleted:
+        await redis_client.xack(VOTE_FALLBACK_STREAM, VOTE_FALLBACK_GROUP, *deleted)
+    entries = [(entry_id, fields) for entry_id, fields in entries if fields]
+    if entries:
+        return entries
+
+    streams = await redis_client.xreadgroup(VOTE_FALLBACK_GROUP, consumer, {VOTE_FALLBACK_STREAM: ">"}, count=count)
+    return streams[0][1] if streams else []
+
+
+async def ack_fallback_votes(ids: list[str]) -> None:
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.xack(VOTE_FALLBACK_STREAM, VOTE_FALLBACK_GROUP, *ids)
+        pipe.xdel(VOTE_FALLBACK_STREAM, *ids)
+        await pipe.execute()
+
+
+async def fallback_backlog() -> int:
+    return await redis_client.xlen(VOTE_FALLBACK_STREAM)
 
-def increment_vote(choice: str) -> int:
-    key = f"{VOTE_PREFIX}{choice}"
-    return redis_client.incr(key)
 
+async def subscribe_vote_updates():
+    pubsub = redis_client.pubsub()
+    await pubsub.subscribe(VOTE_UPDATES_CHANNEL)
+    return pubsub
 
-def get_vote_counts() -> dict[str, int]:
-    keys = redis_client.keys(f"{VOTE_PREFIX}*")
-    counts = {}
-    for key in keys:
-        choice = key.replace(VOTE_PREFIX, "")
-        counts[choice] = int(redis_client.get(key) or 0)
-    return counts
 
+async def migrate_legacy_vote_keys(session: int, choices: list[str]) -> int:
+    """Fold pre-session tallies into ``session``'s tally.
 
-def reset_votes():
-    keys = redis_client.keys(f"{VOTE_PREFIX}*")
-    if keys:
-        redis_client.delete(*keys)
+    Covers both the old unnamespaced ``vote_counts`` hash and the older
+    ``vote:<choice>`` counters. Safe to run on every startup: keys are
+    deleted once migrated, so a second run is a no-op. Returns the number
+    of keys migrated.
+    """
+    return await _migrate_script(
+        keys=[session_key(session, VOTE_COUNTS_NAME), VOTE_VERSION_KEY, LEGACY_VOTE_COUNTS_KEY]
+        + [f"{VOTE_PREFIX}{choice}" for choice in choices],
+        args=choices,
+    )
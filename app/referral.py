@@ -1,35 +1,97 @@
+import os
 import time
+from collections import OrderedDict
+
 from sqlalchemy import select
 
-from app.database import engine
+from app.database import async_engine
+from app.metrics import (
+    referral_cache_evictions_total,
+    referral_cache_hits_total,
+    referral_cache_misses_total,
+    referral_cache_size,
+)
 from app.models import ReferralPartner
+from app.referral_index import referral_index
 
-# BUG: Unbounded cache - every referral validation adds an entry
-# In production, this would eventually cause OOM as traffic accumulates
-# For demo purposes, we fail fast after 10 entries to make it reproducible
-_referral_cache = []
+REFERRAL_CACHE_SIZE = int(os.getenv("REFERRAL_CACHE_SIZE", "10000"))
+REFERRAL_CACHE_TTL = float(os.getenv("REFERRAL_CACHE_TTL", "300"))
+REFERRAL_CACHE_NEGATIVE_TTL = float(os.getenv("REFERRAL_CACHE_NEGATIVE_TTL", "60"))
 
 
-def validate_referral(code: str):
-    # Cache the validation result (seems like a good optimization, right?)
-    cache_entry = {
-        "code": code,
-        "timestamp": time.time(),
-        "validated": True,
-    }
-    _referral_cache.append(cache_entry)
+class ReferralCache:
+    """LRU cache of referral lookups with a per-entry TTL.
 
-    # In real production: this list grows forever until OOM
-    # For demo: we fail after 10 entries to make the bug obvious
+    Invalid codes are cached too (with their own, usually shorter, TTL) so
+    repeated bad codes don't each cost a query against referral_partners.
+    """
 
-    if len(_referral_cache) > 10:
-        raise RuntimeError(
-            f"Service degraded: referral cache exhausted ({len(_referral_cache)} entries). "
-            "This simulates memory pressure from an unbounded cache."
-        )
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, code: str) -> tuple[bool, object]:
+        entry = self._entries.get(code)
+        if entry is None:
+            referral_cache_misses_total.inc()
+            return False, None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[code]
+            referral_cache_evictions_total.labels(reason="expired").inc()
+            referral_cache_size.set(len(self._entries))
+            referral_cache_misses_total.inc()
+            return False, None
+
+        self._entries.move_to_end(code)
+        referral_cache_hits_total.labels(result="valid" if value else "invalid").inc()
+        return True, value
+
+    def set(self, code: str, value) -> None:
+        if self.maxsize <= 0:
+            return
+
+        ttl = self.ttl if value else self.negative_ttl
+        self._entries[code] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(code)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            referral_cache_evictions_total.labels(reason="size").inc()
 
-    with engine.connect() as conn:
-        result = conn.execute(
+        referral_cache_size.set(len(self._entries))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        referral_cache_size.set(0)
+
+
+_referral_cache = ReferralCache(
+    maxsize=REFERRAL_CACHE_SIZE,
+    ttl=REFERRAL_CACHE_TTL,
+    negative_ttl=REFERRAL_CACHE_NEGATIVE_TTL,
+)
+
+
+async def validate_referral(code: str):
+    if not referral_index.might_contain(code):
+        return None
+
+    hit, partner = _referral_cache.get(code)
+    if hit:
+        return partner
+
+    async with async_engine.connect() as conn:
+        result = await conn.execute(
             select(ReferralPartner).where(ReferralPartner.code == code)
         )
-        return result.scalar_one_or_none()
+        partner = result.scalar_one_or_none()
+
+    _referral_cache.set(code, partner)
+    return partner
@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import time
+
+from sqlalchemy import func, select
+
+from app.database import engine
+from app.metrics import (
+    referral_index_build_seconds,
+    referral_index_bytes,
+    referral_index_entries,
+    referral_index_lookups_total,
+)
+from app.models import ReferralPartner
+
+logger = logging.getLogger(__name__)
+
+REFERRAL_INDEX_ENABLED = os.getenv("REFERRAL_INDEX_ENABLED", "false").lower() == "true"
+REFERRAL_INDEX_REFRESH_SECONDS = float(os.getenv("REFERRAL_INDEX_REFRESH_SECONDS", "30"))
+REFERRAL_INDEX_FALSE_POSITIVE_RATE = float(os.getenv("REFERRAL_INDEX_FALSE_POSITIVE_RATE", "0.001"))
+
+# Leave room for codes added after startup before the filter has to be rebuilt.
+CAPACITY_HEADROOM = 1.5
+LOAD_BATCH_SIZE = 10_000
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings using double hashing."""
+
+    def __init__(self, capacity: int, false_positive_rate: float):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.num_bits = max(8, int(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value: str):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, value: str) -> None:
+        for pos in self._positions(value):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.bits)
+
+
+class ReferralIndex:
+    """In-memory prefilter over every code in referral_partners.
+
+    A miss in the Bloom filter means the code definitely does not exist, so
+    the caller can reject it without a database round-trip. A hit only means
+    "maybe" and still has to be confirmed against Postgres.
+    """
+
+    def __init__(self, false_positive_rate: float = REFERRAL_INDEX_FALSE_POSITIVE_RATE):
+        self.false_positive_rate = false_positive_rate
+        self._filter: BloomFilter | None = None
+        # Ids aren't handed out in commit order, so a row can become visible
+        # after a higher id was already loaded. Like the reconciler, every
+        # refresh re-reads from the previous pass's high-water mark: rows up
+        # to _settled_id have been loaded (there are _settled_rows of them),
+        # rows up to _seen_id get one more look.
+        self._settled_id = 0
+        self._settled_rows = 0
+        self._seen_id = 0
+
+    def might_contain(self, code: str) -> bool:
+        """Return False only when the code is known not to exist.
+
+        Before the first build completes every code is a "maybe".
+        """
+        bloom = self._filter
+        if bloom is None:
+            return True
+        if code in bloom:
+            referral_index_lookups_total.labels(result="maybe").inc()
+            return True
+        referral_index_lookups_total.labels(result="absent").inc()
+        return False
+
+    def _load(self, bloom: BloomFilter, after_id: int, split_id: int = 0) -> tuple[int, int, int]:
+        """Add every code with an id above ``after_id``.
+
+        Returns how many rows were read, how many of those had an id up to
+        ``split_id``, and the highest id read (``after_id`` if none).
+        """
+        rows = below_split = 0
+        highest_id = after_id
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=LOAD_BATCH_SIZE).execute(
+                select(ReferralPartner.id, ReferralPartner.code)
+                .where(ReferralPartner.id > after_id)
+                .order_by(ReferralPartner.id)
+            )
+            for row_id, code in result:
+                bloom.add(code)
+                rows += 1
+                if row_id <= split_id:
+                    below_split += 1
+                highest_id = row_id
+        return rows, below_split, highest_id
+
+    def _highest_id(self) -> int:
+        with engine.connect() as conn:
+            return conn.execute(
+                select(ReferralPartner.id).order_by(ReferralPartner.id.desc()).limit(1)
+            ).scalar() or 0
+
+    def _row_count(self) -> int:
+        with engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(ReferralPartner)).scalar()
+
+    def build(self) -> None:
+        """Load every code from scratch and swap in the new filter."""
+        start = time.perf_counter()
+
+        highest_id = self._highest_id()
+        bloom = BloomFilter(int(highest_id * CAPACITY_HEADROOM) + LOAD_BATCH_SIZE, self.false_positive_rate)
+        rows, _, highest_id = self._load(bloom, 0)
+
+        self._filter = bloom
+        self._settled_id = self._seen_id = highest_id
+        self._settled_rows = rows
+
+        duration = time.perf_counter() - start
+        referral_index_build_seconds.set(duration)
+        referral_index_bytes.set(bloom.nbytes)
+        referral_index_entries.set(rows)
+        logger.info("Referral index built: %d codes, %d bytes, %.2fs", rows, bloom.nbytes, duration)
+
+    def refresh(self) -> None:
+        """Add codes committed since the last build or refresh.
+
+        Rows that commit within one refresh interval of a higher id are
+        picked up by the re-read. Anything later, a delete or a reseed shows
+        up as a row count that doesn't add up, and the filter is rebuilt.
+        """
+        bloom = self._filter
+        if bloom is None:
+            self.build()
+            return
+
+        rows, settling, highest_id = self._load(bloom, self._settled_id, self._seen_id)
+        total = self._row_count()
+        if total != self._settled_rows + rows:
+            logger.info("Referral index: %d rows expected, %d found; rebuilding",
+                        self._settled_rows + rows, total)
+            self.build()
+            return
+
+        self._settled_id, self._settled_rows = self._seen_id, self._settled_rows + settling
+        self._seen_id = max(self._seen_id, highest_id)
+        referral_index_entries.set(total)
+
+        if total > bloom.capacity:
+            # Past capacity the false-positive rate climbs quickly; start over.
+            self.build()
+
+    async def refresh_forever(self, interval: float = REFERRAL_INDEX_REFRESH_SECONDS) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception:
+                logger.exception("Referral index refresh failed")
+
+
+referral_index = ReferralIndex()
@@ -0,0 +1,57 @@
+"""Container entrypoint: serves the app under uvicorn with WEB_CONCURRENCY workers.
+
+    python -m app.server
+
+Nothing from ``app`` may be imported here: PROMETHEUS_MULTIPROC_DIR has to
+be in the environment before prometheus_client is first imported, and the
+workers inherit it.
+"""
+
+import os
+
+import uvicorn
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+DEFAULT_MULTIPROC_DIR = "/tmp/prometheus-multiproc"
+# Peers whose X-Forwarded-For is believed: the ingress controller's pods.
+# uvicorn takes the client from the right of the header, skipping these,
+# so an address a voter writes into the header themselves is never used.
+# The default is k3s's pod CIDR; never use "*", which trusts every peer.
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1,10.42.0.0/16")
+
+
+def prepare_metrics_dir(workers: int) -> str | None:
+    """Point prometheus_client at an empty directory when running several workers."""
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if not path and workers > 1:
+        path = os.environ["PROMETHEUS_MULTIPROC_DIR"] = DEFAULT_MULTIPROC_DIR
+    if not path:
+        return None
+
+    # Files from a previous run (the /tmp emptyDir outlives container
+    # restarts) would be merged in as if those workers were still serving.
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith(".db"):
+            os.remove(os.path.join(path, name))
+    return path
+
+
+def main() -> None:
+    prepare_metrics_dir(WEB_CONCURRENCY)
+    uvicorn.run(
+        "app.main:app",
+        host=HOST,
+        port=PORT,
+        workers=WEB_CONCURRENCY,
+        # request.client is the address the ingress saw the voter connect
+        # from, which the per-client vote rate limit is keyed on.
+        proxy_headers=True,
+        forwarded_allow_ips=FORWARDED_ALLOW_IPS,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, select, update
+
+from app.database import async_engine
+from app.models import Vote, VoteSession
+from app.redis_client import SessionChanged, activate_session, drop_sessions, get_session
+
+logger = logging.getLogger(__name__)
+
+VOTE_SESSION_KEEP = int(os.getenv("VOTE_SESSION_KEEP", "5"))
+VOTE_SESSION_PURGE_BATCH_SIZE = int(os.getenv("VOTE_SESSION_PURGE_BATCH_SIZE", "5000"))
+VOTE_SESSION_PURGE_INTERVAL_SECONDS = float(os.getenv("VOTE_SESSION_PURGE_INTERVAL_SECONDS", "300"))
+
+# Pause between purge batches so live inserts always get a pooled connection.
+PURGE_BATCH_PAUSE = 0.05
+
+
+def purge_batch(cutoff: int, batch_size: int):
+    """DELETE of up to ``batch_size`` votes from sessions up to ``cutoff``."""
+    return delete(Vote).where(Vote.id.in_(select(Vote.id).where(Vote.session_id <= cutoff).limit(batch_size)))
+
+
+class VoteSessions:
+    """Tracks which session votes are counted in.
+
+    The newest ``vote_sessions`` row is the current session; Redis holds a
+    pointer to it that the vote path checks atomically, and this process
+    caches it. Starting a session is one INSERT plus moving the pointer, so
+    a reset never touches existing votes. Sessions older than the newest
+    ``keep`` are purged in the background in small batches.
+    """
+
+    def __init__(self, choices: list[str], keep: int = VOTE_SESSION_KEEP):
+        self.choices = choices
+        self.keep = keep
+        self._current: int | None = None
+
+    async def current(self) -> int:
+        if self._current is None:
+            return await self.refresh()
+        return self._current
+
+    async def refresh(self) -> int:
+        """Re-read the current session, restoring Redis's pointer if it was lost."""
+        session = await get_session()
+        if session is None:
+            async with async_engine.connect() as conn:
+                latest = (await conn.execute(select(func.max(VoteSession.id)))).scalar() or 1
+            await activate_session(latest, self.choices)
+            session = await get_session()
+        self._current = session
+        return session
+
+    async def call(self, operation, *args):
+        """Run ``operation(session, *args)`` on the current session.
+
+        Retries once on the new session if a reset landed since this process
+        last looked. Returns ``(session, result)``.
+        """
+        session = await self.current()
+        try:
+            return session, await operation(session, *args)
+        except SessionChanged:
+            session = await self.refresh()
+            return session, await operation(session, *args)
+
+    async def start_new(self, name: str | None = None) -> int:
+        async with async_engine.begin() as conn:
+            session = (await conn.execute(
+                insert(VoteSession).values(name=name, started_at=datetime.utcnow()).returning(VoteSession.id)
+            )).scalar_one()
+        await activate_session(session, self.choices)
+        self._current = session
+        return session
+
+    async def list(self) -> list[dict]:
+        current = await self.current()
+        async with async_engine.connect() as conn:
+            rows = (await conn.execute(select(VoteSession).order_by(VoteSession.id.desc()))).all()
+        return [
+            {
+                "id": row.id,
+                "name": row.name,
+                "started_at": row.started_at.isoformat() if row.started_at else None,
+                "purged_at": row.purged_at.isoformat() if row.purged_at else None,
+                "current": row.id == current,
+            }
+            for row in rows
+        ]
+
+    async def purge(self, batch_size: int = VOTE_SESSION_PURGE_BATCH_SIZE) -> int:
+        """Delete votes of sessions older than the newest ``keep``; returns rows deleted."""
+        cutoff = await self.current() - self.keep
+        if cutoff < 1:
+            return 0
+
+        deleted = 0
+        while True:
+            # Short transactions keep locks and pool checkouts brief.
+            async with async_engine.begin() as conn:
+                result = await conn.execute(purge_batch(cutoff, batch_size))
+            deleted += result.rowcount
+            if result.rowcount < batch_size:
+                break
+            await asyncio.sleep(PURGE_BATCH_PAUSE)
+
+        async with async_engine.begin() as conn:
+            purged = (await conn.execute(
+                update(VoteSession)
+                .where(VoteSession.id <= cutoff, VoteSession.purged_at.is_(None))
+                .values(purged_at=datetime.utcnow())
+                .returning(VoteSession.id)
+            )).scalars().all()
+        await drop_sessions(list(purged))
+
+        if deleted or purged:
+            logger.info("Purged %d votes from %d old sessions", deleted, len(purged))
+        return deleted
+
+    async def purge_forever(self, interval: float = VOTE_SESSION_PURGE_INTERVAL_SECONDS) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.purge()
+            except Exception:
+                logger.exception("Old session purge failed")
+
+    def clear(self) -> None:
+        self._current = None
@@ -0,0 +1,33 @@
+import logging
+import time
+from contextlib import contextmanager
+
+from app.metrics import startup_phase_seconds
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Times the phases of app startup into startup_phase_seconds{phase}."""
+
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+            startup_phase_seconds.labels(phase=name).set(self.phases[name])
+
+    def finish(self) -> float:
+        total = time.perf_counter() - self._started
+        startup_phase_seconds.labels(phase="total").set(total)
+        logger.info(
+            "Started in %.3fs (%s)", total,
+            ", ".join(f"{name} {seconds:.3f}s" for name, seconds in self.phases.items()),
+        )
+        return total
@@ -68,6 +68,10 @@ document.addEventListener('DOMContentLoaded', function() {
     fetchConfig();
 
     let sseRetryCount = 0;
+    // Full tally as last received; /stream sends it once, then deltas
+    // tagged with event ids we echo back when reconnecting.
+    let tally = null;
+    let lastEventId = null;
 
     function updateResults(data) {
         let total = 0;
@@ -95,14 +99,63 @@ document.addEventListener('DOMContentLoaded', function() {
         totalCountEl.textContent = total;
     }
 
+    // Votes-over-time sparkline, read from the Redis rollups behind
+    // /votes/timeline. Redrawn at most once per step while votes arrive.
+    const sparklineLine = document.getElementById('sparkline-line');
+    const TIMELINE_STEP = 10;
+    let timelinePending = null;
+
+    async function refreshTimeline() {
+        timelinePending = null;
+        try {
+            const response = await fetch('/votes/timeline?step=' + TIMELINE_STEP);
+            if (!response.ok) return;
+            const data = await response.json();
+            const totals = data.timestamps.map((_, i) =>
+                Object.values(data.series).reduce((sum, counts) => sum + counts[i], 0));
+            const peak = Math.max(1, ...totals);
+            const width = totals.length > 1 ? 600 / (totals.length - 1) : 600;
+            sparklineLine.setAttribute('points', totals
+                .map((total, i) => (i * width).toFixed(1) + ',' + (40 - (total / peak) * 38).toFixed(1))
+                .join(' '));
+        } catch (err) {
+            console.error('Failed to fetch timeline:', err);
+        }
+    }
+
+    function scheduleTimeline() {
+        if (!timelinePending) {
+            timelinePending = setTimeout(refreshTimeline, TIMELINE_STEP * 1000);
+        }
+    }
+
+    function onStreamEvent(event) {
+        lastEventId = event.lastEventId || lastEventId;
+        updateResults(tally);
+        scheduleTimeline();
+        hideError();
+        sseRetryCount = 0;  // Reset retry count on success
+    }
+
     function connectSSE() {
-        const eventSource = new EventSource('/stream');
+        const url = lastEventId ? '/stream?last_event_id=' + encodeURIComponent(lastEventId) : '/stream';
+        const eventSource = new EventSource(url);
 
+        // Full tally with labels: on connect, or when the server can't
+        // resume from our last event id.
         eventSource.addEventListener('votes', function(event) {
-            const data = JSON.parse(event.data);
-            updateResults(data);
-            hideError();
-            sseRetryCount = 0;  // Reset retry count on success
+            tally = JSON.parse(event.data);
+            onStreamEvent(event);
+        });
+
+        // Only the choices whose count changed: {"choice": count, ...}
+        eventSource.addEventListener('delta', function(event) {
+            if (!tally) return;
+            const changes = JSON.parse(event.data);
+            Object.keys(changes).forEach(choice => {
+                if (tally[choice]) tally[choice].count = changes[choice];
+            });
+            onStreamEvent(event);
         });
 
         eventSource.onerror = function(err) {
@@ -125,7 +178,7 @@ document.addEventListener('DOMContentLoaded', function() {
             });
             if (response.ok) {
                 const data = await response.json();
-                updateResults(data);
+                if (!tally) updateResults(data);
                 hideError();
             } else if (response.status === 500) {
                 showError('⚠️ DATABASE ERROR! Connection pool may be exhausted.');
@@ -143,5 +196,7 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     fetchInitialResults();
+    refreshTimeline();
+    setInterval(scheduleTimeline, 60000);  // keep the window sliding when nobody votes
     connectSSE();
 });
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, replace
+
+from sse_starlette.sse import ServerSentEvent
+
+from app.redis_client import get_tally
+from app.sessions import VoteSessions
+
+TALLY_MAX_AGE_SECONDS = float(os.getenv("TALLY_MAX_AGE_SECONDS", "1"))
+
+
+@dataclass(frozen=True)
+class TallySnapshot:
+    """One immutable, pre-encoded view of the vote counts.
+
+    ``version`` comes from Redis and increases with every vote, so two
+    snapshots with the same version carry the same counts. It doubles as
+    the /stream event id, which is why every worker agrees on it.
+    """
+
+    version: int
+    counts: dict[str, int]
+    body: bytes
+    etag: str
+    event: bytes
+    taken_at: float
+
+    @property
+    def event_id(self) -> str:
+        return str(self.version)
+
+    def matches(self, if_none_match: str) -> bool:
+        """True if an If-None-Match header already names this snapshot."""
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or self.etag in tags
+
+
+def delta_event(previous: TallySnapshot, current: TallySnapshot) -> bytes:
+    """SSE event carrying only the counts that differ from ``previous``, without labels."""
+    changed = {
+        choice: count for choice, count in current.counts.items()
+        if previous.counts.get(choice) != count
+    }
+    return ServerSentEvent(
+        data=json.dumps(changed, separators=(",", ":")), event="delta", id=current.event_id
+    ).encode()
+
+
+class TallyCache:
+    """Holds the latest TallySnapshot of the current session for /votes and /stream.
+
+    The SSE broadcaster refreshes it whenever a vote is published, so
+    /votes can answer straight from memory. A snapshot older than
+    ``max_age`` is refreshed on read, which bounds staleness even when
+    nothing else is refreshing it.
+    """
+
+    def __init__(self, choices: list[str], labels: dict[str, str], sessions: VoteSessions,
+                 max_age: float = TALLY_MAX_AGE_SECONDS):
+        self.choices = choices
+        self.labels = labels
+        self.sessions = sessions
+        self.max_age = max_age
+        self._snapshot: TallySnapshot | None = None
+
+    def _build(self, version: int, counts: dict[str, int]) -> TallySnapshot:
+        result = {}
+        for choice in self.choices:
+            result[choice] = {
+                "count": counts.get(choice, 0),
+                "label": self.labels[choice]
+            }
+        data = json.dumps(result, separators=(",", ":"))
+        body = data.encode()
+        return TallySnapshot(
+            version=version,
+            counts={choice: counts.get(choice, 0) for choice in self.choices},
+            body=body,
+            etag=f'"{version}-{hashlib.sha1(body).hexdigest()[:16]}"',
+            event=ServerSentEvent(data=data, event="votes", id=str(version)).encode(),
+            taken_at=time.monotonic(),
+        )
+
+    async def refresh(self) -> TallySnapshot:
+        _, (version, counts) = await self.sessions.call(get_tally)
+        current = self._snapshot
+        if current is not None and current.version == version:
+            self._snapshot = replace(current, taken_at=time.monotonic())
+        else:
+            self._snapshot = self._build(version, counts)
+        return self._snapshot
+
+    async def get(self) -> TallySnapshot:
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - snapshot.taken_at > self.max_age:
+            snapshot = await self.refresh()
+        return snapshot
+
+    def clear(self) -> None:
+        self._snapshot = None
@@ -0,0 +1,80 @@
+import json
+import os
+import time
+
+from app.redis_client import TIMELINE_RESOLUTIONS, get_timeline_buckets
+from app.sessions import VoteSessions
+
+TIMELINE_DEFAULT_WINDOW_SECONDS = int(os.getenv("TIMELINE_DEFAULT_WINDOW_SECONDS", "600"))
+TIMELINE_MAX_BUCKETS = int(os.getenv("TIMELINE_MAX_BUCKETS", "3600"))
+TIMELINE_CACHE_SECONDS = float(os.getenv("TIMELINE_CACHE_SECONDS", "1"))
+
+
+class VoteTimeline:
+    """Answers /votes/timeline from the Redis time buckets.
+
+    A window is aligned to ``step`` and read from the coarsest bucket
+    resolution that divides it, so an hour at one-minute steps costs 60
+    reads, not 3600. Rendered responses are cached for ``max_age`` seconds;
+    results pages that ask for the default window all share one entry.
+    """
+
+    def __init__(self, choices: list[str], sessions: VoteSessions, max_age: float = TIMELINE_CACHE_SECONDS,
+                 default_window: int = TIMELINE_DEFAULT_WINDOW_SECONDS, max_buckets: int = TIMELINE_MAX_BUCKETS):
+        self.choices = choices
+        self.sessions = sessions
+        self.max_age = max_age
+        self.default_window = default_window
+        self.max_buckets = max_buckets
+        self._cache: dict[tuple[int, int, int, int], tuple[float, bytes]] = {}
+
+    def window(self, start: int | None, end: int | None, step: int) -> tuple[int, int, int]:
+        """Validate and align a requested window; raises ValueError if it is unusable."""
+        if step < 1:
+            raise ValueError("step must be at least 1 second")
+        if end is None:
+            end = int(time.time())
+        if start is None:
+            start = end - self.default_window
+        if start > end:
+            raise ValueError("from must not be after to")
+
+        start -= start % step
+        end -= end % step
+        resolution = max(r for r in TIMELINE_RESOLUTIONS if step % r == 0)
+        if (end - start + step) // resolution > self.max_buckets:
+            raise ValueError(f"window too large; at most {self.max_buckets} buckets of {resolution}s")
+        return start, end, step
+
+    async def render(self, session: int, start: int, end: int, step: int) -> bytes:
+        resolution = max(r for r in TIMELINE_RESOLUTIONS if step % r == 0)
+        counts = await get_timeline_buckets(session, resolution, range(start, end + step, resolution))
+
+        timestamps = list(range(start, end + step, step))
+        series = {choice: [0] * len(timestamps) for choice in self.choices}
+        per_step = step // resolution
+        for i, bucket in enumerate(counts):
+            for choice, count in bucket.items():
+                if choice in series:
+                    series[choice][i // per_step] += count
+
+        return json.dumps(
+            {"session": session, "from": start, "to": end, "step": step, "timestamps": timestamps, "series": series},
+            separators=(",", ":"),
+        ).encode()
+
+    async def get(self, start: int | None, end: int | None, step: int) -> bytes:
+        key = (await self.sessions.current(), *self.window(start, end, step))
+        now = time.monotonic()
+        cached = self._cache.get(key)
+        if cached is not None and now - cached[0] <= self.max_age:
+            return cached[1]
+
+        body = await self.render(*key)
+        if len(self._cache) >= 256:
+            self._cache = {k: v for k, v in self._cache.items() if now - v[0] <= self.max_age}
+        self._cache[key] = (now, body)
+        return body
+
+    def clear(self) -> None:
+        self._cache.clear()
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime
+
+from redis.exceptions import RedisError
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.circuit_breaker import CircuitBreaker
+from app.database import async_engine
+from app.metrics import (
+    db_pool_timeout_total,
+    vote_fallback_backlog,
+    vote_fallback_replayed_total,
+    vote_fallback_writes_total,
+)
+from app.models import Vote
+from app.redis_client import (
+    ack_fallback_votes,
+    append_fallback_votes,
+    fallback_backlog,
+    read_fallback_votes,
+)
+
+logger = logging.getLogger(__name__)
+
+DB_BREAKER_FAILURE_THRESHOLD = int(os.getenv("DB_BREAKER_FAILURE_THRESHOLD", "3"))
+DB_BREAKER_RESET_SECONDS = float(os.getenv("DB_BREAKER_RESET_SECONDS", "10"))
+VOTE_REPLAY_BATCH_SIZE = int(os.getenv("VOTE_REPLAY_BATCH_SIZE", "500"))
+VOTE_REPLAY_INTERVAL_SECONDS = float(os.getenv("VOTE_REPLAY_INTERVAL_SECONDS", "1"))
+VOTE_REPLAY_CLAIM_IDLE_MS = int(os.getenv("VOTE_REPLAY_CLAIM_IDLE_MS", "60000"))
+
+# Errors that mean Postgres did not take the write.
+DB_WRITE_ERRORS = (DBAPIError, OSError, PoolTimeoutError)
+
+# Neither Postgres nor the fallback stream took the write.
+FALLBACK_ERRORS = (RedisError, OSError)
+
+
+def new_vote(choice: str, referral_code: str | None, session_id: int) -> dict:
+    return {
+        "session_id": session_id,
+        "choice": choice,
+        "referral_code": referral_code,
+        "created_at": datetime.utcnow(),
+        "idempotency_key": uuid.uuid4().hex,
+    }
+
+
+def insert_votes(rows: list[dict]):
+    """INSERT that skips rows whose idempotency key is already stored."""
+    return insert(Vote).values(rows).on_conflict_do_nothing(index_elements=["idempotency_key"])
+
+
+def _to_entry(row: dict) -> dict[str, str]:
+    return {
+        "idempotency_key": row["idempotency_key"],
+        "session_id": str(row["session_id"]),
+        "choice": row["choice"],
+        "referral_code": row["referral_code"] or "",
+        "created_at": row["created_at"].isoformat(),
+    }
+
+
+def _from_entry(entry: dict[str, str]) -> dict:
+    return {
+        "idempotency_key": entry["idempotency_key"],
+        "session_id": int(entry["session_id"]),
+        "choice": entry["choice"],
+        "referral_code": entry["referral_code"] or None,
+        "created_at": datetime.fromisoformat(entry["created_at"]),
+    }
+
+
+class VoteFallback:
+    """Writes votes to Postgres, or to a Redis Stream when Postgres is down.
+
+    A circuit breaker sits in front of Postgres: once it opens, writes go
+    straight to the stream instead of each waiting out the pool timeout.
+    ``replay_forever`` moves the stream back into ``votes`` in batches
+    through a consumer group. Every vote carries an idempotency key and
+    the INSERT skips keys already stored, so a batch replayed twice (or a
+    write that committed but reported failure) is never counted twice.
+    """
+
+    def __init__(self, breaker: CircuitBreaker, batch_size: int = VOTE_REPLAY_BATCH_SIZE,
+                 claim_idle_ms: int = VOTE_REPLAY_CLAIM_IDLE_MS, consumer: str | None = None):
+        self.breaker = breaker
+        self.batch_size = batch_size
+        self.claim_idle_ms = claim_idle_ms
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+
+    async def write(self, rows: list[dict]) -> bool:
+        """Persist ``rows``; returns True if they reached Postgres, False if they were spilled.
+
+        Raises one of FALLBACK_ERRORS if the stream could not take them either.
+        """
+        if self.breaker.allow():
+            try:
+                async with async_engine.begin() as conn:
+                    await conn.execute(insert_votes(rows))
+            except DB_WRITE_ERRORS:
+                db_pool_timeout_total.inc()
+                self.breaker.record_failure()
+                logger.warning("Writing %d votes to Postgres failed; spilling them to Redis", len(rows), exc_info=True)
+            else:
+                self.breaker.record_success()
+                return True
+
+        await self.spill(rows)
+        return False
+
+    async def spill(self, rows: list[dict]) -> None:
+        """Append ``rows`` to the stream without trying Postgres first."""
+        await append_fallback_votes([_to_entry(row) for row in rows])
+        vote_fallback_writes_total.inc(len(rows))
+
+    async def replay(self) -> int:
+        """Move one batch from the stream into Postgres; returns the rows replayed."""
+        entries = await read_fallback_votes(self.consumer, self.batch_size, self.claim_idle_ms)
+        if not entries:
+            return 0
+
+        try:
+            async with async_engine.begin() as conn:
+                await conn.execute(insert_votes([_from_entry(fields) for _, fields in entries]))
+        except DB_WRITE_ERRORS:
+            # The entries stay pending for this consumer and are retried first.
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+
+        await ack_fallback_votes([entry_id for entry_id, _ in entries])
+        vote_fallback_replayed_total.inc(len(entries))
+        return len(entries)
+
+    async def drain(self) -> int:
+        """Replay batches until the stream is empty or Postgres fails."""
+        replayed = 0
+        while self.breaker.allow():
+            count = await self.replay()
+            replayed += count
+            if count < self.batch_size:
+                break
+        if replayed:
+            logger.info("Replayed %d fallback votes into Postgres", replayed)
+        return replayed
+
+    async def replay_forever(self, interval: float = VOTE_REPLAY_INTERVAL_SECONDS) -> None:
+        while True:
+            try:
+                backlog = await fallback_backlog()
+                vote_fallback_backlog.set(backlog)
+                if backlog:
+                    await self.drain()
+                    vote_fallback_backlog.set(await fallback_backlog())
+            except Exception:
+                logger.exception("Replaying fallback votes failed")
+            await asyncio.sleep(interval)
+
+    def snapshot(self) -> dict:
+        return {"breaker": self.breaker.snapshot(), "consumer": self.consumer}
+
+
+db_breaker = CircuitBreaker("postgres", DB_BREAKER_FAILURE_THRESHOLD, DB_BREAKER_RESET_SECONDS)
+vote_fallback = VoteFallback(db_breaker)
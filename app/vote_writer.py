@@ -0,0 +1,176 @@
+import asyncio
+import contextlib
+import logging
+import os
+import time
+
+from app.metrics import (
+    vote_write_batch_size,
+    vote_write_flush_errors_total,
+    vote_write_flush_seconds,
+    vote_write_queue_depth,
+    vote_write_rejected_total,
+)
+from app.vote_fallback import FALLBACK_ERRORS, new_vote, vote_fallback
+
+logger = logging.getLogger(__name__)
+
+VOTE_WRITE_BEHIND_ENABLED = os.getenv("VOTE_WRITE_BEHIND_ENABLED", "false").lower() == "true"
+VOTE_WRITE_BATCH_SIZE = int(os.getenv("VOTE_WRITE_BATCH_SIZE", "500"))
+VOTE_WRITE_FLUSH_INTERVAL_MS = int(os.getenv("VOTE_WRITE_FLUSH_INTERVAL_MS", "50"))
+VOTE_WRITE_QUEUE_SIZE = int(os.getenv("VOTE_WRITE_QUEUE_SIZE", "10000"))
+VOTE_WRITE_ENQUEUE_TIMEOUT_MS = int(os.getenv("VOTE_WRITE_ENQUEUE_TIMEOUT_MS", "250"))
+VOTE_WRITE_SHUTDOWN_TIMEOUT = float(os.getenv("VOTE_WRITE_SHUTDOWN_TIMEOUT", "10"))
+
+MAX_RETRY_BACKOFF = 5.0
+# How long stop() gives the fallback stream to take what didn't drain.
+SPILL_TIMEOUT = 2.0
+
+
+class VoteQueueFull(Exception):
+    """Raised when the write-behind queue stays full past the enqueue timeout."""
+
+
+class VoteWriter:
+    """Buffers votes in memory and persists them with one INSERT per batch.
+
+    A batch is flushed as soon as ``batch_size`` rows are waiting or
+    ``flush_interval`` seconds after the first row arrived, whichever comes
+    first. Only the flusher holds a pooled connection, so request handlers
+    never wait on the database.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = VOTE_WRITE_BATCH_SIZE,
+        flush_interval: float = VOTE_WRITE_FLUSH_INTERVAL_MS / 1000,
+        max_queue: int = VOTE_WRITE_QUEUE_SIZE,
+        enqueue_timeout: float = VOTE_WRITE_ENQUEUE_TIMEOUT_MS / 1000,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.enqueue_timeout = enqueue_timeout
+        self._queue: asyncio.Queue | None = None
+        # Queue capacity, taken by reserve() before a vote is counted so a
+        # counted vote always has room to be persisted.
+        self._slots: asyncio.Semaphore | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+        # The batch being flushed; it has already left the queue.
+        self._in_flight: list[dict] = []
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_queue)
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = VOTE_WRITE_SHUTDOWN_TIMEOUT) -> None:
+        """Flush everything still queued, then stop the background task."""
+        if self._task is None:
+            return
+
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except TimeoutError:
+            await self._spill_unsaved(timeout)
+        self._task = None
+
+    async def _spill_unsaved(self, timeout: float) -> None:
+        # The flusher was cancelled mid-batch, so that batch may or may not
+        # have been committed. Spill it with the queue; replay skips the
+        # idempotency keys already stored.
+        unsaved = self._in_flight
+        while not self._queue.empty():
+            unsaved += self._drain()
+        self._in_flight = []
+        try:
+            await asyncio.wait_for(vote_fallback.spill(unsaved), SPILL_TIMEOUT)
+        except (TimeoutError, *FALLBACK_ERRORS):
+            logger.exception("Vote writer did not drain in %.1fs; %d votes lost", timeout, len(unsaved))
+            return
+        logger.warning("Vote writer did not drain in %.1fs; spilled %d votes to Redis", timeout, len(unsaved))
+
+    async def reserve(self) -> None:
+        """Take a queue slot for one vote, waiting up to ``enqueue_timeout``.
+
+        The slot must be filled with put() or handed back with release().
+        """
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.enqueue_timeout)
+        except TimeoutError:
+            vote_write_rejected_total.inc()
+            raise VoteQueueFull(f"Vote queue full ({self.max_queue} pending)")
+
+    def release(self) -> None:
+        self._slots.release()
+
+    def put(self, row: dict) -> None:
+        """Queue ``row`` in a slot taken with reserve()."""
+        self._queue.put_nowait(row)
+        depth = self._queue.qsize()
+        vote_write_queue_depth.set(depth)
+        if depth == 1 or depth >= self.batch_size:
+            self._wakeup.set()
+
+    async def enqueue(self, choice: str, referral_code: str | None, session_id: int) -> None:
+        await self.reserve()
+        self.put(new_vote(choice, referral_code, session_id))
+
+    def _drain(self) -> list[dict]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+            self._slots.release()
+        vote_write_queue_depth.set(self._queue.qsize())
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            if self._queue.empty():
+                if self._stopping:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            if not self._stopping and self._queue.qsize() < self.batch_size:
+                self._wakeup.clear()
+                with contextlib.suppress(TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+
+            self._in_flight = self._drain()
+            await self._flush(self._in_flight)
+            self._in_flight = []
+
+    async def _flush(self, batch: list[dict]) -> None:
+        backoff = 0.1
+        while True:
+            start = time.perf_counter()
+            try:
+                # Goes to the Redis fallback stream if Postgres is unavailable.
+                persisted = await vote_fallback.write(batch)
+            except FALLBACK_ERRORS:
+                # Neither Postgres nor Redis took it: keep the batch and
+                # retry; the bounded queue pushes back on new votes meanwhile.
+                vote_write_flush_errors_total.inc()
+                logger.exception("Failed to flush %d votes, retrying in %.1fs", len(batch), backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_RETRY_BACKOFF)
+                continue
+
+            if persisted:
+                vote_write_flush_seconds.observe(time.perf_counter() - start)
+                vote_write_batch_size.observe(len(batch))
+            return
+
+
+vote_writer = VoteWriter()
@@ -0,0 +1,171 @@
+"""Load and latency benchmarks for the vote API.
+
+    python -m benchmarks                       # all scenarios, stubbed Postgres + fakeredis
+    python -m benchmarks -s vote_burst -n 5000 -c 200 --write-behind
+    python -m benchmarks --db postgres --redis real   # DATABASE_URL / REDIS_URL from env
+    python -m benchmarks --url http://localhost:8000  # an already-running server
+    python -m benchmarks -s vote_burst --workers 1,2,4   # uvicorn worker processes; reports scaling
+
+Results are printed as JSON (or written to --output) so runs can be diffed
+between releases.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+
+import httpx
+
+from benchmarks.harness import parse_counters, percentiles
+from benchmarks.scenarios import SCENARIOS
+
+SERVER_COUNTERS = [
+    "db_pool_timeout_total",
+    "admission_rejected_total",
+    "vote_write_rejected_total",
+    "sse_updates_dropped_total",
+]
+
+
+def worker_counts(value: str) -> list[int]:
+    counts = [int(count) for count in value.split(",")]
+    if any(count < 1 for count in counts):
+        raise argparse.ArgumentTypeError("worker counts must be at least 1")
+    return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.split("\n")[0])
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run; repeat for several (default: all)")
+    parser.add_argument("-n", "--requests", type=int, default=2000, help="Requests per HTTP scenario")
+    parser.add_argument("-c", "--concurrency", type=int, default=100, help="Concurrent clients")
+    parser.add_argument("--listeners", type=int, default=200, help="SSE clients for sse_listeners")
+    parser.add_argument("--sse-votes", type=int, default=20, help="Votes sent during sse_listeners")
+    parser.add_argument("--sse-vote-interval", type=float, default=0.1, help="Seconds between those votes")
+    parser.add_argument("--url", help="Benchmark a running server instead of starting one in-process")
+    parser.add_argument("--db", choices=["stub", "postgres"], default="stub")
+    parser.add_argument("--redis", choices=["fake", "real"], default="fake")
+    parser.add_argument("--db-latency-ms", type=float, default=2.0, help="Per-statement latency of the stub DB")
+    parser.add_argument("--pool-size", type=int, default=3, help="DB_POOL_SIZE for the in-process server")
+    parser.add_argument("--write-behind", action="store_true", help="Enable VOTE_WRITE_BEHIND_ENABLED")
+    parser.add_argument("--workers", type=worker_counts,
+                        help="Comma-separated uvicorn worker counts to compare, e.g. 1,2,4 (default: in-process)")
+    parser.add_argument("-o", "--output", help="Write JSON results here instead of stdout")
+    return parser.parse_args(argv)
+
+
+async def scrape_counters(client: httpx.AsyncClient) -> dict[str, float]:
+    response = await client.get("/metrics")
+    return parse_counters(response.text, SERVER_COUNTERS)
+
+
+async def run_scenarios(base_url: str, opts, server=None) -> dict:
+    limits = httpx.Limits(max_connections=opts.concurrency + opts.listeners + 10)
+    results = {}
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        for name in opts.scenario:
+            before = await scrape_counters(client)
+            if server:
+                server.lag.start()
+
+            result = await SCENARIOS[name](client, opts)
+
+            if server:
+                result["event_loop_lag_ms"] = percentiles(server.lag.stop())
+            after = await scrape_counters(client)
+            result["server_counters"] = {key: after[key] - before[key] for key in SERVER_COUNTERS}
+            results[name] = result
+
+    return results
+
+
+def scaling(runs: dict[int, dict]) -> dict[str, dict[str, float]]:
+    """req/s of each HTTP scenario relative to the first worker count."""
+    baseline_workers = next(iter(runs))
+    speedups = {}
+    for name, baseline in runs[baseline_workers].items():
+        if "rps" not in baseline:
+            continue
+        speedups[name] = {
+            f"workers_{workers}": round(results[name]["rps"] / baseline["rps"], 2)
+            for workers, results in runs.items()
+        }
+    return speedups
+
+
+def main(argv=None) -> int:
+    opts = parse_args(argv)
+    opts.scenario = opts.scenario or list(SCENARIOS)
+
+    meta = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "options": {key: value for key, value in vars(opts).items() if key != "output"},
+    }
+
+    # Configure the app before it is imported; these are read at import time.
+    app_env = {
+        "DB_POOL_SIZE": str(opts.pool_size),
+        "DB_MAX_OVERFLOW": "0",
+        "VOTE_WRITE_BEHIND_ENABLED": "true" if opts.write_behind else "false",
+        "REFERRAL_INDEX_ENABLED": "false",
+        # Every simulated client connects from 127.0.0.1.
+        "VOTE_RATE_LIMIT_PER_SECOND": "0",
+    }
+
+    report = {"meta": meta}
+    if opts.url:
+        report["results"] = asyncio.run(run_scenarios(opts.url, opts))
+    elif opts.workers:
+        from benchmarks.harness import WorkerPoolServer
+
+        env = {
+            **app_env,
+            "BENCHMARK_DB_LATENCY": str(opts.db_latency_ms / 1000),
+            "BENCHMARK_STUB_DB": "true" if opts.db == "stub" else "false",
+            "BENCHMARK_STUB_REDIS": "true" if opts.redis == "fake" else "false",
+        }
+        runs = {}
+        for workers in opts.workers:
+            with WorkerPoolServer(workers, env) as server:
+                runs[workers] = asyncio.run(run_scenarios(server.url, opts))
+        report["results"] = {f"workers_{workers}": results for workers, results in runs.items()}
+        report["scaling"] = scaling(runs)
+    else:
+        os.environ.update(app_env)
+
+        from app.main import app
+        from benchmarks import stubs
+        from benchmarks.harness import InProcessServer
+
+        patchers = stubs.install(
+            pool_size=opts.pool_size,
+            latency=opts.db_latency_ms / 1000,
+            stub_db=opts.db == "stub",
+            stub_redis=opts.redis == "fake",
+        )
+        try:
+            with InProcessServer(app) as server:
+                report["results"] = asyncio.run(run_scenarios(server.url, opts, server))
+        finally:
+            for patcher in patchers:
+                patcher.stop()
+
+    output = json.dumps(report, indent=2)
+    if opts.output:
+        with open(opts.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
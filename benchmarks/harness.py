@@ -0,0 +1,169 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+import uvicorn
+
+
+def percentiles(samples: list[float]) -> dict[str, float | None]:
+    """p50/p95/p99/max of a list of seconds, reported in milliseconds."""
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return round(ordered[index] * 1000, 3)
+
+    return {
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(ordered[-1] * 1000, 3),
+    }
+
+
+def parse_counters(metrics_text: str, names: list[str]) -> dict[str, float]:
+    """Sum unlabelled and labelled samples of the given counters."""
+    totals = {name: 0.0 for name in names}
+    for line in metrics_text.splitlines():
+        if line.startswith("#"):
+            continue
+        for name in names:
+            if line.startswith(name + " ") or line.startswith(name + "{"):
+                totals[name] += float(line.rsplit(" ", 1)[1])
+    return totals
+
+
+class LoopLagMonitor:
+    """Measures how late a periodic timer fires on the server's event loop."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._recording = False
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            if self._recording:
+                self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self) -> None:
+        self.samples = []
+        self._recording = True
+
+    def stop(self) -> list[float]:
+        self._recording = False
+        return self.samples
+
+
+def free_port(host: str) -> int:
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+class InProcessServer:
+    """Runs the app under uvicorn on a private event loop in a thread.
+
+    Keeping the server on its own loop means the load generator's work does
+    not show up as server-side event loop lag.
+    """
+
+    def __init__(self, app, host: str = "127.0.0.1"):
+        self.host = host
+        self.port = free_port(host)
+        config = uvicorn.Config(app, host=host, port=self.port, log_level="warning", lifespan="on")
+        self.server = uvicorn.Server(config)
+        self.lag = LoopLagMonitor()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def _run(self) -> None:
+        async def serve():
+            monitor = asyncio.create_task(self.lag.run())
+            try:
+                await self.server.serve()
+            finally:
+                monitor.cancel()
+
+        asyncio.run(serve())
+
+    def __enter__(self) -> "InProcessServer":
+        self._thread.start()
+        deadline = time.monotonic() + 30
+        while not self.server.started:
+            if not self._thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("Benchmark server failed to start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.should_exit = True
+        self._thread.join(timeout=30)
+
+
+class WorkerPoolServer:
+    """Runs ``benchmarks.stub_app`` under uvicorn with several worker processes.
+
+    Metrics go through a private PROMETHEUS_MULTIPROC_DIR, as in
+    production. There is no event-loop lag probe: the loops are in other
+    processes.
+    """
+
+    def __init__(self, workers: int, env: dict[str, str], host: str = "127.0.0.1"):
+        self.workers = workers
+        self.host = host
+        self.port = free_port(host)
+        self.env = env
+        self._metrics_dir = None
+        self._process = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def __enter__(self) -> "WorkerPoolServer":
+        self._metrics_dir = tempfile.TemporaryDirectory(prefix="bench-metrics-")
+        env = {**os.environ, **self.env, "PROMETHEUS_MULTIPROC_DIR": self._metrics_dir.name}
+        self._process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "benchmarks.stub_app:app", "--host", self.host,
+             "--port", str(self.port), "--workers", str(self.workers), "--log-level", "warning"],
+            env=env,
+        )
+
+        # /health answers as soon as one worker is up; give the rest a moment.
+        deadline = time.monotonic() + 60
+        while True:
+            if self._process.poll() is not None or time.monotonic() > deadline:
+                self.__exit__()
+                raise RuntimeError("Benchmark server failed to start")
+            try:
+                httpx.get(self.url + "/health", timeout=1).raise_for_status()
+                break
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        time.sleep(1 + 0.2 * self.workers)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._process.terminate()
+        try:
+            self._process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        self._metrics_dir.cleanup()
@@ -0,0 +1,84 @@
+"""Per-request overhead of MetricsMiddleware and of an idle ProfileMiddleware.
+
+    python -m benchmarks.middleware            # 20000 requests per variant
+    python -m benchmarks.middleware -n 100000
+
+Drives the ASGI app directly (no sockets, no HTTP parsing) so the only
+difference between the timings is the middleware itself. The profiling
+variant has PROFILE_TOKEN set but requests without the token, i.e. the
+cost of enabling profiling on a server that isn't being profiled.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from app.metrics import MetricsMiddleware
+from app.profiling import ProfileMiddleware
+
+
+def make_app(with_metrics: bool, with_profiling: bool = False) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        return JSONResponse({"id": item_id})
+
+    if with_profiling:
+        app.add_middleware(ProfileMiddleware)
+    if with_metrics:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+
+async def drive(app, total: int) -> float:
+    """Send ``total`` GET requests through ``app``; returns seconds taken."""
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    def scope(i):
+        path = f"/items/{i}" if i % 10 else f"/unknown/{i}"
+        return {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+            "root_path": "", "query_string": b"", "headers": [],
+            "server": ("bench", 80), "client": ("127.0.0.1", 1234),
+        }
+
+    # Warm up route compilation, label children and the lifespan-less app stack.
+    for i in range(200):
+        await app(scope(i), receive, send)
+
+    start = time.perf_counter()
+    for i in range(total):
+        await app(scope(i), receive, send)
+    return time.perf_counter() - start
+
+
+async def main(total: int) -> dict:
+    bare = await drive(make_app(False), total)
+    instrumented = await drive(make_app(True), total)
+    with patch("app.profiling.PROFILE_TOKEN", "benchmark"):
+        profiling = await drive(make_app(False, with_profiling=True), total)
+    return {
+        "requests": total,
+        "bare_us_per_request": round(bare / total * 1e6, 2),
+        "instrumented_us_per_request": round(instrumented / total * 1e6, 2),
+        "overhead_us_per_request": round((instrumented - bare) / total * 1e6, 2),
+        "profiling_idle_overhead_us_per_request": round((profiling - bare) / total * 1e6, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.middleware", description=__doc__.split("\n")[0])
+    parser.add_argument("-n", "--requests", type=int, default=20000, help="Requests per variant")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main(args.requests)), indent=2))
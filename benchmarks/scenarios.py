@@ -0,0 +1,151 @@
+import asyncio
+import bisect
+import random
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks.harness import percentiles
+from benchmarks.stubs import KNOWN_REFERRAL_CODE
+
+CHOICES = ["print", "stare", "ai", "revert", "restart"]
+
+
+async def run_requests(client: httpx.AsyncClient, total: int, concurrency: int, make_request) -> dict:
+    """Issue ``total`` requests from ``concurrency`` workers and time each one."""
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in remaining:
+            method, path, body = make_request(i)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                statuses[response.status_code] += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "duration_s": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "latency_ms": percentiles(latencies),
+    }
+
+
+async def vote_burst(client: httpx.AsyncClient, opts) -> dict:
+    """Everyone in the room votes at once."""
+    return await run_requests(
+        client, opts.requests, opts.concurrency,
+        lambda i: ("POST", "/vote", {"choice": random.choice(CHOICES)}),
+    )
+
+
+async def referral_votes(client: httpx.AsyncClient, opts) -> dict:
+    """Votes carrying referral codes; one in four is the real partner code."""
+    def make_request(i):
+        code = KNOWN_REFERRAL_CODE if i % 4 == 0 else f"bogus-{random.getrandbits(40):x}"
+        return "POST", "/vote", {"choice": random.choice(CHOICES), "referral": code}
+
+    return await run_requests(client, opts.requests, opts.concurrency, make_request)
+
+
+async def mixed_traffic(client: httpx.AsyncClient, opts) -> dict:
+    """Page loads, result polling and votes in roughly live-talk proportions."""
+    def make_request(i):
+        roll = random.random()
+        if roll < 0.15:
+            return "GET", "/", None
+        if roll < 0.35:
+            return "GET", "/votes", None
+        if roll < 0.45:
+            return "POST", "/vote", {"choice": random.choice(CHOICES), "referral": KNOWN_REFERRAL_CODE}
+        return "POST", "/vote", {"choice": random.choice(CHOICES)}
+
+    return await run_requests(client, opts.requests, opts.concurrency, make_request)
+
+
+async def sse_listeners(client: httpx.AsyncClient, opts) -> dict:
+    """N results pages connected while votes trickle in.
+
+    Reports how long each vote takes to reach every listener.
+    """
+    arrivals: list[list[float]] = [[] for _ in range(opts.listeners)]
+    connected = 0
+    failed = 0
+    ready = asyncio.Event()
+
+    async def listen(index: int):
+        nonlocal connected, failed
+        try:
+            async with client.stream("GET", "/stream", timeout=None) as response:
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    if not arrivals[index]:
+                        connected += 1
+                        if connected == opts.listeners:
+                            ready.set()
+                    arrivals[index].append(time.perf_counter())
+        except httpx.HTTPError:
+            failed += 1
+            if connected + failed == opts.listeners:
+                ready.set()
+
+    tasks = [asyncio.create_task(listen(i)) for i in range(opts.listeners)]
+    try:
+        await asyncio.wait_for(ready.wait(), 30)
+    except TimeoutError:
+        pass
+
+    sent: list[float] = []
+    for _ in range(opts.sse_votes):
+        sent.append(time.perf_counter())
+        await client.post("/vote", json={"choice": random.choice(CHOICES)})
+        await asyncio.sleep(opts.sse_vote_interval)
+    await asyncio.sleep(1)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    delivery: list[float] = []
+    missed = 0
+    for listener in arrivals:
+        for sent_at in sent:
+            i = bisect.bisect_left(listener, sent_at)
+            if i < len(listener):
+                delivery.append(listener[i] - sent_at)
+            else:
+                missed += 1
+
+    return {
+        "listeners": opts.listeners,
+        "connected": connected,
+        "failed": failed,
+        "votes": len(sent),
+        "events_received": sum(len(listener) for listener in arrivals),
+        "missed_updates": missed,
+        "delivery_latency_ms": percentiles(delivery),
+    }
+
+
+SCENARIOS = {
+    "vote_burst": vote_burst,
+    "referral_votes": referral_votes,
+    "sse_listeners": sse_listeners,
+    "mixed": mixed_traffic,
+}
@@ -0,0 +1,22 @@
+"""The app with the benchmark stubs installed, for ``--workers`` runs.
+
+uvicorn imports this module in every worker process, so each worker gets
+its own stub database and (with ``--redis fake``) its own fakeredis: the
+tally and /stream updates are then per worker, which is fine for
+throughput but not for checking results. The stubs are configured through
+the BENCHMARK_* variables set by ``python -m benchmarks``.
+"""
+
+import os
+
+from app.main import app
+from benchmarks import stubs
+
+stubs.install(
+    pool_size=int(os.getenv("DB_POOL_SIZE", "3")),
+    latency=float(os.getenv("BENCHMARK_DB_LATENCY", "0.002")),
+    stub_db=os.getenv("BENCHMARK_STUB_DB", "true") == "true",
+    stub_redis=os.getenv("BENCHMARK_STUB_REDIS", "true") == "true",
+)
+
+__all__ = ["app"]
@@ -0,0 +1,137 @@
+"""In-process stand-ins for Postgres and Redis, for benchmarking without infra.
+
+StubAsyncEngine mimics the parts of SQLAlchemy's AsyncEngine the app uses.
+It has a bounded pool that raises the same TimeoutError as QueuePool and a
+fixed per-statement latency, so pool contention shows up much as it would
+against a real database.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import fakeredis
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.sql import Insert, Select
+
+KNOWN_REFERRAL_CODE = "conf-partner-2026"
+
+
+class StubPool:
+    def __init__(self, size: int):
+        self._size = size
+        self.checked_out = 0
+
+    def size(self) -> int:
+        return self._size
+
+    def checkedout(self) -> int:
+        return self.checked_out
+
+
+class StubResult:
+    def __init__(self, value=None):
+        self._value = value
+
+    def scalar_one_or_none(self):
+        return self._value
+
+    def scalar(self):
+        return self._value
+
+    def first(self):
+        return self._value
+
+    def all(self):
+        return []
+
+
+class StubConnection:
+    dialect = SimpleNamespace(name="stub")
+
+    def __init__(self, engine: "StubAsyncEngine"):
+        self.engine = engine
+
+    async def execute(self, statement, *args, **kwargs):
+        await asyncio.sleep(self.engine.latency)
+
+        if isinstance(statement, Insert):
+            params = statement.compile().params
+            self.engine.rows_written += max(1, sum(key.startswith("choice") for key in params))
+            return StubResult()
+
+        if isinstance(statement, Select):
+            params = statement.compile().params
+            if KNOWN_REFERRAL_CODE in params.values():
+                return StubResult(1)
+        return StubResult()
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+    async def run_sync(self, fn, *args, **kwargs):
+        pass
+
+
+class StubAsyncEngine:
+    def __init__(self, pool_size: int, latency: float, pool_timeout: float = 2.0):
+        self.pool = StubPool(pool_size)
+        self.latency = latency
+        self.pool_timeout = pool_timeout
+        self.rows_written = 0
+        self._slots = asyncio.Semaphore(pool_size)
+
+    @asynccontextmanager
+    async def connect(self):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.pool_timeout)
+        except TimeoutError:
+            raise PoolTimeoutError("QueuePool limit reached (benchmark stub)")
+
+        self.pool.checked_out += 1
+        try:
+            yield StubConnection(self)
+        finally:
+            self.pool.checked_out -= 1
+            self._slots.release()
+
+    begin = connect
+
+    async def dispose(self):
+        pass
+
+
+def install(pool_size: int, latency: float, stub_db: bool = True, stub_redis: bool = True):
+    """Patch the app modules to use the stubs. Returns the active patchers."""
+    patchers = []
+
+    if stub_db:
+        engine = StubAsyncEngine(pool_size=pool_size, latency=latency)
+        for target in ("app.database", "app.main", "app.reconcile", "app.referral", "app.sessions", "app.vote_fallback"):
+            patchers.append(patch(f"{target}.async_engine", engine))
+        patchers.append(patch("app.health.health_engine", engine))
+
+        async def no_migrations():
+            return []
+
+        # The stub has no schema to migrate.
+        patchers.append(patch("app.main.migrate", no_migrations))
+
+    if stub_redis:
+        import app.redis_client
+
+        server = fakeredis.FakeServer()
+
+        async def init_fake_redis():
+            app.redis_client.redis_client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+            return app.redis_client.redis_client
+
+        patchers.append(patch("app.main.init_redis", init_fake_redis))
+
+    for patcher in patchers:
+        patcher.start()
+    return patchers
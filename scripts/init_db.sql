@@ -1,3 +1,13 @@
+-- Generated from app/migrations by `python -m app.migrations render`; do not edit.
+
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 0001_initial
+
 CREATE TABLE IF NOT EXISTS votes (
     id SERIAL PRIMARY KEY,
     choice VARCHAR(100) NOT NULL,
@@ -12,4 +22,47 @@ CREATE TABLE IF NOT EXISTS referral_partners (
     created_at TIMESTAMP DEFAULT NOW()
 );
 
-CREATE INDEX IF NOT EXISTS idx_votes_created_at ON votes(created_at);
+CREATE INDEX IF NOT EXISTS idx_votes_created_at ON votes (created_at);
+
+INSERT INTO schema_migrations (version, name) VALUES (1, 'initial') ON CONFLICT DO NOTHING;
+
+-- 0002_vote_sessions
+
+CREATE TABLE IF NOT EXISTS vote_sessions (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(255),
+    started_at TIMESTAMP DEFAULT NOW(),
+    purged_at TIMESTAMP
+);
+
+ALTER TABLE votes ADD COLUMN IF NOT EXISTS session_id INTEGER NOT NULL DEFAULT 1;
+
+INSERT INTO vote_sessions (name) SELECT 'default' WHERE NOT EXISTS (SELECT 1 FROM vote_sessions);
+
+INSERT INTO schema_migrations (version, name) VALUES (2, 'vote_sessions') ON CONFLICT DO NOTHING;
+
+-- 0003_vote_idempotency_key
+
+ALTER TABLE votes ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(32);
+
+INSERT INTO schema_migrations (version, name) VALUES (3, 'vote_idempotency_key') ON CONFLICT DO NOTHING;
+
+-- 0004_vote_indexes
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_votes_session_id_id ON votes (session_id, id);
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_votes_idempotency_key ON votes (idempotency_key);
+
+INSERT INTO schema_migrations (version, name) VALUES (4, 'vote_indexes') ON CONFLICT DO NOTHING;
+
+-- 0005_referral_partners_code_unique
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS referral_partners_code_key ON referral_partners (code);
+
+INSERT INTO schema_migrations (version, name) VALUES (5, 'referral_partners_code_unique') ON CONFLICT DO NOTHING;
+
+-- 0006_votes_choice_created_at
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_votes_choice_created_at ON votes (choice, created_at);
+
+INSERT INTO schema_migrations (version, name) VALUES (6, 'votes_choice_created_at') ON CONFLICT DO NOTHING;
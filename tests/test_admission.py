@@ -0,0 +1,93 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.admission import AdmissionController, Overloaded, RateLimiter
+
+
+def rejected(reason):
+    return REGISTRY.get_sample_value("admission_rejected_total", {"reason": reason}) or 0
+
+
+class TestAdmissionController:
+    async def test_admits_up_to_the_limit_without_waiting(self):
+        controller = AdmissionController(limit=2, max_queue=0, queue_timeout=1)
+
+        async with controller.admit(), controller.admit():
+            assert controller.stats()["in_flight"] == 2
+        assert controller.stats()["in_flight"] == 0
+
+    async def test_full_queue_is_refused_immediately(self):
+        controller = AdmissionController(limit=1, max_queue=0, queue_timeout=1)
+        before = rejected("queue_full")
+
+        async with controller.admit():
+            with pytest.raises(Overloaded) as exc:
+                async with controller.admit():
+                    pass
+
+        assert exc.value.reason == "queue_full"
+        assert exc.value.retry_after >= 1
+        assert rejected("queue_full") - before == 1
+
+    async def test_queued_request_gets_the_next_free_slot(self):
+        controller = AdmissionController(limit=1, max_queue=1, queue_timeout=1)
+        order = []
+
+        async def request(name, hold):
+            async with controller.admit():
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        first = asyncio.create_task(request("first", 0.05))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(request("second", 0))
+        await asyncio.sleep(0.01)
+        assert controller.stats()["waiting"] == 1
+
+        await asyncio.gather(first, second)
+        assert order == ["first", "second"]
+        assert controller.stats() == {"limit": 1, "in_flight": 0, "waiting": 0, "max_queue": 1}
+
+    async def test_queue_wait_is_bounded(self):
+        controller = AdmissionController(limit=1, max_queue=5, queue_timeout=0.02)
+        before = rejected("queue_timeout")
+
+        async with controller.admit():
+            with pytest.raises(Overloaded) as exc:
+                async with controller.admit():
+                    pass
+
+        assert exc.value.reason == "queue_timeout"
+        assert rejected("queue_timeout") - before == 1
+        # The timed-out waiter must not have consumed a slot.
+        async with controller.admit():
+            pass
+
+
+class TestRateLimiter:
+    def test_burst_then_refill(self):
+        limiter = RateLimiter(rate=2, burst=3)
+        with patch("app.admission.time.monotonic", return_value=100.0):
+            assert [limiter.acquire("10.0.0.1") for _ in range(3)] == [0, 0, 0]
+            assert limiter.acquire("10.0.0.1") == pytest.approx(0.5)
+            assert limiter.acquire("10.0.0.2") == 0
+
+        with patch("app.admission.time.monotonic", return_value=100.5):
+            assert limiter.acquire("10.0.0.1") == 0
+            assert limiter.acquire("10.0.0.1") > 0
+
+    def test_clients_are_bounded(self):
+        limiter = RateLimiter(rate=1, burst=1, max_clients=2)
+        for client in ("a", "b", "c"):
+            limiter.acquire(client)
+
+        # "a" was dropped, so it starts over with a full bucket.
+        assert limiter.acquire("a") == 0
+        assert limiter.acquire("c") > 0
+
+    def test_zero_rate_disables(self):
+        limiter = RateLimiter(rate=0, burst=1)
+        assert all(limiter.acquire("a") == 0 for _ in range(100))
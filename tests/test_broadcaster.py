@@ -0,0 +1,143 @@
+import asyncio
+import json
+from unittest.mock import MagicMock
+
+from app.broadcaster import VoteBroadcaster
+from app.tally import TallyCache
+
+CHOICES = ["print", "stare", "ai"]
+LABELS = {"print": "Print it", "stare": "Stare at it", "ai": "Ask an AI"}
+
+
+def snapshot(version, **counts):
+    return TallyCache(CHOICES, LABELS, MagicMock())._build(version, counts)
+
+
+def rendering(tally):
+    async def render():
+        return tally
+    return render
+
+
+def parse(event: bytes) -> dict:
+    fields = dict(line.split(": ", 1) for line in event.decode().strip().split("\r\n"))
+    fields["data"] = json.loads(fields["data"])
+    return fields
+
+
+async def take(events, count):
+    return [parse(await asyncio.wait_for(anext(events), 1)) for _ in range(count)]
+
+
+class TestVoteBroadcaster:
+    async def test_labels_are_sent_once_then_deltas(self):
+        broadcaster = VoteBroadcaster(render=rendering(snapshot(4, print=2)))
+        events = broadcaster.events()
+
+        [first] = await take(events, 1)
+        broadcaster.publish(snapshot(5, print=2, ai=1))
+        [second] = await take(events, 1)
+
+        assert first["event"] == "votes"
+        assert first["id"] == "4"
+        assert first["data"]["print"] == {"count": 2, "label": "Print it"}
+        assert second == {"id": "5", "event": "delta", "data": {"ai": 1}}
+        await events.aclose()
+
+    async def test_unchanged_tally_is_not_resent(self):
+        broadcaster = VoteBroadcaster(render=rendering(snapshot(1)))
+        queue = await broadcaster.subscribe()
+        queue.get_nowait()
+
+        broadcaster.publish(snapshot(1))
+
+        assert queue.empty()
+
+    async def test_subscribers_share_the_encoded_delta(self):
+        broadcaster = VoteBroadcaster(render=rendering(snapshot(1)))
+        first, second = broadcaster.events(), broadcaster.events()
+        await anext(first)
+        await anext(second)
+
+        broadcaster.publish(snapshot(2, stare=1))
+
+        assert await anext(first) is await anext(second)
+        await first.aclose()
+        await second.aclose()
+
+    async def test_slow_consumer_gets_one_delta_for_everything_it_skipped(self):
+        broadcaster = VoteBroadcaster(render=rendering(snapshot(0)), client_queue_size=1)
+        events = broadcaster.events()
+        await anext(events)
+
+        broadcaster.publish(snapshot(1, print=1))
+        broadcaster.publish(snapshot(2, print=1, stare=1))
+        broadcaster.publish(snapshot(3, print=2, stare=1))
+
+        [delta] = await take(events, 1)
+        assert delta == {"id": "3", "event": "delta", "data": {"print": 2, "stare": 1}}
+        await events.aclose()
+
+    async def test_last_event_id_resumes_with_what_was_missed(self):
+        broadcaster = VoteBroadcaster(render=rendering(snapshot(1, ai=1)))
+        await broadcaster.subscribe()
+        broadcaster.publish(snapshot(2, ai=1, print=1))
+        broadcaster.publish(snapshot(3, ai=2, print=1))
+
+        [resumed] = await take(broadcaster.events("2"), 1)
+        [unknown] = await take(broadcaster.events("99"), 1)
+
+        assert resumed == {"id": "3", "event": "delta", "data": {"ai": 2}}
+        assert unknown["event"] == "votes"
+
+    async def test_up_to_date_client_gets_nothing_on_resume(self):
+        broadcaster = VoteBroadcaster(render=rendering(snapshot(7, ai=1)))
+        events = broadcaster.events("7")
+        pending = asyncio.ensure_future(anext(events))
+
+        await asyncio.sleep(0.01)
+        assert not pending.done()
+
+        broadcaster.publish(snapshot(8, ai=2))
+        assert parse(await asyncio.wait_for(pending, 1))["data"] == {"ai": 2}
+        await events.aclose()
+
+    async def test_version_going_backwards_forgets_history(self):
+        broadcaster = VoteBroadcaster(render=rendering(snapshot(50, ai=9)))
+        await broadcaster.subscribe()
+
+        # Redis restarted: version 50 now means different counts.
+        broadcaster.publish(snapshot(3, ai=1))
+
+        assert broadcaster.resume_point("50") is None
+
+    async def test_unsubscribe_stops_delivery(self):
+        broadcaster = VoteBroadcaster(render=rendering(snapshot(0)))
+        queue = await broadcaster.subscribe()
+        queue.get_nowait()
+        broadcaster.unsubscribe(queue)
+
+        broadcaster.publish(snapshot(1, ai=1))
+
+        assert queue.empty()
+
+    async def test_vote_update_triggers_one_render_per_tick(self, redis):
+        renders = []
+
+        async def render():
+            renders.append(1)
+            return snapshot(len(renders))
+
+        broadcaster = VoteBroadcaster(render=render, tick=0.05, resync=60)
+        queue = await broadcaster.subscribe()
+        assert queue.get_nowait().version == 1
+
+        task = asyncio.create_task(broadcaster.run())
+        assert (await asyncio.wait_for(queue.get(), 1)).version == 2
+
+        for _ in range(10):
+            redis.publish("vote_updates", "print")
+        assert (await asyncio.wait_for(queue.get(), 1)).version == 3
+        task.cancel()
+
+        assert len(renders) == 3
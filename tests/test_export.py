@@ -0,0 +1,125 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+
+from app.export import ExportResponse, stream_votes
+from app.models import Vote
+
+
+@pytest.fixture
+def votes_db(fake_async_engine):
+    return fake_async_engine("app.export.export_engine", models=[Vote])
+
+
+def add_votes(conn, count, **values):
+    conn.execute(insert(Vote), [dict({"choice": "print", "session_id": 1}, **values)] * count)
+
+
+@pytest.fixture
+def client(votes_db):
+    from app.main import app
+    return TestClient(app)
+
+
+class TestExportEndpoint:
+    def test_csv(self, client, votes_db):
+        add_votes(votes_db, 2, referral_code="conf-partner-2026", created_at=datetime(2026, 5, 1, 10, 0))
+        add_votes(votes_db, 1, choice="ai", session_id=2, created_at=datetime(2026, 5, 2, 10, 0))
+
+        response = client.get("/admin/export?format=csv")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert 'filename="votes.csv"' in response.headers["content-disposition"]
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert [row["choice"] for row in rows] == ["print", "print", "ai"]
+        assert rows[0]["referral_code"] == "conf-partner-2026"
+        assert rows[2]["referral_code"] == ""
+        assert rows[2]["created_at"] == "2026-05-02T10:00:00"
+        assert votes_db.checkouts == ["closed"]
+
+    def test_ndjson_filters(self, client, votes_db):
+        add_votes(votes_db, 1, created_at=datetime(2026, 5, 1, 10, 0))
+        add_votes(votes_db, 1, choice="stare", created_at=datetime(2026, 5, 2, 10, 0))
+        add_votes(votes_db, 1, choice="ai", session_id=2, created_at=datetime(2026, 5, 2, 11, 0))
+
+        response = client.get("/admin/export?format=ndjson&since=2026-05-02T12:00:00%2B02:00")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["choice"] for row in rows] == ["stare", "ai"]
+
+        response = client.get("/admin/export?format=ndjson&session=2")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert rows == [{
+            "id": 3, "session_id": 2, "choice": "ai", "referral_code": None, "created_at": "2026-05-02T11:00:00",
+        }]
+
+    def test_gzip(self, client, votes_db):
+        add_votes(votes_db, 5)
+
+        response = client.get("/admin/export?format=csv&gzip=true")
+
+        assert response.headers["content-type"] == "application/gzip"
+        assert 'filename="votes.csv.gz"' in response.headers["content-disposition"]
+        assert gzip.decompress(response.content).decode().count("\n") == 6
+
+    def test_unknown_format(self, client):
+        assert client.get("/admin/export?format=xml").status_code == 400
+
+    def test_busy_export_pool_asks_to_retry(self, client, votes_db):
+        votes_db.checkouts.append("open")  # another export is streaming
+
+        response = client.get("/admin/export")
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "5"
+        votes_db.checkouts[-1] = "closed"
+        assert client.get("/admin/export").status_code == 200
+
+
+class TestStreamVotes:
+    async def test_rows_arrive_in_batches(self, votes_db):
+        add_votes(votes_db, 5)
+
+        chunks = [chunk async for chunk in stream_votes("ndjson", batch_rows=2)]
+
+        assert [chunk.count(b"\n") for chunk in chunks] == [2, 2, 1]
+
+    async def test_connection_is_taken_lazily_and_returned_on_close(self, votes_db):
+        add_votes(votes_db, 5)
+        stream = stream_votes("csv", batch_rows=2)
+
+        await stream.__anext__()  # header
+        assert votes_db.checkouts == []
+        await stream.__anext__()
+        assert votes_db.checkouts == ["open"]
+
+        await stream.aclose()
+        assert votes_db.checkouts == ["closed"]
+
+    async def test_response_closes_stream_when_client_goes_away(self, votes_db):
+        add_votes(votes_db, 5)
+        response = ExportResponse(stream_votes("csv", batch_rows=1), media_type="text/csv")
+        sent = []
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            if len(sent) == 3:
+                disconnected.set()
+            await asyncio.sleep(0)
+
+        await response({"type": "http"}, receive, send)
+
+        assert len(sent) < 7
+        assert votes_db.checkouts == ["closed"]
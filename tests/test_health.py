@@ -0,0 +1,107 @@
+import asyncio
+from unittest.mock import patch
+
+from prometheus_client import REGISTRY
+
+from app.health import HealthMonitor
+
+
+class Flaky:
+    """A check whose outcome the test sets before each round."""
+
+    def __init__(self):
+        self.ok = True
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.ok == "hang":
+            await asyncio.sleep(10)
+        if not self.ok:
+            raise ConnectionError("connection refused")
+
+
+def make_monitor(**kwargs):
+    kwargs = {"interval": 1, "timeout": 0.05, "failure_threshold": 3, "recovery_threshold": 2, **kwargs}
+    monitor = HealthMonitor(**kwargs)
+    monitor.warm = True
+    redis, postgres = Flaky(), Flaky()
+    monitor.add("test-redis", redis)
+    monitor.add("test-postgres", postgres, critical=False)
+    return monitor, redis, postgres
+
+
+class TestHealthMonitor:
+    async def test_not_ready_before_the_first_check(self):
+        monitor, _, _ = make_monitor()
+        assert not monitor.ready()
+
+        await monitor.check_all()
+
+        assert monitor.ready()
+        assert monitor.snapshot()["status"] == "ready"
+
+    async def test_not_ready_until_warm(self):
+        monitor, _, _ = make_monitor()
+        monitor.warm = False
+        await monitor.check_all()
+
+        assert not monitor.ready()
+        assert monitor.snapshot()["status"] == "starting"
+
+    async def test_first_result_is_taken_as_is(self):
+        monitor, redis, _ = make_monitor()
+        redis.ok = False
+
+        await monitor.check_all()
+
+        assert not monitor.ready()
+        assert monitor.snapshot()["dependencies"]["test-redis"]["error"] == "ConnectionError: connection refused"
+
+    async def test_single_failures_are_damped(self):
+        monitor, redis, _ = make_monitor()
+        await monitor.check_all()
+
+        redis.ok = False
+        for _ in range(2):
+            await monitor.check_all()
+            assert monitor.ready()
+
+        await monitor.check_all()
+        assert not monitor.ready()
+        assert REGISTRY.get_sample_value("dependency_up", {"dependency": "test-redis"}) == 0
+
+        redis.ok = True
+        await monitor.check_all()
+        assert not monitor.ready()
+        await monitor.check_all()
+        assert monitor.ready()
+
+    async def test_hung_check_times_out(self):
+        monitor, redis, _ = make_monitor(failure_threshold=1)
+        await monitor.check_all()
+        before = REGISTRY.get_sample_value("dependency_check_failures_total", {"dependency": "test-redis"}) or 0
+
+        redis.ok = "hang"
+        await asyncio.wait_for(monitor.check_all(), 1)
+
+        assert not monitor.ready()
+        assert monitor.snapshot()["dependencies"]["test-redis"]["error"] == "TimeoutError"
+        assert REGISTRY.get_sample_value("dependency_check_failures_total", {"dependency": "test-redis"}) - before == 1
+
+    async def test_non_critical_dependency_only_degrades(self):
+        monitor, _, postgres = make_monitor()
+        postgres.ok = False
+
+        await monitor.check_all()
+
+        assert monitor.ready()
+        assert monitor.snapshot()["status"] == "degraded"
+
+    async def test_stale_results_are_not_trusted(self):
+        monitor, _, _ = make_monitor()
+        await monitor.check_all()
+        checked_at = monitor.dependencies["test-redis"].checked_at
+
+        with patch("app.health.time.monotonic", return_value=checked_at + monitor.stale_after + 1):
+            assert not monitor.ready()
@@ -0,0 +1,153 @@
+import os
+import subprocess
+import sys
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from prometheus_client.parser import text_string_to_metric_families
+
+from app.metrics import MetricsMiddleware, get_metrics_response
+from app.server import prepare_metrics_dir
+
+# What one uvicorn worker records before it is scraped.
+WORKER = (
+    "from app.metrics import db_pool_size, http_requests_total; "
+    "db_pool_size.set(3); "
+    "http_requests_total.labels(method='POST', endpoint='/vote', status='200').inc()"
+)
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def run_workers(metrics_dir, count):
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(metrics_dir)}
+    for _ in range(count):
+        subprocess.run([sys.executable, "-c", WORKER], env=env, check=True)
+
+
+def scrape(metrics_dir):
+    with patch("app.metrics.PROMETHEUS_MULTIPROC_DIR", str(metrics_dir)):
+        body = get_metrics_response().body.decode()
+    return {
+        sample.name: sample.value
+        for family in text_string_to_metric_families(body)
+        for sample in family.samples
+        if sample.name in ("db_pool_size", "http_requests_total")
+    }
+
+
+def make_client(tmp_path):
+    (tmp_path / "app.js").write_text("console.log('hi')")
+    app = FastAPI()
+
+    @app.get("/things/{thing_id}")
+    async def thing(thing_id: str):
+        return {"id": thing_id}
+
+    @app.get("/metrics")
+    async def metrics():
+        return {}
+
+    app.mount("/static", StaticFiles(directory=str(tmp_path)), name="static")
+    app.add_middleware(MetricsMiddleware)
+    return TestClient(app)
+
+
+class TestMetricsMiddleware:
+    def test_route_template_is_the_endpoint_label(self, tmp_path):
+        client = make_client(tmp_path)
+        before = sample("http_requests_total", method="GET", endpoint="/things/{thing_id}", status="200")
+
+        client.get("/things/1")
+        client.get("/things/2")
+
+        after = sample("http_requests_total", method="GET", endpoint="/things/{thing_id}", status="200")
+        assert after - before == 2
+        assert sample("http_requests_total", method="GET", endpoint="/things/1", status="200") == 0
+
+    def test_unmatched_paths_share_one_bucket(self, tmp_path):
+        client = make_client(tmp_path)
+        before = sample("http_requests_total", method="GET", endpoint="other", status="404")
+
+        client.get("/wp-admin.php")
+        client.get("/.env")
+
+        assert sample("http_requests_total", method="GET", endpoint="other", status="404") - before == 2
+        assert sample("http_requests_total", method="GET", endpoint="/.env", status="404") == 0
+
+    def test_mounted_apps_use_the_mount_path(self, tmp_path):
+        client = make_client(tmp_path)
+        before = sample("http_requests_total", method="GET", endpoint="/static", status="200")
+
+        client.get("/static/app.js")
+
+        assert sample("http_requests_total", method="GET", endpoint="/static", status="200") - before == 1
+
+    def test_unknown_methods_are_collapsed(self, tmp_path):
+        client = make_client(tmp_path)
+        before = sample("http_requests_total", method="OTHER", endpoint="/things/{thing_id}", status="405")
+
+        client.request("PURGE", "/things/1")
+
+        assert sample("http_requests_total", method="OTHER", endpoint="/things/{thing_id}", status="405") - before == 1
+
+    def test_response_size_and_in_progress(self, tmp_path):
+        client = make_client(tmp_path)
+        labels = {"method": "GET", "endpoint": "/things/{thing_id}"}
+        before = sample("http_response_size_bytes_sum", **labels)
+
+        response = client.get("/things/abc")
+
+        assert sample("http_response_size_bytes_sum", **labels) - before == len(response.content)
+        assert sample("http_requests_in_progress", method="GET") == 0
+
+    def test_metrics_endpoint_is_not_recorded(self, tmp_path):
+        client = make_client(tmp_path)
+        before = sample("http_requests_total", method="GET", endpoint="/metrics", status="200")
+
+        client.get("/metrics")
+
+        assert sample("http_requests_total", method="GET", endpoint="/metrics", status="200") == before
+
+
+class TestMultiprocessMetrics:
+    def test_worker_samples_are_merged(self, tmp_path):
+        run_workers(tmp_path, 2)
+
+        with patch("app.metrics._pid_alive", return_value=True):
+            samples = scrape(tmp_path)
+
+        assert samples == {"db_pool_size": 6, "http_requests_total": 2}
+
+    def test_dead_workers_drop_out_of_live_gauges(self, tmp_path):
+        run_workers(tmp_path, 2)
+
+        samples = scrape(tmp_path)
+
+        # Their requests still count; their pools are gone.
+        assert samples == {"http_requests_total": 2}
+        assert not any(name.startswith("gauge_live") for name in os.listdir(tmp_path))
+
+    def test_server_starts_with_an_empty_metrics_dir(self, tmp_path, monkeypatch):
+        stale = tmp_path / "counter_1.db"
+        stale.write_bytes(b"")
+        monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+
+        assert prepare_metrics_dir(workers=1) == str(tmp_path)
+        assert not stale.exists()
+
+    def test_multiple_workers_get_a_default_metrics_dir(self, tmp_path, monkeypatch):
+        # setenv first so monkeypatch restores whatever was there.
+        monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", "")
+        monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR")
+
+        with patch("app.server.DEFAULT_MULTIPROC_DIR", str(tmp_path / "prom")):
+            assert prepare_metrics_dir(workers=1) is None
+            assert prepare_metrics_dir(workers=4) == str(tmp_path / "prom")
+
+        assert os.environ["PROMETHEUS_MULTIPROC_DIR"] == str(tmp_path / "prom")
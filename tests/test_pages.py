@@ -0,0 +1,97 @@
+import gzip
+import os
+
+import brotli
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.pages import PageCache
+
+
+@pytest.fixture
+def page_dir(tmp_path):
+    (tmp_path / "index.html").write_text("<p>{{ APP_VERSION }} at {{ CONFERENCE }}</p>")
+    return tmp_path
+
+
+def make_client(page_dir, hot_reload=False):
+    pages = PageCache(str(page_dir), context={"APP_VERSION": "v1.2.3", "CONFERENCE": "munich"}, hot_reload=hot_reload)
+    app = FastAPI()
+
+    @app.get("/")
+    async def index(request: Request):
+        return pages.response("index.html", request)
+
+    return TestClient(app)
+
+
+class TestPageCache:
+    def test_placeholders_are_filled(self, page_dir):
+        client = make_client(page_dir)
+        response = client.get("/", headers={"Accept-Encoding": "identity"})
+
+        assert response.status_code == 200
+        assert response.text == "<p>v1.2.3 at munich</p>"
+        assert "text/html" in response.headers["content-type"]
+
+    def test_precompressed_variants(self, page_dir):
+        client = make_client(page_dir)
+
+        response = client.get("/", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.text == "<p>v1.2.3 at munich</p>"
+
+        raw = client.get("/", headers={"Accept-Encoding": "br, gzip"})
+        assert raw.headers["content-encoding"] == "br"
+        assert raw.headers["vary"] == "Accept-Encoding"
+
+        pages = PageCache(str(page_dir), context={})
+        page = pages.get("index.html")
+        assert gzip.decompress(page.gzip) == page.identity
+        assert brotli.decompress(page.br) == page.identity
+
+    def test_if_none_match_returns_304(self, page_dir):
+        client = make_client(page_dir)
+        etag = client.get("/", headers={"Accept-Encoding": "gzip"}).headers["etag"]
+
+        response = client.get("/", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+        response = client.get("/", headers={"If-None-Match": '"stale"'})
+        assert response.status_code == 200
+
+    def test_etag_only_validates_its_own_encoding(self, page_dir):
+        client = make_client(page_dir)
+        etag = client.get("/", headers={"Accept-Encoding": "gzip"}).headers["etag"]
+
+        response = client.get("/", headers={"If-None-Match": etag, "Accept-Encoding": "identity"})
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+
+        response = client.get("/", headers={"If-None-Match": f"W/{etag}", "Accept-Encoding": "gzip"})
+        assert response.status_code == 304
+
+    def test_hot_reload_picks_up_changes(self, page_dir):
+        client = make_client(page_dir, hot_reload=True)
+        first = client.get("/", headers={"Accept-Encoding": "identity"})
+
+        page = page_dir / "index.html"
+        page.write_text("<p>changed</p>")
+        stat = page.stat()
+        os.utime(page, (stat.st_atime, stat.st_mtime + 5))
+
+        second = client.get("/", headers={"Accept-Encoding": "identity"})
+        assert second.text == "<p>changed</p>"
+        assert second.headers["etag"] != first.headers["etag"]
+
+    def test_without_hot_reload_page_is_served_from_memory(self, page_dir):
+        client = make_client(page_dir)
+        client.get("/")
+
+        (page_dir / "index.html").write_text("<p>changed</p>")
+
+        response = client.get("/", headers={"Accept-Encoding": "identity"})
+        assert response.text == "<p>v1.2.3 at munich</p>"
@@ -0,0 +1,114 @@
+import logging
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+from sqlalchemy.util import greenlet_spawn
+
+from app.metrics import current_scope
+from app.pool_monitor import InstrumentedQueuePool, PoolMonitor
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.fixture
+def monitored():
+    monitor = PoolMonitor(leak_threshold=60)
+    engine = create_engine("sqlite://", poolclass=InstrumentedQueuePool, pool_size=2, max_overflow=0)
+    monitor.attach(engine)
+    yield monitor, engine
+    engine.dispose()
+
+
+class TestPoolMonitor:
+    def test_wait_and_hold_times_are_recorded(self, monitored):
+        monitor, engine = monitored
+        waits = sample("db_pool_wait_seconds_count", engine="sync")
+        holds = sample("db_pool_hold_seconds_count", engine="sync", endpoint="background")
+
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            assert len(monitor.held()) == 1
+
+        assert monitor.held() == []
+        assert sample("db_pool_wait_seconds_count", engine="sync") - waits == 1
+        assert sample("db_pool_hold_seconds_count", engine="sync", endpoint="background") - holds == 1
+
+    def test_checkout_is_attributed_to_the_route(self, monitored):
+        monitor, engine = monitored
+        scope = {"method": "POST", "path": "/things/7", "route": SimpleNamespace(path="/things/{id}")}
+        token = current_scope.set(scope)
+        try:
+            with engine.connect():
+                [held] = monitor.snapshot()
+        finally:
+            current_scope.reset(token)
+
+        assert held["endpoint"] == "/things/{id}"
+        assert held["request"] == "POST /things/7"
+        assert any("test_checkout_is_attributed_to_the_route" in frame for frame in held["stack"])
+        assert not any("sqlalchemy" in frame for frame in held["stack"])
+
+    def test_leaks_are_logged_once(self, monitored, caplog):
+        monitor, engine = monitored
+        monitor.leak_threshold = 0
+        before = sample("db_pool_leaks_total", engine="sync", endpoint="background")
+
+        with engine.connect():
+            with caplog.at_level(logging.WARNING, logger="app.pool_monitor"):
+                assert len(monitor.check_leaks()) == 1
+                assert monitor.check_leaks() == []
+
+        assert "test_leaks_are_logged_once" in caplog.text
+        assert sample("db_pool_leaks_total", engine="sync", endpoint="background") - before == 1
+
+    def test_engine_can_have_its_own_leak_threshold(self, monitored):
+        monitor, engine = monitored
+        monitor.leak_threshold = 0
+        exports = create_engine("sqlite://", poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=0)
+        monitor.attach(exports, leak_threshold=60)
+
+        with exports.connect(), engine.connect():
+            [leak] = monitor.check_leaks()
+        exports.dispose()
+
+        # Only the connection from the engine without an override.
+        assert leak.leak_threshold is None
+
+    async def test_stack_reaches_through_the_async_bridge(self, monitored):
+        # Async engines check out inside a greenlet; the awaiting coroutine
+        # must still show up in the captured stack.
+        monitor, engine = monitored
+
+        def checkout():
+            conn = engine.connect()
+            stack = monitor.snapshot()[0]["stack"]
+            conn.close()
+            return stack
+
+        async def handler():
+            return await greenlet_spawn(checkout)
+
+        stack = await handler()
+        assert any(frame.endswith("in handler") for frame in stack)
+
+
+class TestPoolEndpoint:
+    def test_admin_pool_lists_held_connections(self, monitored):
+        from app.main import app
+
+        monitor, engine = monitored
+        with patch("app.main.async_engine", engine), patch("app.main.engine", engine), \
+                patch("app.main.pool_monitor", monitor), engine.connect():
+            response = TestClient(app).get("/admin/pool")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["pools"]["async"]["checked_out"] == 1
+        assert data["leak_threshold_seconds"] == 60
+        assert data["held"][0]["engine"] == "sync"
@@ -0,0 +1,150 @@
+import asyncio
+import pstats
+import sys
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.profiling import (
+    Busy,
+    ProfileMiddleware,
+    ReportStore,
+    StackSampler,
+    collapse,
+    render_collapsed,
+)
+
+TOKEN = "s3cret"
+
+
+def spin(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+def make_client(store):
+    app = FastAPI()
+
+    @app.get("/slow")
+    async def slow():
+        spin(0.01)
+        return {"ok": True}
+
+    app.add_middleware(ProfileMiddleware, store=store)
+    return TestClient(app)
+
+
+@pytest.fixture
+def store(tmp_path):
+    with patch("app.profiling.PROFILE_TOKEN", TOKEN):
+        yield ReportStore(tmp_path / "profiles", keep=2)
+
+
+def report_id(response):
+    return response.headers["x-profile-report"].rsplit("/", 1)[1]
+
+
+class TestProfileMiddleware:
+    def test_requests_without_the_token_are_not_profiled(self, store):
+        client = make_client(store)
+
+        for response in (client.get("/slow"), client.get("/slow", headers={"X-Profile-Token": "wrong"})):
+            assert response.status_code == 200
+            assert "x-profile-report" not in response.headers
+        assert not store.directory.exists()
+
+    def test_token_header_profiles_the_request(self, store):
+        response = make_client(store).get("/slow", headers={"X-Profile-Token": TOKEN})
+
+        assert response.json() == {"ok": True}
+        path = store.path(report_id(response))
+        functions = {name for _, _, name in pstats.Stats(str(path)).stats}
+        assert "spin" in functions
+        assert "spin" in store.render(report_id(response))
+
+    def test_token_in_the_query_string_is_ignored(self, store):
+        response = make_client(store).get(f"/slow?profile={TOKEN}")
+
+        assert "x-profile-report" not in response.headers
+        assert not store.directory.exists()
+
+    def test_only_the_newest_reports_are_kept(self, store):
+        client = make_client(store)
+        ids = [report_id(client.get("/slow", headers={"X-Profile-Token": TOKEN})) for _ in range(3)]
+
+        assert [store.path(id_) is not None for id_ in ids] == [False, True, True]
+
+    def test_report_ids_cannot_escape_the_directory(self, store):
+        assert store.path("../../etc/passwd") is None
+
+    def test_disabled_without_a_configured_token(self, tmp_path):
+        store = ReportStore(tmp_path)
+        with patch("app.profiling.PROFILE_TOKEN", ""):
+            response = make_client(store).get("/slow", headers={"X-Profile-Token": ""})
+        assert "x-profile-report" not in response.headers
+
+
+class TestStackSampler:
+    async def test_samples_the_event_loop_thread(self):
+        sampler = StackSampler(interval=0.001)
+        task = asyncio.create_task(sampler.profile_loop(0.2))
+        await asyncio.sleep(0.02)
+        spin(0.1)
+
+        stacks = await task
+
+        assert any("spin (test_profiling.py)" in stack for stack in stacks)
+        lines = render_collapsed(stacks).splitlines()
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+    async def test_one_profile_at_a_time(self):
+        sampler = StackSampler(interval=0.001)
+        first = asyncio.create_task(sampler.profile_loop(0.1))
+        await asyncio.sleep(0.02)
+
+        with pytest.raises(Busy):
+            await sampler.profile_loop(0.1)
+        await first
+
+    def test_collapsed_stack_is_outermost_first(self):
+        def inner():
+            return collapse(sys._getframe())
+
+        stack = inner().split(";")
+        assert stack[-1].startswith("TestStackSampler.test_collapsed_stack_is_outermost_first.<locals>.inner")
+        assert stack[-2].startswith("TestStackSampler.test_collapsed_stack_is_outermost_first ")
+
+
+class TestProfileEndpoints:
+    @pytest.fixture
+    def client(self, tmp_path):
+        from app.main import app
+        with patch("app.main.PROFILE_TOKEN", TOKEN), patch("app.profiling.PROFILE_TOKEN", TOKEN), \
+                patch("app.main.report_store", ReportStore(tmp_path)):
+            yield TestClient(app)
+
+    def test_not_found_when_disabled(self):
+        from app.main import app
+        assert TestClient(app).get("/admin/profile?seconds=0.01").status_code == 404
+
+    def test_token_is_required(self, client):
+        assert client.get("/admin/profile?seconds=0.01").status_code == 403
+        assert client.get("/admin/profile/requests/" + "0" * 32).status_code == 403
+
+    def test_sampling_returns_collapsed_stacks(self, client):
+        response = client.get("/admin/profile?seconds=0.05", headers={"X-Profile-Token": TOKEN})
+
+        assert response.status_code == 200
+        assert response.headers["content-disposition"].endswith('.collapsed"')
+        assert response.text.strip()
+
+    def test_token_is_only_read_from_the_header(self, client):
+        assert client.get(f"/admin/profile?seconds=0.01&profile={TOKEN}").status_code == 403
+
+    def test_missing_report(self, client):
+        response = client.get(f"/admin/profile/requests/{'0' * 32}", headers={"X-Profile-Token": TOKEN})
+        assert response.status_code == 404
@@ -0,0 +1,146 @@
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import insert
+
+from app.models import Vote, VoteSession
+from app.reconcile import TallyReconciler
+from app.redis_client import activate_session
+from app.sessions import VoteSessions
+
+CHOICES = ["print", "stare", "ai"]
+
+
+@pytest.fixture
+def votes_db(fake_async_engine):
+    return fake_async_engine("app.reconcile.async_engine", "app.sessions.async_engine", models=[Vote, VoteSession])
+
+
+@pytest.fixture
+def redis(redis):
+    redis.set("vote_session", 1)
+    return redis
+
+
+def make_reconciler():
+    return TallyReconciler(CHOICES, VoteSessions(CHOICES))
+
+
+def add_votes(conn, *choices, start_id=None, session=1):
+    rows = [{"choice": choice, "session_id": session} for choice in choices]
+    if start_id is not None:
+        rows = [dict(row, id=start_id + i) for i, row in enumerate(rows)]
+    conn.execute(insert(Vote), rows)
+
+
+class TestTallyReconciler:
+    async def test_rebuilds_lost_tally(self, votes_db, redis):
+        add_votes(votes_db, "print", "print", "ai")
+        before = REGISTRY.get_sample_value("vote_reconcile_corrections_total", {"choice": "print"}) or 0
+
+        result = await make_reconciler().reconcile()
+
+        assert result["mode"] == "full"
+        assert result["restored"] == {"print": 2, "ai": 1}
+        assert redis.hgetall("session:1:vote_counts") == {"print": "2", "ai": "1"}
+        assert redis.get("vote_counts_version") == "1"
+        assert REGISTRY.get_sample_value("vote_reconcile_corrections_total", {"choice": "print"}) - before == 2
+        assert REGISTRY.get_sample_value("vote_tally_drift", {"choice": "print"}) == -2
+
+    async def test_redis_ahead_is_left_alone(self, votes_db, redis):
+        add_votes(votes_db, "stare")
+        redis.hset("session:1:vote_counts", mapping={"stare": 3})
+
+        result = await make_reconciler().reconcile()
+
+        assert result["restored"] == {}
+        assert redis.hget("session:1:vote_counts", "stare") == "3"
+        assert redis.get("vote_counts_version") is None
+        assert REGISTRY.get_sample_value("vote_tally_drift", {"choice": "stare"}) == 2
+
+    async def test_later_passes_only_count_new_rows(self, votes_db, redis):
+        reconciler = make_reconciler()
+        add_votes(votes_db, "print", "ai")
+        await reconciler.reconcile()
+        redis.flushdb()
+
+        add_votes(votes_db, "ai", "ai")
+        result = await reconciler.reconcile()
+
+        assert result["mode"] == "incremental"
+        assert result["postgres"] == {"print": 1, "stare": 0, "ai": 3}
+        assert result["watermark"] == 4
+        assert redis.hgetall("session:1:vote_counts") == {"print": "1", "stare": "0", "ai": "3"}
+
+    async def test_late_commit_below_watermark_is_counted(self, votes_db, redis):
+        reconciler = make_reconciler()
+        add_votes(votes_db, "print", start_id=1)
+        await reconciler.reconcile()
+
+        add_votes(votes_db, "print", start_id=3)
+        await reconciler.reconcile()
+
+        # id 2 was allocated before id 3 but committed after it was seen.
+        add_votes(votes_db, "stare", start_id=2)
+        result = await reconciler.reconcile()
+        assert result["postgres"] == {"print": 2, "stare": 1, "ai": 0}
+
+        result = await reconciler.reconcile()
+        assert result["mode"] == "incremental"
+        assert result["postgres"] == {"print": 2, "stare": 1, "ai": 0}
+
+    async def test_new_session_starts_with_a_full_count(self, votes_db, redis):
+        reconciler = make_reconciler()
+        add_votes(votes_db, "print", "print")
+        await reconciler.reconcile()
+
+        await activate_session(2, CHOICES)
+        add_votes(votes_db, "ai", session=2)
+        result = await reconciler.reconcile()
+
+        assert result["session"] == 2
+        assert result["mode"] == "full"
+        assert result["postgres"] == {"print": 0, "stare": 0, "ai": 1}
+        assert redis.hgetall("session:2:vote_counts") == {"print": "0", "stare": "0", "ai": "1"}
+        assert redis.hgetall("session:1:vote_counts") == {"print": "2"}
+
+    async def test_lost_session_pointer_is_restored(self, votes_db, redis):
+        votes_db.execute(insert(VoteSession), [{"name": "a"}, {"name": "b"}])
+        add_votes(votes_db, "stare", session=2)
+        redis.flushdb()
+
+        result = await make_reconciler().reconcile()
+
+        assert redis.get("vote_session") == "2"
+        assert result["restored"] == {"stare": 1}
+
+    async def test_reset_during_reconcile_is_refused(self, votes_db, redis):
+        add_votes(votes_db, "print")
+        reconciler = make_reconciler()
+
+        async def count_then_reset(session):
+            counts = await TallyReconciler.count_postgres(reconciler, session)
+            await activate_session(2, CHOICES)
+            return counts
+
+        with patch.object(reconciler, "count_postgres", count_then_reset):
+            result = await reconciler.reconcile()
+
+        assert result["status"] == "skipped"
+        assert redis.hget("session:1:vote_counts", "print") is None
+
+
+class TestReconcileEndpoint:
+    def test_admin_reconcile(self, votes_db, redis):
+        from app.main import app, reconciler, sessions
+
+        reconciler.invalidate()
+        sessions.clear()
+        add_votes(votes_db, "ai")
+        response = TestClient(app).post("/admin/reconcile")
+
+        assert response.status_code == 200
+        assert response.json()["restored"] == {"ai": 1}
+        assert redis.hget("session:1:vote_counts", "ai") == "1"
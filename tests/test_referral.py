@@ -1,57 +1,218 @@
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from sqlalchemy import create_engine, delete, insert
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models import ReferralPartner
+
+
+@pytest.fixture(autouse=True)
+def clear_referral_cache():
+    from app.referral import _referral_cache
+    _referral_cache.clear()
+    yield
+    _referral_cache.clear()
+
+
+@pytest.fixture
+def partners_db():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[ReferralPartner.__table__])
+    with patch("app.referral_index.engine", engine):
+        yield engine
+    engine.dispose()
+
+
+def add_partners(engine, *ids):
+    with engine.begin() as conn:
+        conn.execute(insert(ReferralPartner), [{"id": i, "code": f"code-{i}", "name": f"Partner {i}"} for i in ids])
+
+
+def make_engine(partner):
+    mock_result = MagicMock()
+    mock_result.scalar_one_or_none.return_value = partner
+
+    mock_conn = AsyncMock()
+    mock_conn.execute.return_value = mock_result
+
+    mock_engine = MagicMock()
+    mock_engine.connect.return_value.__aenter__.return_value = mock_conn
+    mock_engine.connect.return_value.__aexit__.return_value = False
+    return mock_engine
 
 
 class TestReferralValidation:
-    def test_validate_referral_returns_partner(self):
+    async def test_validate_referral_returns_partner(self):
         mock_partner = MagicMock()
         mock_partner.code = "test-code"
         mock_partner.name = "Test Partner"
 
-        mock_result = MagicMock()
-        mock_result.scalar_one_or_none.return_value = mock_partner
+        mock_engine = make_engine(mock_partner)
+
+        with patch('app.referral.async_engine', mock_engine):
+            from app.referral import validate_referral
+            result = await validate_referral("test-code")
 
-        mock_conn = MagicMock()
-        mock_conn.execute.return_value = mock_result
+        assert result == mock_partner
+        mock_engine.connect.return_value.__aexit__.assert_awaited_once()
 
-        mock_engine = MagicMock()
-        mock_engine.connect.return_value = mock_conn
+    async def test_validate_referral_returns_none_for_invalid_code(self):
+        mock_engine = make_engine(None)
 
-        with patch('app.referral.engine', mock_engine):
+        with patch('app.referral.async_engine', mock_engine):
             from app.referral import validate_referral
-            result = validate_referral("test-code")
+            result = await validate_referral("invalid-code")
 
-        assert result == mock_partner
-        mock_conn.close.assert_called_once()
+        assert result is None
+        mock_engine.connect.return_value.__aexit__.assert_awaited_once()
+
+    async def test_validate_referral_connection_closed_on_error(self):
+        mock_engine = make_engine(None)
+        mock_conn = mock_engine.connect.return_value.__aenter__.return_value
+        mock_conn.execute.side_effect = RuntimeError("boom")
+
+        with patch('app.referral.async_engine', mock_engine):
+            from app.referral import validate_referral
+            with pytest.raises(RuntimeError):
+                await validate_referral("any-code")
 
-    def test_validate_referral_returns_none_for_invalid_code(self):
-        mock_result = MagicMock()
-        mock_result.scalar_one_or_none.return_value = None
+        mock_engine.connect.return_value.__aexit__.assert_awaited_once()
 
-        mock_conn = MagicMock()
-        mock_conn.execute.return_value = mock_result
 
-        mock_engine = MagicMock()
-        mock_engine.connect.return_value = mock_conn
+class TestReferralCache:
+    async def test_valid_code_is_cached(self):
+        mock_engine = make_engine(1)
 
-        with patch('app.referral.engine', mock_engine):
+        with patch('app.referral.async_engine', mock_engine):
             from app.referral import validate_referral
-            result = validate_referral("invalid-code")
+            assert await validate_referral("conf-partner-2026") == 1
+            assert await validate_referral("conf-partner-2026") == 1
 
-        assert result is None
-        mock_conn.close.assert_called_once()
+        assert mock_engine.connect.call_count == 1
+
+    async def test_invalid_code_is_negatively_cached(self):
+        mock_engine = make_engine(None)
+
+        with patch('app.referral.async_engine', mock_engine):
+            from app.referral import validate_referral
+            for _ in range(5):
+                assert await validate_referral("bogus") is None
+
+        assert mock_engine.connect.call_count == 1
+
+    def test_lru_eviction_respects_maxsize(self):
+        from app.referral import ReferralCache
 
-    def test_validate_referral_connection_closed_on_success(self):
-        mock_result = MagicMock()
-        mock_result.scalar_one_or_none.return_value = None
+        cache = ReferralCache(maxsize=2, ttl=60, negative_ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
 
-        mock_conn = MagicMock()
-        mock_conn.execute.return_value = mock_result
+        assert len(cache) == 2
+        assert cache.get("a") == (True, 1)
+        assert cache.get("b") == (False, None)
+        assert cache.get("c") == (True, 3)
 
-        mock_engine = MagicMock()
-        mock_engine.connect.return_value = mock_conn
+    def test_entries_expire_after_ttl(self):
+        from app.referral import ReferralCache
 
-        with patch('app.referral.engine', mock_engine):
+        cache = ReferralCache(maxsize=10, ttl=30, negative_ttl=5)
+        with patch('app.referral.time.monotonic', return_value=1000.0):
+            cache.set("good", 1)
+            cache.set("bad", None)
+
+        with patch('app.referral.time.monotonic', return_value=1010.0):
+            assert cache.get("good") == (True, 1)
+            assert cache.get("bad") == (False, None)
+
+        with patch('app.referral.time.monotonic', return_value=1031.0):
+            assert cache.get("good") == (False, None)
+
+        assert len(cache) == 0
+
+
+class TestReferralIndex:
+    def test_bloom_filter_has_no_false_negatives(self):
+        from app.referral_index import BloomFilter
+
+        bloom = BloomFilter(capacity=1000, false_positive_rate=0.01)
+        codes = [f"code-{i}" for i in range(1000)]
+        for code in codes:
+            bloom.add(code)
+
+        assert all(code in bloom for code in codes)
+        assert sum(f"other-{i}" in bloom for i in range(1000)) < 50
+
+    def test_unbuilt_index_treats_every_code_as_maybe(self):
+        from app.referral_index import ReferralIndex
+
+        assert ReferralIndex().might_contain("anything")
+
+    async def test_absent_code_skips_database(self):
+        from app.referral_index import BloomFilter
+
+        bloom = BloomFilter(capacity=10, false_positive_rate=0.001)
+        bloom.add("conf-partner-2026")
+        mock_engine = make_engine(1)
+
+        with patch('app.referral.async_engine', mock_engine), \
+                patch('app.referral.referral_index._filter', bloom):
             from app.referral import validate_referral
-            validate_referral("any-code")
+            assert await validate_referral("not-a-real-code") is None
+            assert await validate_referral("conf-partner-2026") == 1
+
+        assert mock_engine.connect.call_count == 1
+
+
+class TestReferralIndexRefresh:
+    @pytest.fixture
+    def index(self, partners_db):
+        from app.referral_index import ReferralIndex
+        add_partners(partners_db, 1, 2, 3)
+        index = ReferralIndex()
+        index.build()
+        return index
+
+    def test_refresh_adds_new_codes(self, index, partners_db):
+        add_partners(partners_db, 4, 5)
+        assert not index.might_contain("code-5")
+
+        index.refresh()
+
+        assert all(index.might_contain(f"code-{i}") for i in range(1, 6))
+
+    def test_late_commit_below_the_last_id_read_is_added(self, index, partners_db):
+        # 5 commits before 4 does, so the first refresh only sees 5.
+        add_partners(partners_db, 5)
+        index.refresh()
+        add_partners(partners_db, 4)
+
+        with patch.object(index, "build") as build:
+            index.refresh()
+
+        assert index.might_contain("code-4")
+        build.assert_not_called()
+
+    def test_commit_later_than_one_refresh_triggers_a_rebuild(self, index, partners_db):
+        add_partners(partners_db, 6)
+        index.refresh()
+        index.refresh()
+        add_partners(partners_db, 4)
+
+        index.refresh()
+
+        assert index.might_contain("code-4")
+        assert index._settled_rows == 5
+
+    def test_reseeded_table_is_rebuilt(self, index, partners_db):
+        with partners_db.begin() as conn:
+            conn.execute(delete(ReferralPartner))
+        add_partners(partners_db, 1)
+
+        index.refresh()
 
-        mock_conn.close.assert_called_once()
+        assert not index.might_contain("code-3")
+        assert index.might_contain("code-1")
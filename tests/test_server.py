@@ -0,0 +1,46 @@
+from unittest.mock import patch
+
+import pytest
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+from app import server
+
+
+def run_kwargs():
+    with patch("app.server.uvicorn.run") as run, patch("app.server.prepare_metrics_dir"):
+        server.main()
+    return run.call_args.kwargs
+
+
+async def client_seen(peer, forwarded_for):
+    """The request.client host the app sees for a request from ``peer``."""
+    seen = {}
+
+    async def app(scope, receive, send):
+        seen["client"] = scope["client"][0]
+
+    proxied = ProxyHeadersMiddleware(app, trusted_hosts=run_kwargs()["forwarded_allow_ips"])
+    scope = {
+        "type": "http", "client": (peer, 5000), "scheme": "http",
+        "headers": [(b"x-forwarded-for", forwarded_for.encode())],
+    }
+    await proxied(scope, None, None)
+    return seen["client"]
+
+
+class TestProxyHeaders:
+    def test_only_configured_proxies_are_trusted(self):
+        kwargs = run_kwargs()
+        assert kwargs["proxy_headers"]
+        assert kwargs["forwarded_allow_ips"] == server.FORWARDED_ALLOW_IPS != "*"
+
+    async def test_forged_header_from_an_untrusted_peer_is_ignored(self):
+        assert await client_seen("203.0.113.5", "1.2.3.4") == "203.0.113.5"
+
+    async def test_ingress_gets_the_address_it_saw(self):
+        # The voter wrote 1.2.3.4 themselves; the ingress appended 198.51.100.9.
+        assert await client_seen("10.42.0.17", "1.2.3.4, 198.51.100.9") == "198.51.100.9"
+
+    @pytest.mark.parametrize("peer", ["10.42.3.4", "127.0.0.1"])
+    async def test_default_trusts_the_pod_network(self, peer):
+        assert await client_seen(peer, "198.51.100.9") == "198.51.100.9"
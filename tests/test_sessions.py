@@ -0,0 +1,107 @@
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, insert, select
+
+from app.models import Vote, VoteSession
+from app.redis_client import SessionChanged, increment_vote
+from app.sessions import VoteSessions
+
+CHOICES = ["print", "stare", "ai"]
+
+
+@pytest.fixture
+def votes_db(fake_async_engine):
+    conn = fake_async_engine("app.sessions.async_engine", models=[Vote, VoteSession])
+    conn.execute(insert(VoteSession).values(name="default"))
+    return conn
+
+
+def add_votes(conn, session, count):
+    conn.execute(insert(Vote), [{"choice": "print", "session_id": session}] * count)
+
+
+def votes_per_session(conn):
+    return dict(conn.execute(select(Vote.session_id, func.count()).group_by(Vote.session_id)).all())
+
+
+class TestVoteSessions:
+    async def test_pointer_is_restored_from_postgres(self, votes_db, redis):
+        votes_db.execute(insert(VoteSession).values(name="second"))
+
+        assert await VoteSessions(CHOICES).current() == 2
+        assert redis.get("vote_session") == "2"
+        assert redis.hgetall("session:2:vote_counts") == {"print": "0", "stare": "0", "ai": "0"}
+
+    async def test_start_new_switches_without_touching_votes(self, votes_db, redis):
+        sessions = VoteSessions(CHOICES)
+        await sessions.current()
+        add_votes(votes_db, 1, 3)
+        await increment_vote(1, "ai")
+
+        assert await sessions.start_new("keynote") == 2
+
+        assert await sessions.current() == 2
+        assert redis.get("vote_session") == "2"
+        assert redis.hget("session:2:vote_counts", "ai") == "0"
+        assert redis.hget("session:1:vote_counts", "ai") == "1"
+        assert votes_per_session(votes_db) == {1: 3}
+
+    async def test_stale_session_is_refused_then_retried(self, votes_db, redis):
+        sessions = VoteSessions(CHOICES)
+        other = VoteSessions(CHOICES)
+        await sessions.current()
+        await other.start_new()
+
+        with pytest.raises(SessionChanged):
+            await increment_vote(1, "print")
+
+        session, count = await sessions.call(increment_vote, "print")
+        assert (session, count) == (2, 1)
+
+    async def test_purge_keeps_the_newest_sessions(self, votes_db, redis):
+        sessions = VoteSessions(CHOICES, keep=2)
+        for session in range(2, 5):
+            votes_db.execute(insert(VoteSession).values(name=f"s{session}"))
+        for session in range(1, 5):
+            add_votes(votes_db, session, 3)
+        await sessions.current()
+        await increment_vote(4, "print")
+        redis.hset("session:1:vote_counts", "print", 3)
+
+        with patch("app.sessions.PURGE_BATCH_PAUSE", 0):
+            assert await sessions.purge(batch_size=2) == 6
+
+        assert votes_per_session(votes_db) == {3: 3, 4: 3}
+        assert not redis.exists("session:1:vote_counts")
+        purged = votes_db.execute(select(VoteSession.id).where(VoteSession.purged_at.is_not(None))).scalars().all()
+        assert purged == [1, 2]
+        assert await sessions.purge() == 0
+
+
+class TestSessionEndpoints:
+    def test_reset_starts_a_new_session(self, votes_db, redis):
+        from app.main import app, sessions, tally
+
+        sessions.clear()
+        tally.clear()
+        redis.set("vote_session", 1)
+        redis.hset("session:1:vote_counts", "stare", 4)
+        client = TestClient(app)
+        assert client.get("/votes").json()["stare"]["count"] == 4
+
+        response = client.post("/admin/reset?confirm=yes&name=keynote")
+
+        assert response.status_code == 200
+        assert response.json()["session"] == 2
+        assert client.get("/votes").json()["stare"]["count"] == 0
+
+        listed = client.get("/admin/sessions").json()["sessions"]
+        assert [(s["id"], s["name"], s["current"]) for s in listed] == [(2, "keynote", True), (1, "default", False)]
+        sessions.clear()
+
+    def test_reset_requires_confirmation(self, votes_db, redis):
+        from app.main import app
+
+        assert TestClient(app).post("/admin/reset").status_code == 400
@@ -0,0 +1,63 @@
+import asyncio
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, patch
+
+import fakeredis
+from prometheus_client import REGISTRY
+
+from app.database import warm_pool
+from app.redis_client import warm_pool as warm_redis_pool
+from app.startup import StartupTimer
+
+
+class FakePool:
+    def __init__(self, fail_every=0):
+        self.open = 0
+        self.peak = 0
+        self.calls = 0
+        self.fail_every = fail_every
+
+    @asynccontextmanager
+    async def connect(self):
+        self.calls += 1
+        if self.fail_every and self.calls % self.fail_every == 0:
+            raise ConnectionRefusedError("postgres is down")
+        self.open += 1
+        self.peak = max(self.peak, self.open)
+        try:
+            yield AsyncMock()
+        finally:
+            self.open -= 1
+
+
+class TestWarmPool:
+    async def test_holds_every_connection_open_at_once(self):
+        pool = FakePool()
+        with patch("app.database.async_engine", pool):
+            assert await warm_pool(4) == 4
+        assert pool.peak == 4
+        assert pool.open == 0
+
+    async def test_a_failed_connection_does_not_hang_the_rest(self):
+        pool = FakePool(fail_every=3)
+        with patch("app.database.async_engine", pool):
+            assert await asyncio.wait_for(warm_pool(4), 1) == 3
+        assert pool.open == 0
+
+    async def test_redis_pool_is_filled(self):
+        client = fakeredis.FakeAsyncRedis()
+        with patch("app.redis_client.redis_client", client):
+            assert await warm_redis_pool(3) == 3
+        assert len(client.connection_pool._available_connections) == 3
+
+
+class TestStartupTimer:
+    def test_phases_are_exported(self):
+        timer = StartupTimer()
+        with timer.phase("test-schema"):
+            pass
+
+        total = timer.finish()
+
+        assert REGISTRY.get_sample_value("startup_phase_seconds", {"phase": "test-schema"}) == timer.phases["test-schema"]
+        assert REGISTRY.get_sample_value("startup_phase_seconds", {"phase": "total"}) == total
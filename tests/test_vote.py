@@ -1,35 +1,56 @@
-from unittest.mock import MagicMock, patch
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
 
-import fakeredis
 import pytest
 from fastapi.testclient import TestClient
 
 
 @pytest.fixture
-def mock_redis():
-    fake_redis = fakeredis.FakeStrictRedis(decode_responses=True)
-    with patch('app.redis_client.redis_client', fake_redis):
-        with patch('app.main.redis_client', fake_redis):
-            yield fake_redis
+def mock_redis(redis):
+    redis.set("vote_session", 1)
+    return redis
+
+
+@pytest.fixture(autouse=True)
+def clear_tally():
+    from app.main import sessions, tally, timeline, vote_rate_limiter
+    vote_rate_limiter.clear()
+    sessions.clear()
+    tally.clear()
+    timeline.clear()
+    yield
+    sessions.clear()
+    tally.clear()
+    timeline.clear()
 
 
 @pytest.fixture
 def mock_db():
     mock_engine = MagicMock()
-    mock_conn = MagicMock()
-    mock_engine.connect.return_value.__enter__ = MagicMock(return_value=mock_conn)
-    mock_engine.connect.return_value.__exit__ = MagicMock(return_value=False)
+    mock_conn = AsyncMock()
+    mock_engine.connect.return_value.__aenter__.return_value = mock_conn
+    mock_engine.connect.return_value.__aexit__.return_value = False
+    mock_engine.begin.return_value.__aenter__.return_value = mock_conn
+    mock_engine.begin.return_value.__aexit__.return_value = False
 
     mock_pool = MagicMock()
     mock_pool.size.return_value = 5
     mock_pool.checkedout.return_value = 0
     mock_engine.pool = mock_pool
 
-    with patch('app.main.engine', mock_engine):
-        with patch('app.database.engine', mock_engine):
+    with patch('app.main.async_engine', mock_engine):
+        with patch('app.database.async_engine', mock_engine), patch('app.vote_fallback.async_engine', mock_engine):
             yield mock_engine
 
 
+@pytest.fixture
+def writer():
+    writer = MagicMock()
+    writer.reserve = AsyncMock()
+    with patch('app.main.VOTE_WRITE_BEHIND_ENABLED', True), patch('app.main.vote_writer', writer):
+        yield writer
+
+
 @pytest.fixture
 def client(mock_redis, mock_db):
     from app.main import app
@@ -50,13 +71,150 @@ class TestVoteEndpoint:
 
     def test_vote_increments_redis(self, client, mock_redis):
         client.post("/vote", json={"choice": "stare"})
-        count = mock_redis.get("vote:stare")
+        count = mock_redis.hget("session:1:vote_counts", "stare")
         assert count == "1"
 
         client.post("/vote", json={"choice": "stare"})
-        count = mock_redis.get("vote:stare")
+        count = mock_redis.hget("session:1:vote_counts", "stare")
         assert count == "2"
 
+    def test_vote_inserts_row(self, client, mock_db):
+        client.post("/vote", json={"choice": "ai"})
+        conn = mock_db.begin.return_value.__aenter__.return_value
+        conn.execute.assert_awaited_once()
+        mock_db.begin.assert_called_once()
+
+    def test_vote_spilled_to_stream_when_postgres_is_down(self, client, mock_redis, mock_db):
+        from sqlalchemy.exc import OperationalError
+
+        from app.circuit_breaker import CircuitBreaker
+        from app.vote_fallback import VoteFallback
+
+        conn = mock_db.begin.return_value.__aenter__.return_value
+        conn.execute.side_effect = OperationalError("INSERT", {}, TimeoutError())
+        with patch('app.main.vote_fallback', VoteFallback(CircuitBreaker("test", 3, 10))):
+            response = client.post("/vote", json={"choice": "revert"})
+
+        assert response.status_code == 200
+        assert mock_redis.hget("session:1:vote_counts", "revert") == "1"
+        [(_, fields)] = mock_redis.xrange("vote_fallback")
+        assert fields["choice"] == "revert"
+        assert len(fields["idempotency_key"]) == 32
+
+    def test_vote_fails_softly_when_postgres_and_the_stream_are_down(self, client, mock_db):
+        from redis.exceptions import ConnectionError as RedisConnectionError
+        from sqlalchemy.exc import OperationalError
+
+        from app.circuit_breaker import CircuitBreaker
+        from app.vote_fallback import VoteFallback
+
+        conn = mock_db.begin.return_value.__aenter__.return_value
+        conn.execute.side_effect = OperationalError("INSERT", {}, TimeoutError())
+        with patch('app.main.vote_fallback', VoteFallback(CircuitBreaker("test", 3, 10))), \
+                patch('app.vote_fallback.append_fallback_votes', side_effect=RedisConnectionError("redis is down")):
+            response = client.post("/vote", json={"choice": "revert"})
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+
+    def test_vote_write_behind_enqueues(self, client, mock_redis, mock_db, writer):
+        response = client.post("/vote", json={"choice": "ai"})
+
+        assert response.status_code == 200
+        writer.reserve.assert_awaited_once()
+        [row], _ = writer.put.call_args
+        assert (row["choice"], row["referral_code"], row["session_id"]) == ("ai", None, 1)
+        mock_db.connect.assert_not_called()
+        assert mock_redis.hget("session:1:vote_counts", "ai") == "1"
+
+    def test_vote_write_behind_queue_full(self, client, mock_redis, writer):
+        from app.vote_writer import VoteQueueFull
+
+        writer.reserve.side_effect = VoteQueueFull("full")
+        response = client.post("/vote", json={"choice": "ai"})
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+        assert mock_redis.hget("session:1:vote_counts", "ai") is None
+        writer.put.assert_not_called()
+
+    def test_vote_racing_a_reset_is_stored_in_the_new_session(self, client, mock_redis):
+        rows = []
+        with patch('app.main.vote_fallback.write', new_callable=AsyncMock) as write:
+            write.side_effect = rows.extend
+            client.post("/vote", json={"choice": "print"})
+            # Another replica resets; this process still has session 1 cached.
+            mock_redis.set("vote_session", 2)
+            response = client.post("/vote", json={"choice": "ai"})
+
+        assert response.status_code == 200
+        assert mock_redis.hget("session:2:vote_counts", "ai") == "1"
+        assert mock_redis.hget("session:1:vote_counts", "ai") is None
+        assert [row["session_id"] for row in rows] == [1, 2]
+
+    def test_write_behind_vote_racing_a_reset_is_queued_in_the_new_session(self, client, mock_redis, writer):
+        client.post("/vote", json={"choice": "print"})
+        mock_redis.set("vote_session", 2)
+        client.post("/vote", json={"choice": "ai"})
+
+        assert mock_redis.hget("session:2:vote_counts", "ai") == "1"
+        assert [call.args[0]["session_id"] for call in writer.put.call_args_list] == [1, 2]
+        writer.release.assert_not_called()
+
+    def test_vote_racing_two_resets_asks_to_retry(self, client, mock_redis, writer):
+        from app.redis_client import SessionChanged
+
+        with patch('app.main.increment_vote', AsyncMock(side_effect=SessionChanged(3))):
+            response = client.post("/vote", json={"choice": "ai"})
+
+        assert response.status_code == 503
+        writer.release.assert_called_once()
+        writer.put.assert_not_called()
+
+    def test_vote_rate_limited_per_client(self, client, mock_redis):
+        from app.admission import RateLimiter
+
+        with patch('app.main.vote_rate_limiter', RateLimiter(rate=0.5, burst=2)):
+            responses = [client.post("/vote", json={"choice": "print"}) for _ in range(3)]
+
+        assert [r.status_code for r in responses] == [200, 200, 429]
+        assert responses[2].headers["retry-after"] == "2"
+        assert mock_redis.hget("session:1:vote_counts", "print") == "2"
+
+    def test_vote_rate_limit_is_per_voter_behind_the_ingress(self, mock_redis, mock_db):
+        from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+        from app.admission import RateLimiter
+        from app.main import app
+        from app.server import FORWARDED_ALLOW_IPS
+
+        proxied = ProxyHeadersMiddleware(app, trusted_hosts=FORWARDED_ALLOW_IPS)
+
+        async def via_ingress(scope, receive, send):
+            await proxied({**scope, "client": ("10.42.0.17", 40000)}, receive, send)
+
+        client = TestClient(via_ingress)
+
+        def vote(forwarded_for):
+            return client.post("/vote", json={"choice": "print"}, headers={"X-Forwarded-For": forwarded_for})
+
+        with patch('app.main.vote_rate_limiter', RateLimiter(rate=0.5, burst=1)):
+            assert vote("198.51.100.1").status_code == 200
+            # The ingress appends the address it saw; a prefix the voter forged doesn't help.
+            assert vote("1.2.3.4, 198.51.100.1").status_code == 429
+            assert vote("198.51.100.2").status_code == 200
+
+    def test_vote_shed_when_overloaded(self, client, mock_redis, mock_db):
+        from app.admission import AdmissionController
+
+        with patch('app.main.admission', AdmissionController(limit=0, max_queue=0)):
+            response = client.post("/vote", json={"choice": "print"})
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+        mock_db.begin.assert_not_called()
+        assert mock_redis.hget("session:1:vote_counts", "print") is None
+
     def test_vote_all_choices(self, client, mock_redis):
         choices = ["print", "stare", "ai", "revert", "restart"]
         for choice in choices:
@@ -74,8 +232,7 @@ class TestVotesEndpoint:
             assert data[choice]["count"] == 0
 
     def test_get_votes_with_data(self, client, mock_redis):
-        mock_redis.set("vote:print", "5")
-        mock_redis.set("vote:ai", "3")
+        mock_redis.hset("session:1:vote_counts", mapping={"print": 5, "ai": 3})
 
         response = client.get("/votes")
         assert response.status_code == 200
@@ -83,6 +240,111 @@ class TestVotesEndpoint:
         assert data["print"]["count"] == 5
         assert data["ai"]["count"] == 3
 
+    async def test_get_votes_after_legacy_migration(self, mock_redis):
+        from app.main import VALID_CHOICES, tally
+        from app.redis_client import migrate_legacy_vote_keys
+
+        mock_redis.set("vote:print", "5")
+        mock_redis.set("vote:ai", "3")
+        mock_redis.hset("vote_counts", "ai", 1)  # the tally hash from before sessions
+
+        assert await migrate_legacy_vote_keys(1, VALID_CHOICES) == 3
+        assert await migrate_legacy_vote_keys(1, VALID_CHOICES) == 0
+        assert mock_redis.keys("vote:*") == []
+        assert not mock_redis.exists("vote_counts")
+
+        snapshot = await tally.get()
+        assert snapshot.counts["print"] == 5
+        assert snapshot.counts["ai"] == 4
+
+    def test_get_votes_etag_revalidation(self, client, mock_redis):
+        from app.main import tally
+
+        first = client.get("/votes")
+        etag = first.headers["etag"]
+
+        cached = client.get("/votes", headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.content == b""
+
+        client.post("/vote", json={"choice": "print"})
+        # Normally the broadcaster refreshes the snapshot as soon as it sees the vote.
+        tally.clear()
+
+        changed = client.get("/votes", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["etag"] != etag
+        assert changed.json()["print"]["count"] == 1
+
+    def test_vote_bumps_tally_version(self, client, mock_redis):
+        client.post("/vote", json={"choice": "print"})
+        client.post("/vote", json={"choice": "ai"})
+        assert mock_redis.get("vote_counts_version") == "2"
+
+    def test_vote_publishes_update(self, client, mock_redis):
+        pubsub = mock_redis.pubsub()
+        pubsub.subscribe("vote_updates")
+        pubsub.get_message(timeout=1)
+
+        client.post("/vote", json={"choice": "restart"})
+
+        message = pubsub.get_message(timeout=1)
+        assert message["data"] == "restart"
+
+
+class TestTimelineEndpoint:
+    def test_vote_lands_in_time_buckets(self, client, mock_redis):
+        # fakeredis expires keys against the real clock, so stay near it.
+        minute = int(time.time()) // 60 * 60
+        with patch("app.redis_client.time.time", return_value=minute + 30.5):
+            client.post("/vote", json={"choice": "ai"})
+
+        assert mock_redis.hget(f"session:1:vote_timeline:1:{minute + 30}", "ai") == "1"
+        assert mock_redis.hget(f"session:1:vote_timeline:60:{minute}", "ai") == "1"
+        assert 0 < mock_redis.ttl(f"session:1:vote_timeline:1:{minute + 30}") < mock_redis.ttl(f"session:1:vote_timeline:60:{minute}")
+
+        response = client.get(f"/votes/timeline?from={minute + 25}&to={minute + 35}&step=1")
+        assert response.status_code == 200
+        assert response.json()["series"]["ai"][5] == 1
+        assert sum(response.json()["series"]["ai"]) == 1
+
+    def test_buckets_are_summed_per_step(self, client, mock_redis):
+        mock_redis.hset("session:1:vote_timeline:1:1000", mapping={"print": 2, "ai": 1})
+        mock_redis.hset("session:1:vote_timeline:1:1004", "print", 1)
+        mock_redis.hset("session:1:vote_timeline:1:1005", "print", 4)
+
+        data = client.get("/votes/timeline?from=1002&to=1009&step=5").json()
+
+        assert data["from"] == 1000
+        assert data["to"] == 1005
+        assert data["timestamps"] == [1000, 1005]
+        assert data["series"]["print"] == [3, 4]
+        assert data["series"]["ai"] == [1, 0]
+        assert data["series"]["stare"] == [0, 0]
+
+    def test_minute_steps_read_minute_buckets(self, client, mock_redis):
+        mock_redis.hset("session:1:vote_timeline:60:1200", "revert", 7)
+        mock_redis.hset("session:1:vote_timeline:1:1200", "revert", 1)
+
+        data = client.get("/votes/timeline?from=1200&to=1320&step=60").json()
+
+        assert data["timestamps"] == [1200, 1260, 1320]
+        assert data["series"]["revert"] == [7, 0, 0]
+
+    def test_default_window_reads_recent_votes(self, client, mock_redis):
+        client.post("/vote", json={"choice": "restart"})
+
+        data = client.get("/votes/timeline").json()
+
+        assert data["step"] == 10
+        assert data["to"] - data["from"] == 600
+        assert sum(data["series"]["restart"]) == 1
+
+    def test_invalid_windows_are_rejected(self, client, mock_redis):
+        assert client.get("/votes/timeline?from=2000&to=1000").status_code == 400
+        assert client.get("/votes/timeline?step=0").status_code == 400
+        assert client.get("/votes/timeline?from=0&to=86400&step=1").status_code == 400
+
 
 class TestHealthEndpoints:
     def test_health_check(self, client):
@@ -90,6 +352,20 @@ class TestHealthEndpoints:
         assert response.status_code == 200
         assert response.json()["status"] == "healthy"
 
+    def test_ready_answers_from_the_health_monitor(self, client, mock_db):
+        from app.main import health_monitor
+
+        for dependency in health_monitor.dependencies.values():
+            dependency.healthy = None
+        assert client.get("/ready").status_code == 503
+
+        with patch.object(health_monitor, "is_up", return_value=True), \
+                patch.object(health_monitor, "warm", True):
+            response = client.get("/ready")
+        assert response.status_code == 200
+        assert response.json()["status"] == "ready"
+        mock_db.connect.assert_not_called()
+
 
 class TestStaticPages:
     def test_voting_page(self, client):
@@ -0,0 +1,142 @@
+from unittest.mock import patch
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+
+from app.circuit_breaker import CircuitBreaker
+from app.models import Vote
+from app.redis_client import ensure_fallback_group
+from app.vote_fallback import VoteFallback, new_vote
+
+STREAM = "vote_fallback"
+
+
+@pytest.fixture
+def votes_db(fake_async_engine):
+    return fake_async_engine("app.vote_fallback.async_engine", models=[Vote])
+
+
+@pytest.fixture
+async def redis(redis):
+    await ensure_fallback_group()
+    return redis
+
+
+def stored(conn):
+    return conn.execute(select(func.count()).select_from(Vote)).scalar()
+
+
+def make_fallback(consumer="api-1", **kwargs):
+    return VoteFallback(CircuitBreaker("test", failure_threshold=2, reset_timeout=10), consumer=consumer, **kwargs)
+
+
+class TestCircuitBreaker:
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker("test-open", failure_threshold=2, reset_timeout=10)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.allow()
+
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert not breaker.allow()
+        assert REGISTRY.get_sample_value("circuit_breaker_state", {"name": "test-open"}) == 2
+
+    def test_half_open_lets_one_trial_through(self):
+        breaker = CircuitBreaker("test-trial", failure_threshold=1, reset_timeout=10)
+        with patch("app.circuit_breaker.time.monotonic", return_value=100.0):
+            breaker.record_failure()
+
+        with patch("app.circuit_breaker.time.monotonic", return_value=110.0):
+            assert breaker.allow()
+            assert breaker.state == "half_open"
+            assert not breaker.allow()
+            breaker.record_failure()
+            assert breaker.state == "open"
+
+        with patch("app.circuit_breaker.time.monotonic", return_value=120.0):
+            assert breaker.allow()
+            breaker.record_success()
+        assert breaker.state == "closed"
+        assert REGISTRY.get_sample_value("circuit_breaker_state", {"name": "test-trial"}) == 0
+
+
+class TestVoteFallback:
+    async def test_writes_go_to_postgres_when_healthy(self, votes_db, redis):
+        assert await make_fallback().write([new_vote("print", None, 1)])
+
+        assert stored(votes_db) == 1
+        assert redis.xlen(STREAM) == 0
+
+    async def test_failed_write_is_spilled_to_the_stream(self, votes_db, redis):
+        fallback = make_fallback()
+        votes_db.down = True
+        vote = new_vote("ai", "conf-partner-2026", 2)
+
+        assert not await fallback.write([vote])
+
+        [(_, fields)] = redis.xrange(STREAM)
+        assert fields["idempotency_key"] == vote["idempotency_key"]
+        assert fields["referral_code"] == "conf-partner-2026"
+        assert fields["session_id"] == "2"
+        assert fallback.breaker.failures == 1
+
+    async def test_open_breaker_skips_postgres(self, votes_db, redis):
+        fallback = make_fallback()
+        votes_db.down = True
+        for _ in range(2):
+            await fallback.write([new_vote("print", None, 1)])
+        attempts = len(votes_db.checkouts)
+
+        await fallback.write([new_vote("print", None, 1)])
+
+        assert len(votes_db.checkouts) == attempts
+        assert redis.xlen(STREAM) == 3
+
+    async def test_replay_moves_the_backlog_into_postgres(self, votes_db, redis):
+        fallback = make_fallback(batch_size=2)
+        votes_db.down = True
+        await fallback.write([new_vote("print", None, 1) for _ in range(5)])
+        votes_db.down = False
+        fallback.breaker.record_success()
+
+        assert await fallback.drain() == 5
+
+        assert stored(votes_db) == 5
+        assert redis.xlen(STREAM) == 0
+        rows = votes_db.execute(select(Vote.referral_code, Vote.session_id)).all()
+        assert set(rows) == {(None, 1)}
+
+    async def test_failed_replay_is_retried_without_duplicates(self, votes_db, redis):
+        fallback = make_fallback()
+        votes_db.down = True
+        await fallback.write([new_vote("stare", None, 1) for _ in range(3)])
+
+        with pytest.raises(OperationalError):
+            await fallback.replay()
+        assert redis.xpending(STREAM, "vote_replay")["pending"] == 3
+
+        # Pretend the first attempt committed but the ack was lost.
+        votes_db.down = False
+        entries = redis.xrange(STREAM)
+        votes_db.execute(Vote.__table__.insert().values(
+            choice="stare", session_id=1, idempotency_key=entries[0][1]["idempotency_key"]
+        ))
+
+        assert await fallback.replay() == 3
+        assert stored(votes_db) == 3
+        assert redis.xpending(STREAM, "vote_replay")["pending"] == 0
+
+    async def test_abandoned_entries_are_claimed_by_another_consumer(self, votes_db, redis):
+        crashed = make_fallback("api-1")
+        votes_db.down = True
+        await crashed.write([new_vote("revert", None, 1)])
+        with pytest.raises(OperationalError):
+            await crashed.replay()
+
+        votes_db.down = False
+        assert await make_fallback("api-2", claim_idle_ms=0).replay() == 1
+        assert stored(votes_db) == 1
@@ -0,0 +1,128 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from redis.exceptions import RedisError
+from sqlalchemy.dialects import postgresql
+
+from app.vote_writer import VoteQueueFull, VoteWriter
+
+
+@pytest.fixture
+def mock_engine():
+    mock_engine = MagicMock()
+    mock_conn = AsyncMock()
+    mock_engine.begin.return_value.__aenter__.return_value = mock_conn
+    mock_engine.begin.return_value.__aexit__.return_value = False
+
+    with patch('app.vote_fallback.async_engine', mock_engine):
+        yield mock_engine
+
+
+def inserted_batches(mock_engine):
+    conn = mock_engine.begin.return_value.__aenter__.return_value
+    return [call.args[0].compile(dialect=postgresql.dialect()).params for call in conn.execute.await_args_list]
+
+
+class TestVoteWriter:
+    async def test_full_batch_flushes_in_one_insert(self, mock_engine):
+        writer = VoteWriter(batch_size=3, flush_interval=10, max_queue=10, enqueue_timeout=0.1)
+        writer.start()
+
+        for choice in ["print", "ai", "stare"]:
+            await writer.enqueue(choice, None, 1)
+        await asyncio.sleep(0.05)
+
+        conn = mock_engine.begin.return_value.__aenter__.return_value
+        assert conn.execute.await_count == 1
+        await writer.stop()
+
+    async def test_partial_batch_flushes_after_interval(self, mock_engine):
+        writer = VoteWriter(batch_size=100, flush_interval=0.02, max_queue=10, enqueue_timeout=0.1)
+        writer.start()
+
+        await writer.enqueue("print", "conf-partner-2026", 3)
+        await asyncio.sleep(0.1)
+
+        conn = mock_engine.begin.return_value.__aenter__.return_value
+        assert conn.execute.await_count == 1
+        params = inserted_batches(mock_engine)[0]
+        assert params["choice_m0"] == "print"
+        assert params["referral_code_m0"] == "conf-partner-2026"
+        assert params["session_id_m0"] == 3
+        await writer.stop()
+
+    async def test_stop_drains_queue(self, mock_engine):
+        writer = VoteWriter(batch_size=2, flush_interval=10, max_queue=10, enqueue_timeout=0.1)
+        writer.start()
+
+        for _ in range(5):
+            await writer.enqueue("revert", None, 1)
+        await writer.stop()
+
+        conn = mock_engine.begin.return_value.__aenter__.return_value
+        assert conn.execute.await_count == 3
+        assert writer._queue.empty()
+
+    async def test_full_queue_rejects_after_timeout(self, mock_engine):
+        writer = VoteWriter(batch_size=10, flush_interval=10, max_queue=2, enqueue_timeout=0.01)
+        writer._queue = asyncio.Queue()
+        writer._slots = asyncio.Semaphore(2)
+        writer._wakeup = asyncio.Event()
+
+        await writer.enqueue("print", None, 1)
+        await writer.enqueue("print", None, 1)
+        with pytest.raises(VoteQueueFull):
+            await writer.enqueue("print", None, 1)
+
+    async def test_released_and_flushed_slots_are_reused(self, mock_engine):
+        writer = VoteWriter(batch_size=10, flush_interval=0.01, max_queue=1, enqueue_timeout=0.01)
+        writer.start()
+
+        await writer.reserve()
+        writer.release()
+        await writer.enqueue("print", None, 1)
+        await asyncio.sleep(0.05)
+        await writer.enqueue("ai", None, 1)
+        await writer.stop()
+
+        conn = mock_engine.begin.return_value.__aenter__.return_value
+        assert conn.execute.await_count == 2
+
+
+class TestVoteWriterShutdown:
+    @pytest.fixture
+    def stuck_fallback(self):
+        async def hang(rows):
+            await asyncio.sleep(10)
+
+        fallback = MagicMock()
+        fallback.write = hang
+        fallback.spill = AsyncMock()
+        with patch("app.vote_writer.vote_fallback", fallback):
+            yield fallback
+
+    async def start_stuck(self):
+        writer = VoteWriter(batch_size=2, flush_interval=10, max_queue=10, enqueue_timeout=0.1)
+        writer.start()
+        for choice in ["print", "ai", "stare"]:
+            await writer.enqueue(choice, None, 1)
+        await asyncio.sleep(0.01)
+        return writer
+
+    async def test_in_flight_batch_is_spilled_with_the_queue(self, stuck_fallback):
+        writer = await self.start_stuck()
+
+        await writer.stop(timeout=0.05)
+
+        [rows] = stuck_fallback.spill.await_args.args
+        assert [row["choice"] for row in rows] == ["print", "ai", "stare"]
+        assert writer._queue.empty()
+
+    async def test_lost_count_includes_the_in_flight_batch(self, stuck_fallback, caplog):
+        stuck_fallback.spill.side_effect = RedisError("redis is down")
+        writer = await self.start_stuck()
+
+        await writer.stop(timeout=0.05)
+
+        assert "3 votes lost" in caplog.text